@@ -0,0 +1,489 @@
+# coding: utf-8
+"""
+This module runs many videos through a staged pipeline instead of making one video at a
+time. Titles flow through the script, speech, transcription and render stages, each with
+its own pool of workers, connected by bounded queues. The API stages run on threads since
+they spend their time waiting on the network, while rendering runs in a process pool since
+it is CPU bound. The bounded queues provide backpressure, so fast stages stall rather than
+piling up work in front of a slow one. Every finished stage is checkpointed in the job's
+manifest, so a job claimed again after a crash or a failure skips the stages it already
+completed. With --render-spool, the render stage hands each video to the render workers
+consuming the spool (python render_worker.py) instead of a local process pool, so
+rendering can scale across hosts separately from the API stages. With --backgrounds, each
+video loops a background picked from a directory of footage, transcoded once up front into
+cached proxies so the choice costs the renders almost nothing.
+
+Modules Imported:
+- argparse: Standard library for parsing command line arguments.
+- json: Standard library for reading a resumed job's transcription.
+- logging: Standard library for logging error and informational messages.
+- multiprocessing: Standard library used to pick the render pool start method.
+- os: Standard library for interacting with the operating system.
+- queue: Standard library for the bounded queues between stages.
+- threading: Standard library for the stage worker threads.
+- ProcessPoolExecutor: Pool used for the CPU-bound render stage.
+- load_dotenv: Loads environment variables from the .env file.
+- openai_api: Package providing the chat, TTS and STT clients.
+- video_processing: Package providing the video renderer.
+- instrumentation: Traces each job through the stages and exports the metrics.
+
+Classes:
+    BatchJob: The state of one video as it moves through the pipeline.
+    BatchRunner: Runs a batch of titles through the staged pipeline.
+
+Usage:
+    python batch.py --topic "mental toughness and stoicism" --count 20 --render-workers 2
+    python batch.py --count 20 --render-workers 8 --render-spool /mnt/shared/render_spool
+    python batch.py --count 20 --backgrounds footage
+    python -m instrumentation.report temp/metrics/trace.jsonl --render-workers 2
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+import openai_api
+import video_processing
+import instrumentation
+
+STAGES = ("script", "speech", "transcription", "render")
+
+DEFAULT_CONCURRENCY = {
+    "script": 2,
+    "speech": 4,
+    "transcription": 4,
+    "render": max(1, (os.cpu_count() or 2) // 2),
+}
+
+class BatchJob: # pylint: disable=R0902,R0903:too-many-instance-attributes,too-few-public-methods
+    """
+    The state of one video as it moves through the pipeline.
+
+    Attributes:
+        job_id (int): The identifier of the job in the job store.
+        title (str): The title the video is made from.
+        worker (str): The name the job was claimed under, which holds its lease.
+        lease (LeaseRenewal): Keeps the lease alive while the job is in the pipeline.
+        workspace (JobWorkspace): The directory holding the job's files.
+        manifest (JobManifest): The stages the job has completed, across attempts.
+        digests (dict): The content hashes of the committed artifacts, by name.
+        script (str): The generated script.
+        speech_path (str): The path of the narration audio.
+        words (list): The word timings from the transcription.
+        duration (float): The length of the narration in seconds.
+        video_path (str): The path of the rendered video.
+        error (str): The reason the job failed, or None.
+        started (float): The perf_counter time the job entered the pipeline.
+    """
+
+    def __init__(self, job, artifact_store):
+        self.job_id = job.job_id
+        self.title = job.title
+        self.worker = job.worker
+        self.lease = None
+        self.workspace = artifact_store.workspace(job.job_id)
+        self.manifest = openai_api.JobManifest(self.workspace)
+        self.digests = {}
+        self.script = None
+        self.speech_path = None
+        self.words = None
+        self.duration = None
+        self.video_path = None
+        self.error = None
+        self.started = time.perf_counter()
+
+    def resume(self, stage):
+        """
+        Restores the results of a stage completed by an earlier attempt.
+
+        Args:
+            stage (str): The completed stage.
+        """
+        data = self.manifest.data(stage)
+        self.digests.update(self.manifest.artifacts(stage))
+        if stage == "script":
+            self.script = data["script"]
+        elif stage == "speech":
+            self.speech_path = self.workspace.path("speech.mp3")
+        elif stage == "transcription":
+            with open(self.workspace.path("transcription.json"), "r", encoding="utf-8") as file:
+                self.words = json.load(file)["words"]
+            self.duration = data["duration"]
+        elif stage == "render":
+            self.video_path = self.workspace.path("video.mp4")
+
+def render_job(temp_dir, job_id, duration, words, *, audio_file, output_file, # pylint: disable=R0913:too-many-arguments
+               metrics_dir=None, background=None):
+    """
+    Renders a job's video. Runs in a worker process of the render pool.
+
+    Args:
+        temp_dir (str): The directory for temporary storage.
+        job_id (int): The job the video belongs to, for the trace.
+        duration (float): The length of the video in seconds.
+        words (list): The word timings.
+        audio_file (str): The path of the narration audio.
+        output_file (str): The path of the video to write.
+        metrics_dir (str, optional): The directory the trace is appended to.
+        background (Background, optional): The looping background video. Defaults to
+            None, a plain white background.
+
+    Returns:
+        tuple: (video_path, metrics), where metrics is the snapshot of this process's
+        metrics registry since the last render, to merge into the parent's registry.
+    """
+    instrumentation.configure(metrics_dir)
+    with instrumentation.job_context(job_id), \
+            video_processing.VideoProcessClient(temp_dir) as process_client:
+        video_path = process_client.create_video(duration, words, audio_file,
+                                                 output_file=output_file,
+                                                 background=background)
+    return video_path, instrumentation.REGISTRY.snapshot(reset=True)
+
+class BatchRunner: # pylint: disable=R0902,R0903:too-many-instance-attributes,too-few-public-methods
+    """
+    Runs a batch of titles through the script, speech, transcription and render stages.
+
+    Attributes:
+        api_client (OpenAiClient): The client shared by the API stages.
+        concurrency (dict): The number of workers per stage.
+        queue_size (int): The capacity of each queue between stages.
+        stream_speech (bool): Whether the script stage streams the script straight into
+            sentence-level speech, leaving nothing for the speech stage to do.
+        render_spool (RenderSpool): The spool renders are handed to, or None to render
+            in a local process pool.
+        backgrounds (BackgroundLibrary): The library the background of each video is
+            picked from, or None for plain white backgrounds.
+    """
+
+    def __init__(self, api_client, concurrency=None, queue_size=4, stream_speech=False, # pylint: disable=R0913:too-many-arguments
+                 *, render_spool=None, backgrounds=None):
+        """
+        Initializes the runner.
+
+        Args:
+            api_client (OpenAiClient): The client shared by the API stages.
+            concurrency (dict, optional): The number of workers per stage, keyed by the
+                names in STAGES. Missing stages use DEFAULT_CONCURRENCY.
+            queue_size (int, optional): The capacity of each queue between stages.
+                Defaults to 4.
+            stream_speech (bool, optional): Stream scripts into sentence-level speech in
+                the script stage. Defaults to False.
+            render_spool (RenderSpool, optional): Hand renders to the render workers
+                consuming this spool; the render stage threads then bound how many
+                renders are in flight. Defaults to None, which renders in a local process pool.
+            backgrounds (BackgroundLibrary, optional): Loop a background from this library
+                under each video. Its proxies are transcoded when the run starts.
+                Defaults to None, plain white backgrounds.
+        """
+        self.api_client = api_client
+        self.temp_dir = api_client.configuration.temp_dir
+        self.concurrency = {stage: max(1, (concurrency or {}).get(stage)
+                                       or DEFAULT_CONCURRENCY[stage])
+                            for stage in STAGES}
+        self.queue_size = queue_size
+        self.stream_speech = stream_speech
+        self.render_spool = render_spool
+        self.backgrounds = backgrounds
+        self._chat_api = openai_api.CHATApi(api_client)
+        self._tts_api = openai_api.TTSApi(api_client)
+        self._stt_api = openai_api.STTApi(api_client)
+        self.job_store = self._chat_api.job_store
+        self.artifact_store = openai_api.ArtifactStore(self.temp_dir)
+        self._render_pool = None
+
+    def run(self, jobs):
+        """
+        Runs claimed jobs through the pipeline and waits for every one to finish.
+
+        Each job is marked done or failed in the job store as it leaves the pipeline.
+
+        Args:
+            jobs (iterable): The Job objects claimed from the job store. They are consumed
+                lazily, so a generator can feed a long batch without claiming it up front.
+
+        Returns:
+            list: The finished BatchJob objects, successful or not.
+        """
+        handlers = {
+            "script": self._script_stage,
+            "speech": self._speech_stage,
+            "transcription": self._transcription_stage,
+            "render": self._render_stage,
+        }
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(STAGES) + 1)]
+        finished = []
+        if self.backgrounds is not None:
+            # Transcode new footage once, before any render needs it
+            self.backgrounds.prepare()
+
+        # Render workers are spawned rather than forked, since this process is multithreaded.
+        # With a spool the render threads only wait on it, so the pool stays idle.
+        pool_size = 1 if self.render_spool is not None else self.concurrency["render"]
+        with ProcessPoolExecutor(max_workers=pool_size,
+                                 mp_context=multiprocessing.get_context("spawn")) as render_pool:
+            self._render_pool = render_pool
+            threads = self._start_workers(handlers, queues)
+
+            collector = threading.Thread(target=self._collect, args=(queues[-1], finished),
+                                         daemon=True)
+            collector.start()
+
+            for job in jobs:
+                batch_job = BatchJob(job, self.artifact_store)
+                # Renewed on a timer from here to the collector, since a render or a wait in
+                # a queue can outlast the lease
+                batch_job.lease = openai_api.LeaseRenewal(self.job_store, job.job_id,
+                                                          job.worker).start()
+                queues[0].put(batch_job)
+            for _ in range(self.concurrency[STAGES[0]]):
+                queues[0].put(None)
+
+            for thread in threads:
+                thread.join()
+            collector.join()
+        self._render_pool = None
+        return finished
+
+    def _start_workers(self, handlers, queues):
+        """Starts the worker threads of every stage and returns them."""
+        threads = []
+        for index, stage in enumerate(STAGES):
+            workers = self.concurrency[stage]
+            downstream = self.concurrency[STAGES[index + 1]] if index + 1 < len(STAGES) else 1
+            shutdown = (threading.Lock(), [workers], downstream)
+            for number in range(workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(stage, handlers[stage], queues[index], queues[index + 1], shutdown),
+                    name=f"{stage}-{number}", daemon=True)
+                thread.start()
+                threads.append(thread)
+        return threads
+
+    def _worker(self, stage, handler, inbox, outbox, shutdown): # pylint: disable=R0913:too-many-arguments
+        """Processes jobs from inbox until it receives a sentinel, then forwards shutdown."""
+        lock, remaining, downstream = shutdown
+        while True:
+            job = inbox.get()
+            if job is None:
+                break
+            if job.error is None:
+                try:
+                    if job.manifest.is_complete(stage):
+                        job.resume(stage)
+                        instrumentation.REGISTRY.inc("shorts_stages_skipped_total", stage=stage)
+                        logging.info("Job %s resumed past %s", job.job_id, stage)
+                    else:
+                        with instrumentation.job_context(job.job_id), instrumentation.span(stage):
+                            handler(job)
+                except Exception as e: # pylint: disable=W0718:broad-exception-caught
+                    job.error = f"{stage}: {e}"
+                    logging.error("Job %s failed during %s: %s", job.job_id, stage, e)
+            outbox.put(job)
+
+        # The last worker of a stage to stop tells every downstream worker to stop
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for _ in range(downstream):
+                outbox.put(None)
+
+    def _collect(self, inbox, finished):
+        """Gathers finished jobs from the last stage and records them in the job store."""
+        while True:
+            job = inbox.get()
+            if job is None:
+                return
+            finished.append(job)
+            job.lease.stop()
+            # A failure to record one job must not stop the collector, or the bounded
+            # stage queues fill up behind it and run() never returns
+            try:
+                self._record(job)
+            except Exception as e: # pylint: disable=W0718:broad-exception-caught
+                logging.error("Failed to record the result of job %s: %s", job.job_id, e)
+
+    def _record(self, job):
+        """Records a finished job in the trace, the metrics and the job store."""
+        with instrumentation.job_context(job.job_id):
+            instrumentation.event("job", status="failed" if job.error else "done",
+                                  elapsed=round(time.perf_counter() - job.started, 3),
+                                  error=job.error)
+        instrumentation.REGISTRY.inc("shorts_jobs_total",
+                                     status="failed" if job.error else "done")
+        instrumentation.export_metrics()
+        artifacts = {"script": job.script, "digests": job.digests,
+                     "video": job.video_path}
+        if job.error:
+            self.job_store.mark_failed(job.job_id, job.error, artifacts, worker=job.worker)
+            print(f"Job {job.job_id} failed: {job.error}")
+        else:
+            self.job_store.mark_done(job.job_id, artifacts, worker=job.worker)
+            print(f"Job {job.job_id} rendered {job.video_path}")
+
+    def _script_stage(self, job):
+        if self.stream_speech:
+            job.script, job.speech_path = openai_api.script_to_speech(
+                self._chat_api, self._tts_api, job.title,
+                job.workspace.output_path("speech.mp3"))
+        else:
+            job.script = self._chat_api.generate_script(job.title)
+        if not job.script:
+            raise ValueError(f"No script generated for '{job.title}'")
+        job.manifest.complete("script", script=job.script)
+
+    def _speech_stage(self, job):
+        # A resumed job has no streamed speech, since its script stage was skipped
+        if job.speech_path is None:
+            job.speech_path = self._tts_api.audio_speech_create(
+                text=job.script, output_file_path=job.workspace.output_path("speech.mp3"))
+        if job.speech_path is None:
+            raise ValueError("Speech creation failed")
+        job.digests["speech.mp3"] = job.workspace.commit("speech.mp3")
+        job.manifest.complete("speech", {"speech.mp3": job.digests["speech.mp3"]})
+
+    def _transcription_stage(self, job):
+        result = self._stt_api.audio_transcriptions_create(
+            input_file_path=job.speech_path,
+            output_file_path=job.workspace.output_path("transcription.json"),
+            script=job.script)
+        if result is None:
+            raise ValueError("Transcription failed")
+        job.digests["transcription.json"] = job.workspace.commit("transcription.json")
+        transcription_data, job.duration = result
+        job.words = transcription_data["words"]
+        job.manifest.complete("transcription",
+                              {"transcription.json": job.digests["transcription.json"]},
+                              duration=job.duration)
+
+    def _render_stage(self, job):
+        if self.render_spool is not None:
+            self._spool_render(job)
+            return
+        # The thread blocks on the result, so render concurrency is bounded by the pool
+        future = self._render_pool.submit(render_job, self.temp_dir, job.job_id, job.duration,
+                                          job.words, audio_file=job.speech_path,
+                                          output_file=job.workspace.output_path("video.mp4"),
+                                          metrics_dir=instrumentation.trace_directory(),
+                                          background=self._pick_background(job))
+        job.video_path, metrics = future.result()
+        instrumentation.REGISTRY.merge(metrics)
+        # Counted in this process too, so the render span's events carry its frame rate
+        instrumentation.record(frames=int(job.duration * video_processing.process_client.FPS))
+        job.digests["video.mp4"] = job.workspace.commit("video.mp4")
+        job.manifest.complete("render", {"video.mp4": job.digests["video.mp4"]})
+
+    def _spool_render(self, job):
+        """Hands a render to the render workers and waits for it."""
+        spec = video_processing.RenderJobSpec(
+            job.duration, job.words, os.path.abspath(job.speech_path),
+            os.path.abspath(job.workspace.output_path("video.mp4")),
+            background=self._pick_background(job), job_id=job.job_id)
+        spec_id = self.render_spool.submit(spec)
+        result = self.render_spool.wait(spec_id)
+        instrumentation.record(frames=int(job.duration * video_processing.process_client.FPS))
+        job.video_path = job.workspace.path("video.mp4")
+        job.digests["video.mp4"] = job.workspace.commit("video.mp4")
+        job.manifest.complete("render", {"video.mp4": job.digests["video.mp4"]},
+                              worker=result.get("worker"))
+
+    def _pick_background(self, job):
+        """Picks the background of a job, the same one every time the job is rendered."""
+        if self.backgrounds is None:
+            return None
+        return self.backgrounds.pick(job.duration, seed=job.job_id)
+
+def claim_jobs(job_store, count):
+    """
+    Yields up to count jobs claimed from the job store, claiming each one as it is needed.
+
+    Args:
+        job_store (JobStore): The backlog to claim from.
+        count (int): The maximum number of jobs to claim.
+
+    Yields:
+        Job: The next claimed job.
+    """
+    for _ in range(count):
+        job = job_store.claim()
+        if job is None:
+            return
+        yield job
+
+def main(argv=None):
+    """
+    Command line entry point for batch runs.
+
+    Args:
+        argv (list, optional): The command line arguments. Defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(description="Make many YouTube Shorts in one run.")
+    parser.add_argument("--topic", help="Generate new titles for this topic first.")
+    parser.add_argument("--count", type=int, default=10, help="The number of videos to make.")
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--stream-speech", action="store_true",
+                        help="Synthesize speech sentence by sentence while the script streams.")
+    parser.add_argument("--gc-max-gb", type=float, default=None,
+                        help="Trim unreferenced artifacts to this size after the run.")
+    parser.add_argument("--gc-max-age-days", type=float, default=None,
+                        help="Remove job workspaces older than this after the run.")
+    parser.add_argument("--metrics-dir", default=None,
+                        help="Where the trace and Prometheus metrics are written. "
+                             "Defaults to <temp_dir>/metrics.")
+    parser.add_argument("--render-spool", default=None,
+                        help="Hand renders to render_worker.py processes consuming this "
+                             "directory instead of rendering locally.")
+    parser.add_argument("--backgrounds", default=None,
+                        help="Loop a background from the videos in this directory under "
+                             "each video.")
+    parser.add_argument("--background-cache", default=None,
+                        help="Where the background proxies are cached. Must be shared with "
+                             "the render workers. Defaults to <temp_dir>/backgrounds.")
+    for stage in STAGES:
+        parser.add_argument(f"--{stage}-workers", type=int, default=None,
+                            help=f"The number of {stage} workers.")
+    args = parser.parse_args(argv)
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key is None:
+        parser.error("the OPENAI_API_KEY environment variable is not set")
+    configuration = openai_api.Configuration(api_key=api_key)
+    instrumentation.configure(args.metrics_dir or os.path.join(configuration.temp_dir,
+                                                               "metrics"))
+    concurrency = {stage: getattr(args, f"{stage}_workers") for stage in STAGES}
+    with openai_api.OpenAiClient(configuration) as api_client:
+        chat_api = openai_api.CHATApi(api_client)
+        if args.topic:
+            queued = chat_api.generate_titles(args.topic, count=args.count)
+            print(f"Queued {len(queued)} new titles.")
+
+        render_spool = video_processing.RenderSpool(args.render_spool) \
+            if args.render_spool else None
+        backgrounds = video_processing.BackgroundLibrary(
+            args.backgrounds,
+            args.background_cache or os.path.join(configuration.temp_dir, "backgrounds")) \
+            if args.backgrounds else None
+        runner = BatchRunner(api_client, concurrency, args.queue_size, args.stream_speech,
+                             render_spool=render_spool, backgrounds=backgrounds)
+        jobs = runner.run(claim_jobs(runner.job_store, args.count))
+        failed = sum(1 for job in jobs if job.error)
+        print(f"Finished {len(jobs)} jobs, {failed} failed.")
+
+        if args.gc_max_gb is not None or args.gc_max_age_days is not None:
+            runner.artifact_store.gc(
+                max_bytes=None if args.gc_max_gb is None else int(args.gc_max_gb * 1024 ** 3),
+                max_age=None if args.gc_max_age_days is None else args.gc_max_age_days * 86400)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv()
+    main()
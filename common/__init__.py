@@ -0,0 +1,16 @@
+# coding: utf-8
+"""
+This module serves as the package initializer for the common package, which holds the
+standard-library helpers shared by the openai_api and video_processing packages, so
+neither has to import the other for them.
+
+Modules:
+- ffmpeg: Locates the FFmpeg binary and writes its concat lists.
+- lazy_exports: The PEP 562 __getattr__ and __dir__ of lazily loaded packages.
+- storage: File handling and claim renewal shared by the on-disk caches and stores.
+
+Usage:
+    from common.storage import remove_file
+
+    remove_file("temp/speech.mp3.tmp")
+"""
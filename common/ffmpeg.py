@@ -0,0 +1,55 @@
+# coding: utf-8
+"""
+This module locates the FFmpeg binary the rest of the code runs and writes the lines of
+its concat demuxer lists. The API package decodes and stitches speech with FFmpeg and the
+video package renders with it, so these helpers live here rather than in either of them.
+
+Modules Imported:
+- functools: Standard library used to look the binary up once.
+- os: Standard library used to make listed paths absolute.
+
+Functions:
+    ffmpeg_binary: Returns the FFmpeg binary MoviePy is configured with.
+    concat_entry: Returns the concat demuxer list line of a file.
+
+Usage:
+    with open(list_path, "w", encoding="utf-8") as file:
+        file.writelines(concat_entry(path) for path in paths)
+    subprocess.run([ffmpeg_binary(), "-f", "concat", "-safe", "0", "-i", list_path,
+                    "-c", "copy", output_path], check=True)
+"""
+
+from __future__ import absolute_import
+import functools
+import os
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_binary():
+    """
+    Returns the FFmpeg binary MoviePy is configured with, honouring FFMPEG_BINARY.
+
+    MoviePy's configuration runs FFmpeg to check it when it is first imported, so it is
+    only loaded when a binary is actually needed.
+
+    Returns:
+        str: The path or name of the FFmpeg binary.
+    """
+    from moviepy.config import get_setting # pylint: disable=C0415:import-outside-toplevel
+    return get_setting("FFMPEG_BINARY")
+
+def concat_entry(path):
+    """
+    Returns the line naming a file in an FFmpeg concat demuxer list.
+
+    The demuxer resolves relative paths against the list file rather than the working
+    directory, and ends a quoted path at the first quote, so the path is made absolute
+    and its quotes are escaped.
+
+    Args:
+        path (str): The file to list.
+
+    Returns:
+        str: The "file '...'" line, with its newline.
+    """
+    escaped = os.path.abspath(path).replace("'", "'\\''")
+    return f"file '{escaped}'\n"
@@ -0,0 +1,58 @@
+# coding: utf-8
+"""
+This module builds the module-level __getattr__ and __dir__ (PEP 562) of the packages
+whose public names are imported on first use, so importing openai_api or video_processing
+loads none of the modules behind them.
+
+Modules Imported:
+- importlib: Standard library used to import a name's module on first use.
+- sys: Standard library used to find the namespace of the package.
+
+Functions:
+    lazy_exports: Builds the __getattr__ and __dir__ of a lazily loaded package.
+
+Usage:
+    _EXPORTS = {"VideoProcessClient": "video_processing.process_client"}
+    __getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
+"""
+
+from __future__ import absolute_import
+import importlib
+import sys
+
+def lazy_exports(package, exports):
+    """
+    Builds the __getattr__ and __dir__ of a package whose public names are imported
+    from their modules the first time they are used.
+
+    Args:
+        package (str): The name of the package, __name__ in its __init__.
+        exports (dict): The module each public name is loaded from.
+
+    Returns:
+        tuple: (__getattr__, __dir__), to be assigned at the top level of the package.
+    """
+    namespace = vars(sys.modules[package])
+
+    def getattr_(name):
+        module = exports.get(name)
+        if module is None:
+            return _import_submodule(package, name)
+        value = getattr(importlib.import_module(module), name)
+        # Cached, so later lookups do not come back here
+        namespace[name] = value
+        return value
+
+    def dir_():
+        return sorted(set(namespace) | set(exports))
+
+    return getattr_, dir_
+
+def _import_submodule(package, name):
+    """Imports package.name on attribute access, as an eager __init__ would have."""
+    try:
+        return importlib.import_module(f"{package}.{name}")
+    except ModuleNotFoundError as e:
+        if e.name != f"{package}.{name}":
+            raise
+        raise AttributeError(f"module {package!r} has no attribute {name!r}") from None
@@ -0,0 +1,137 @@
+# coding: utf-8
+"""
+This module holds the helpers shared by the on-disk caches and stores: the content
+digest of a file, removing a file that may already be gone, the least recently used
+eviction of a cache directory, and the background thread that keeps a claim alive while
+it is worked on.
+
+Modules Imported:
+- hashlib: Standard library for hashing file contents.
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- threading: Standard library used for the keep-alive thread.
+
+Classes:
+    KeepAlive: Renews a claim from a background thread until it is stopped.
+
+Functions:
+    file_digest: Computes the SHA-256 digest of a file.
+    remove_file: Removes a file, ignoring errors.
+    evict_least_recently_used: Trims cache files, oldest first, to a size.
+
+Usage:
+    digest = file_digest("temp/speech.mp3")
+    total = evict_least_recently_used(os.scandir(cache_dir), max_bytes * 0.9)
+    with KeepAlive(lambda: store.renew(job_id), 30.0, f"job {job_id}"):
+        ...
+"""
+
+from __future__ import absolute_import
+import hashlib
+import logging
+import os
+import threading
+
+def file_digest(path):
+    """
+    Computes the SHA-256 digest of a file.
+
+    Args:
+        path (str): The file to hash.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def remove_file(path):
+    """
+    Removes a file, ignoring a missing file or any other error.
+
+    Args:
+        path (str): The file to remove.
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def evict_least_recently_used(entries, target):
+    """
+    Removes cache files, least recently used first, until the rest fit a size. Readers
+    refresh the modification time of the files they use, so it orders them by use.
+
+    Args:
+        entries (iterable): The os.DirEntry of every file in the cache.
+        target (float): The total size in bytes to trim the cache to.
+
+    Returns:
+        int: The total size of the files left.
+    """
+    entries = sorted(entries, key=lambda entry: entry.stat().st_mtime)
+    total = sum(entry.stat().st_size for entry in entries)
+    for entry in entries:
+        if total <= target:
+            break
+        total -= entry.stat().st_size
+        remove_file(entry.path)
+    return total
+
+class KeepAlive:
+    """
+    Renews a claim from a background thread until it is stopped, so work that takes
+    longer than the claim's lease is not handed to another worker.
+
+    Attributes:
+        lost (bool): Whether a renewal failed, i.e. the claim was lost while held.
+    """
+
+    def __init__(self, renew, interval, name):
+        """
+        Initializes the keep-alive. It starts when it is entered or started.
+
+        Args:
+            renew (callable): Renews the claim, returning False once it is lost.
+            interval (float): Seconds between renewals.
+            name (str): What is kept alive, for the log and the thread name.
+        """
+        self.lost = False
+        self._renew = renew
+        self._interval = interval
+        self._name = name
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f"keepalive-{name}".replace(" ", "-"))
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            if not self._renew():
+                logging.warning("Lost the claim of %s", self._name)
+                self.lost = True
+                return
+
+    def start(self):
+        """
+        Starts renewing the claim.
+
+        Returns:
+            KeepAlive: The keep-alive itself.
+        """
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops renewing the claim and waits for the thread to finish."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -1,49 +1,273 @@
 # coding: utf-8
 """
-This module initializes a Flask web application for managing and rendering templates 
-for an interactive GUI. It includes routes for the main index page and settings page, 
-and sets headers to disable caching for all responses. The application can be launched 
+This module initializes a Flask web application for managing and rendering templates
+for an interactive GUI. It includes routes for the main index page and settings page,
+and sets headers to disable caching for all responses. The application can be launched
 locally, opening the default web browser to the specified port.
 
+The index page is a job dashboard. Batches submitted from it run through batch.py's
+pipeline on a background executor inside the Flask process, and their progress is pushed
+to the browser over Server-Sent Events. Progress comes from the instrumentation events
+the pipeline already emits: a listener copies each one into the bounded queue of every
+connected browser without blocking, so a slow or vanished browser drops events rather
+than stalling a render, and the cost per event is a dict copy and a queue put.
+
+Rendered videos, previews and their thumbnails are served from the job workspaces with
+Range support for seeking, and with ETag and Last-Modified validators so a browser
+revalidates a file it already holds instead of downloading it again. A committed artifact
+uses its content hash as its ETag, and is also served from its content-addressed URL
+with immutable caching. Static assets are linked through asset_url, which appends their
+content hash, so they too can be cached for good. Set GUI_USE_X_SENDFILE=1 behind a web
+server that supports X-Sendfile to hand file bodies to it for zero-copy sending.
+
 Modules Imported:
+- json: Standard library for encoding the events.
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- queue: Standard library for the per-browser event queues.
+- threading: Standard library locks guarding the broker and the batches.
+- time: Standard library for batch timestamps.
+- uuid: Standard library used to name batches.
+- re: Standard library used to validate object names.
+- subprocess: Standard library used to run FFmpeg for thumbnails.
+- hashlib: Standard library used to version static assets.
+- functools: Standard library used to memoize asset hashes.
 - webbrowser: Standard library for opening URLs in a web browser.
-- Path: Pathlib module for filesystem path operations.
-- tomlkit: TOML parser and writer for handling configuration files.
-- Flask, render_template, request: Flask web framework for creating web applications.
+- deque: Bounded history replayed to browsers that connect late.
+- ThreadPoolExecutor: The background executor the batches run on.
+- Flask, Response, abort, jsonify, render_template, request, send_file,
+    stream_with_context, url_for: Flask web framework for creating web applications.
+- load_dotenv: Loads environment variables from the .env file.
+- openai_api: Package providing the API clients.
+- instrumentation: Emits the pipeline events streamed to the browser.
+- batch: The staged pipeline the batches run through.
+- ffmpeg_binary: The FFmpeg binary MoviePy is configured with.
+
+Classes:
+    ProgressBroker: Fans the pipeline events out to the connected browsers.
+
+Functions:
+    asset_url: Returns the versioned URL of a static asset. Available in templates.
 
 Routes:
-- /: Renders the main index page.
+- /: Renders the job dashboard.
 - /settings: Renders the settings page.
+- /jobs: Submits a batch (POST) or lists the batches (GET).
+- /events: Streams the progress events.
+- /media/<job_id>/<kind>: Serves a job's video, preview or thumbnail.
+- /media/objects/<name>: Serves a committed artifact by its content hash.
 
 Usage:
     Run this module directly to start the Flask web application on the specified port.
 """
 
+import functools
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+import uuid
 import webbrowser
-from flask import Flask, render_template
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import (Flask, Response, abort, jsonify, render_template, request, send_file,
+                   stream_with_context, url_for)
+from dotenv import load_dotenv
+import openai_api
+import instrumentation
+import batch
+from common.ffmpeg import ffmpeg_binary
+
+app = Flask(__name__, template_folder="gui", static_folder="gui/static")
+app.config["USE_X_SENDFILE"] = os.getenv("GUI_USE_X_SENDFILE") == "1"
+
+TEMP_DIR = "temp"
+# The media a job can serve, by the kind in its URL
+MEDIA_FILES = {"video": "video.mp4", "preview": "preview.mp4", "thumbnail": "thumbnail.jpg"}
+OBJECT_NAME = re.compile(r"^[0-9a-f]{64}\.(mp4|mp3|jpg|json)$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Cached, but revalidated against the ETag on every use
+REVALIDATE = "no-cache"
+
+# The event fields forwarded to the browser
+EVENT_FIELDS = ("type", "time", "job_id", "stage", "parent", "status", "duration", "error",
+                "frames", "batch_id", "topic", "count", "finished", "failed", "elapsed")
+# Seconds between keep-alive comments on an idle event stream
+KEEPALIVE_SECONDS = 15
+MAX_BATCH_COUNT = 100
+
+class ProgressBroker:
+    """
+    Fans the pipeline events out to the connected browsers.
+
+    Attributes:
+        dropped (int): The number of events dropped because a browser fell behind.
+    """
+
+    def __init__(self, history=500, client_queue_size=1000):
+        """
+        Initializes the broker.
+
+        Args:
+            history (int, optional): How many recent events are replayed to a browser
+                when it connects. Defaults to 500.
+            client_queue_size (int, optional): How many events a browser may fall behind
+                before its events are dropped. Defaults to 1000.
+        """
+        self.dropped = 0
+        self._history = deque(maxlen=history)
+        self._client_queue_size = client_queue_size
+        self._clients = set()
+        self._lock = threading.Lock()
+
+    def publish(self, item):
+        """
+        Forwards an event to every connected browser. Never blocks, so it can be an
+        instrumentation listener called from the pipeline's threads.
+
+        Args:
+            item (dict): The event.
+        """
+        if item.get("type") not in ("span", "span_start", "job", "batch"):
+            return
+        data = {name: item[name] for name in EVENT_FIELDS if item.get(name) is not None}
+        if data.get("frames") and data.get("duration"):
+            data["fps"] = round(data["frames"] / data["duration"], 1)
+        with self._lock:
+            self._history.append(data)
+            clients = tuple(self._clients)
+        dropped = 0
+        for client in clients:
+            try:
+                client.put_nowait(data)
+            except queue.Full:
+                dropped += 1
+        if dropped:
+            # Publishers run on several pipeline threads at once
+            with self._lock:
+                self.dropped += dropped
+
+    def connect(self):
+        """
+        Registers a browser.
+
+        Returns:
+            tuple: (client_queue, history), the queue its events arrive on and the recent
+            events to replay first.
+        """
+        client = queue.Queue(maxsize=self._client_queue_size)
+        with self._lock:
+            self._clients.add(client)
+            return client, list(self._history)
 
-app = Flask(__name__, template_folder="gui")
+    def disconnect(self, client):
+        """
+        Unregisters a browser.
+
+        Args:
+            client (queue.Queue): The queue returned by connect.
+        """
+        with self._lock:
+            self._clients.discard(client)
+
+BROKER = ProgressBroker()
+instrumentation.subscribe(BROKER.publish)
+# One batch at a time: each batch already sizes its own render pool to the machine
+EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch")
+BATCHES = {}
+# Guards BATCHES, which request threads and the executor thread both change
+_batches_lock = threading.Lock()
+
+def _batch_event(batch_id, status, **fields):
+    """Records the status of a batch and announces it."""
+    with _batches_lock:
+        BATCHES[batch_id].update(status=status, **fields)
+    instrumentation.event("batch", batch_id=batch_id, status=status, **fields)
+
+def run_batch(batch_id, api_key, topic, count):
+    """
+    Generates titles for a topic and runs them through the pipeline. Runs on the
+    background executor.
+
+    Args:
+        batch_id (str): The identifier of the batch.
+        api_key (str): The OpenAI API key.
+        topic (str): The topic to generate titles for, or None to work through the backlog.
+        count (int): The number of videos to make.
+    """
+    started = time.perf_counter()
+    _batch_event(batch_id, "running")
+    try:
+        configuration = openai_api.Configuration(api_key=api_key, temp_dir=TEMP_DIR)
+        if instrumentation.trace_directory() is None:
+            instrumentation.configure(os.path.join(configuration.temp_dir, "metrics"))
+        with openai_api.OpenAiClient(configuration) as api_client:
+            if topic:
+                openai_api.CHATApi(api_client).generate_titles(topic, count=count)
+            runner = batch.BatchRunner(api_client)
+            jobs = runner.run(batch.claim_jobs(runner.job_store, count))
+    except Exception as e: # pylint: disable=W0718:broad-exception-caught
+        logging.error("Batch %s failed: %s", batch_id, e)
+        _batch_event(batch_id, "failed", error=str(e),
+                     elapsed=round(time.perf_counter() - started, 3))
+        return
+    _batch_event(batch_id, "done", finished=len(jobs),
+                 failed=sum(1 for job in jobs if job.error),
+                 elapsed=round(time.perf_counter() - started, 3))
+
+@functools.lru_cache(maxsize=256)
+def _asset_digest(path, mtime):
+    """Returns a short content hash of a static asset, memoized per modification time."""
+    del mtime # Part of the cache key only
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()[:12]
+
+@app.template_global()
+def asset_url(filename):
+    """
+    Returns the URL of a static asset with its content hash appended, so the asset can be
+    cached for good and a changed asset gets a new URL.
+
+    Args:
+        filename (str): The path of the asset in gui/static.
+
+    Returns:
+        str: The versioned URL.
+    """
+    path = os.path.join(app.static_folder, filename)
+    return url_for("static", filename=filename,
+                   v=_asset_digest(path, os.stat(path).st_mtime_ns))
 
 @app.after_request
 def after_request(response):
     """
-    Modifies response headers to prevent caching.
+    Sets the caching headers. Versioned static assets are immutable, media and other
+    static files are revalidated, and every other response is never cached.
 
     Args:
         response (Response): The Flask response object.
 
     Returns:
-        Response: The modified response object with no-cache headers.
+        Response: The response object with its caching headers.
     """
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Expires"] = 0
-    response.headers["Pragma"] = "no-cache"
+    if request.endpoint == "static":
+        response.headers["Cache-Control"] = IMMUTABLE if "v" in request.args else REVALIDATE
+    elif "Cache-Control" not in response.headers:
+        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+        response.headers["Expires"] = 0
+        response.headers["Pragma"] = "no-cache"
     return response
 
 @app.route("/")
 def index():
     """
-    Renders the main index page.
+    Renders the job dashboard.
 
     Returns:
         str: The rendered HTML of the index page.
@@ -60,8 +284,183 @@ def settings():
     """
     return render_template("settings.html")
 
+@app.route("/jobs", methods=["POST"])
+def submit_jobs():
+    """
+    Queues a batch on the background executor. Takes a JSON body or form fields with a
+    topic and a count.
+
+    Returns:
+        tuple: The JSON batch and 202, or a JSON error and 400 or 503.
+    """
+    data = request.get_json(silent=True) or request.form
+    topic = (data.get("topic") or "").strip() or None
+    try:
+        count = int(data.get("count", 10))
+    except (TypeError, ValueError):
+        return jsonify(error="count must be a number"), 400
+    if not 1 <= count <= MAX_BATCH_COUNT:
+        return jsonify(error=f"count must be between 1 and {MAX_BATCH_COUNT}"), 400
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key is None:
+        return jsonify(error="OPENAI_API_KEY is not set"), 503
+
+    batch_id = uuid.uuid4().hex
+    with _batches_lock:
+        BATCHES[batch_id] = {"batch_id": batch_id, "topic": topic, "count": count,
+                             "submitted_at": time.time()}
+    _batch_event(batch_id, "queued", topic=topic, count=count)
+    with _batches_lock:
+        submitted = dict(BATCHES[batch_id])
+    EXECUTOR.submit(run_batch, batch_id, api_key, topic, count)
+    return jsonify(submitted), 202
+
+@app.route("/jobs", methods=["GET"])
+def list_jobs():
+    """
+    Lists the batches submitted since the GUI started.
+
+    Returns:
+        Response: The JSON list of batches, newest first.
+    """
+    with _batches_lock:
+        batches = [dict(item) for item in BATCHES.values()]
+    return jsonify(sorted(batches, key=lambda item: item["submitted_at"], reverse=True))
+
+def _committed_digest(workspace, name):
+    """Returns the digest a workspace file was committed under, if it is still that file."""
+    manifest = openai_api.JobManifest(workspace)
+    for stage in manifest.stages:
+        digest = manifest.artifacts(stage).get(name)
+        if digest is None:
+            continue
+        object_path = workspace.store.object_path(digest, os.path.splitext(name)[1])
+        if os.path.exists(object_path) and os.path.samefile(workspace.path(name), object_path):
+            return digest
+    return None
+
+_thumbnail_lock = threading.Lock()
+
+def _make_thumbnail(workspace):
+    """Extracts a thumbnail from the job's video or preview, if it is missing or stale."""
+    thumbnail = workspace.path(MEDIA_FILES["thumbnail"])
+    sources = [workspace.path(MEDIA_FILES[kind]) for kind in ("video", "preview")]
+    source = next((path for path in sources if os.path.exists(path)), None)
+    if source is None:
+        return False
+    # One FFmpeg at a time, so a page of thumbnails does not compete with the renders
+    with _thumbnail_lock:
+        if os.path.exists(thumbnail) and \
+                os.path.getmtime(thumbnail) >= os.path.getmtime(source):
+            return True
+        temporary_path = f"{thumbnail}.{os.getpid()}.tmp.jpg"
+        try:
+            # Seeking past the end of a clip shorter than a second writes no frame, so
+            # such clips fall back to their first frame
+            for offset in ("1", "0"):
+                subprocess.run([ffmpeg_binary(), "-y", "-nostdin", "-loglevel", "error",
+                                "-ss", offset, "-i", source, "-frames:v", "1",
+                                "-vf", "scale=270:-2", "-q:v", "4", temporary_path],
+                               check=True, capture_output=True, timeout=60)
+                if os.path.exists(temporary_path):
+                    os.replace(temporary_path, thumbnail)
+                    return True
+            logging.error("Could not make a thumbnail of %s: no frame was decoded", source)
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.error("Could not make a thumbnail of %s: %s", source, e)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+    return False
+
+@app.route("/media/<int:job_id>/<kind>")
+def media(job_id, kind):
+    """
+    Serves a job's rendered video, preview or thumbnail. Supports Range requests and
+    revalidation with If-None-Match and If-Modified-Since.
+
+    Args:
+        job_id (int): The job.
+        kind (str): "video", "preview" or "thumbnail".
+
+    Returns:
+        Response: The file, a 206 range of it, a 304, or a 404.
+    """
+    if kind not in MEDIA_FILES:
+        abort(404)
+    store = openai_api.ArtifactStore(TEMP_DIR)
+    # Checked first, so requests for unknown jobs do not create workspaces
+    if not os.path.isdir(os.path.join(store.jobs_dir, str(job_id))):
+        abort(404)
+    workspace = store.workspace(job_id)
+    if kind == "thumbnail" and not _make_thumbnail(workspace):
+        abort(404)
+    path = workspace.path(MEDIA_FILES[kind])
+    if not os.path.exists(path):
+        abort(404)
+    digest = _committed_digest(workspace, MEDIA_FILES[kind])
+    response = send_file(os.path.abspath(path), conditional=True,
+                         etag=digest if digest else True)
+    response.headers["Cache-Control"] = REVALIDATE
+    return response
+
+@app.route("/media/objects/<name>")
+def media_object(name):
+    """
+    Serves a committed artifact by its content hash. The content behind the URL can
+    never change, so it is cached for good.
+
+    Args:
+        name (str): The digest and extension, e.g. "<sha256>.mp4".
+
+    Returns:
+        Response: The file, a 206 range of it, a 304, or a 404.
+    """
+    if not OBJECT_NAME.match(name):
+        abort(404)
+    digest, extension = os.path.splitext(name)
+    path = openai_api.ArtifactStore(TEMP_DIR).object_path(digest, extension)
+    if not os.path.exists(path):
+        abort(404)
+    response = send_file(os.path.abspath(path), conditional=True, etag=digest)
+    response.headers["Cache-Control"] = IMMUTABLE
+    return response
+
+@app.route("/events")
+def events():
+    """
+    Streams the progress events as Server-Sent Events, starting with a replay of the
+    recent ones.
+
+    Returns:
+        Response: The text/event-stream response.
+    """
+    client, history = BROKER.connect()
+
+    def stream():
+        try:
+            for item in history:
+                yield f"data: {json.dumps(item)}\n\n"
+            while True:
+                try:
+                    item = client.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    # Lets proxies keep the connection open and notices closed browsers
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(item)}\n\n"
+        finally:
+            BROKER.disconnect(client)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"X-Accel-Buffering": "no"})
+
 PORT = 4000
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv()
     webbrowser.open(f"http://localhost:{PORT}", new=2)
-    app.run(port=PORT)
+    # Threaded, so event streams and renders in flight do not hold up page requests
+    app.run(port=PORT, threaded=True)
@@ -0,0 +1,91 @@
+const STAGES = ["script", "speech", "transcription", "render"];
+const BADGES = {running: "bg-primary", ok: "bg-success", error: "bg-danger"};
+
+function jobRow(jobId) {
+    let row = document.getElementById("job-" + jobId);
+    if (!row) {
+        row = document.createElement("tr");
+        row.id = "job-" + jobId;
+        row.innerHTML = "<td>" + jobId + "</td>" +
+            STAGES.map(stage => '<td data-stage="' + stage + '"></td>').join("") +
+            '<td data-stage="job"></td><td data-stage="video"></td>';
+        document.getElementById("jobs").prepend(row);
+    }
+    return row;
+}
+
+function setCell(row, stage, status, text) {
+    const cell = row.querySelector('[data-stage="' + stage + '"]');
+    cell.innerHTML = '<span class="badge ' + (BADGES[status] || "bg-secondary") + '"></span>';
+    cell.firstChild.textContent = text;
+}
+
+function batchRow(item) {
+    let row = document.getElementById("batch-" + item.batch_id);
+    if (!row) {
+        row = document.createElement("tr");
+        row.id = "batch-" + item.batch_id;
+        row.innerHTML = "<td></td><td></td><td></td><td></td>";
+        row.cells[0].textContent = item.batch_id.slice(0, 8);
+        document.getElementById("batches").prepend(row);
+    }
+    if (item.topic !== undefined) row.cells[1].textContent = item.topic;
+    if (item.count !== undefined) row.cells[2].textContent = item.count;
+    row.cells[3].textContent = item.status +
+        (item.finished !== undefined ? " (" + item.finished + " made, " + (item.failed || 0) + " failed)" : "") +
+        (item.error ? ": " + item.error : "");
+}
+
+// Only the pipeline's own stages are shown; nested API spans are left out
+function handle(item) {
+    if (item.type === "batch") {
+        batchRow(item);
+    } else if (item.job_id === undefined || item.job_id === null) {
+        return;
+    } else if (item.type === "span_start" && STAGES.includes(item.stage) && !item.parent) {
+        setCell(jobRow(item.job_id), item.stage, "running", "running");
+    } else if (item.type === "span" && STAGES.includes(item.stage) && !item.parent) {
+        const text = item.duration.toFixed(1) + "s" + (item.fps ? " · " + item.fps + " fps" : "");
+        setCell(jobRow(item.job_id), item.stage, item.status, text);
+    } else if (item.type === "job") {
+        const row = jobRow(item.job_id);
+        setCell(row, "job", item.status === "done" ? "ok" : "error",
+            item.status + (item.error ? ": " + item.error : ""));
+        if (item.status === "done") {
+            // The media endpoints answer repeat views with 304s, so these are cheap to reload
+            const media = "/media/" + item.job_id;
+            row.querySelector('[data-stage="video"]').innerHTML =
+                '<a href="' + media + '/video" target="_blank">' +
+                '<img src="' + media + '/thumbnail" height="64" loading="lazy" alt="video"></a>';
+        }
+    }
+}
+
+function connect() {
+    const source = new EventSource("/events");
+    const connection = document.getElementById("connection");
+    source.onopen = () => {
+        // The stream replays recent events, so start from a clean slate
+        document.getElementById("jobs").innerHTML = "";
+        connection.textContent = "live";
+    };
+    source.onmessage = (message) => handle(JSON.parse(message.data));
+    source.onerror = () => { connection.textContent = "reconnecting..."; };
+}
+
+document.getElementById("jobForm").addEventListener("submit", (submitEvent) => {
+    submitEvent.preventDefault();
+    const form = submitEvent.target;
+    const error = document.getElementById("jobFormError");
+    error.textContent = "";
+    fetch("/jobs", {
+        method: "POST",
+        headers: {"Content-Type": "application/json"},
+        body: JSON.stringify({topic: form.topic.value, count: form.count.value}),
+    }).then(response => response.json().then(body => {
+        if (!response.ok) error.textContent = body.error;
+    }));
+});
+
+fetch("/jobs").then(response => response.json()).then(items => items.reverse().forEach(batchRow));
+connect();
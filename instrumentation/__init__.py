@@ -0,0 +1,36 @@
+# coding: utf-8
+"""
+This module serves as the package initializer for the instrumentation package, which
+records where the time, bytes, tokens and memory of each job go across the chat, TTS,
+STT and render stages. Spans feed an in-process metrics registry, exported as a
+Prometheus text file, and a per-job JSONL trace, summarized by instrumentation.report.
+
+Metrics:
+- MetricsRegistry: Counters, high-water gauges and latency histograms.
+- REGISTRY: The registry of the process.
+
+Tracing:
+- configure: Sets the directory the trace and the metrics are written to.
+- export_metrics: Writes the registry as a Prometheus text file.
+- job_context: Attributes the spans opened inside it to a job.
+- span, instrumented: Time a block or every call of a function as a stage.
+- record: Adds counts (bytes, tokens, retries, frames, ...) to the open span.
+- event: Appends a free-form event to the trace.
+- subscribe, unsubscribe: Receive every event of the process as it happens.
+
+Usage:
+    import instrumentation
+
+    instrumentation.configure("temp/metrics")
+    with instrumentation.job_context(job_id), instrumentation.span("script"):
+        script = chat_api.generate_script(title)
+    instrumentation.export_metrics()
+"""
+
+from __future__ import absolute_import
+
+from instrumentation.metrics import MetricsRegistry, Histogram, REGISTRY
+from instrumentation.tracing import (Span, configure, trace_directory, export_metrics,
+                                     job_context, current_job_id, span, instrumented,
+                                     record, event, subscribe, unsubscribe, peak_rss,
+                                     reset_peak_rss)
@@ -0,0 +1,256 @@
+# coding: utf-8
+"""
+This module defines the in-process metrics registry: counters, high-water gauges and
+latency histograms, each identified by a metric name and a set of labels. The registry is
+thread-safe, can be drained into a plain dict in a worker process and merged into the
+registry of its parent, and renders itself in the Prometheus text exposition format so a
+node exporter's textfile collector (or a person with a text editor) can read it.
+
+Modules Imported:
+- bisect: Standard library used to find the bucket of an observation.
+- math: Standard library providing infinity for the last bucket.
+- os: Standard library for writing the export atomically.
+- threading: Standard library lock guarding the registry.
+
+Classes:
+    Histogram: Cumulative bucket counts, sum and count of observations.
+    MetricsRegistry: The counters, gauges and histograms of a process.
+
+Usage:
+    REGISTRY.inc("shorts_stage_bytes_in_total", 2048, stage="tts")
+    REGISTRY.observe("shorts_stage_seconds", 1.7, stage="tts", status="ok")
+    REGISTRY.write_prometheus("temp/metrics/metrics.prom")
+"""
+
+from __future__ import absolute_import
+import bisect
+import math
+import os
+import threading
+
+# Upper bounds in seconds, from a cached lookup to a long render
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                   60.0, 120.0, 300.0, 600.0, math.inf)
+
+METRIC_HELP = {
+    "shorts_stage_seconds": "Wall time of a pipeline stage.",
+    "shorts_stage_fps": "Frames encoded per second by a render.",
+    "shorts_stage_peak_rss_bytes": "Highest peak resident set size seen at the end of a stage.",
+    "shorts_openai_request_seconds": "Latency of a single OpenAI request attempt.",
+    "shorts_openai_ratelimit_wait_seconds": "Time spent waiting for rate limit budget.",
+}
+
+class Histogram:
+    """
+    Cumulative bucket counts, sum and count of observations.
+
+    Attributes:
+        buckets (tuple): The bucket upper bounds, ending with infinity.
+        counts (list): The number of observations in each bucket, not cumulative.
+        total (float): The sum of the observations.
+        count (int): The number of observations.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Records an observation.
+
+        Args:
+            value (float): The observed value.
+        """
+        self.counts[min(bisect.bisect_left(self.buckets, value), len(self.buckets) - 1)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, state):
+        """
+        Adds the observations of another histogram with the same buckets.
+
+        Args:
+            state (dict): The state returned by to_dict.
+        """
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, state["counts"])]
+        self.total += state["total"]
+        self.count += state["count"]
+
+    def to_dict(self):
+        """
+        Returns the state of the histogram as plain data.
+
+        Returns:
+            dict: The buckets, counts, total and count.
+        """
+        return {"buckets": list(self.buckets), "counts": list(self.counts),
+                "total": self.total, "count": self.count}
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+               for _, value in items)
+    return "{" + ",".join(f'{name}="{value}"'
+                          for (name, _), value in zip(items, escaped)) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """
+    The counters, high-water gauges and histograms of a process.
+
+    Each series is keyed by its metric name and its labels, passed as keyword arguments.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increments a counter.
+
+        Args:
+            name (str): The metric name, ending in _total by convention.
+            value (float, optional): The increment. Defaults to 1.
+            **labels: The labels of the series.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_max(self, name, value, **labels):
+        """
+        Raises a gauge to a value if the value is higher than the gauge.
+
+        Args:
+            name (str): The metric name.
+            value (float): The value.
+            **labels: The labels of the series.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = max(self._gauges.get(key, value), value)
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        """
+        Records an observation in a histogram.
+
+        Args:
+            name (str): The metric name.
+            value (float): The observed value.
+            buckets (tuple, optional): The bucket upper bounds, used when the series is
+                created. Defaults to DEFAULT_BUCKETS.
+            **labels: The labels of the series.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def snapshot(self, reset=False):
+        """
+        Returns every series as plain data, e.g. to send it to a parent process.
+
+        Args:
+            reset (bool, optional): Clear the registry afterwards. Defaults to False.
+
+        Returns:
+            dict: The counters, gauges and histograms as lists of (key, value) pairs.
+        """
+        with self._lock:
+            state = {"counters": list(self._counters.items()),
+                     "gauges": list(self._gauges.items()),
+                     "histograms": [(key, histogram.to_dict())
+                                    for key, histogram in self._histograms.items()]}
+            if reset:
+                self._counters, self._gauges, self._histograms = {}, {}, {}
+        return state
+
+    def merge(self, state):
+        """
+        Adds the series of a snapshot, e.g. one taken in a worker process.
+
+        Args:
+            state (dict): The snapshot.
+        """
+        with self._lock:
+            for key, value in state["counters"]:
+                key = (key[0], tuple(map(tuple, key[1])))
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, value in state["gauges"]:
+                key = (key[0], tuple(map(tuple, key[1])))
+                self._gauges[key] = max(self._gauges.get(key, value), value)
+            for key, histogram_state in state["histograms"]:
+                key = (key[0], tuple(map(tuple, key[1])))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(histogram_state["buckets"])
+                histogram.merge(histogram_state)
+
+    def to_prometheus(self):
+        """
+        Renders the registry in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition, one family per metric name.
+        """
+        snapshot = self.snapshot()
+        families = {}
+        for kind, series in (("counter", snapshot["counters"]), ("gauge", snapshot["gauges"]),
+                             ("histogram", snapshot["histograms"])):
+            for (name, labels), value in series:
+                families.setdefault(name, (kind, []))[1].append((labels, value))
+
+        lines = []
+        for name in sorted(families):
+            kind, series = families[name]
+            if name in METRIC_HELP:
+                lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series, key=lambda item: item[0]):
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(value["buckets"], value["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket"
+                                 f"{_format_labels(labels, ('le', _format_value(bound)))}"
+                                 f" {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} "
+                             f"{_format_value(float(value['total']))}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Writes the exposition to a file, replacing it atomically so a collector never
+        reads a half-written file.
+
+        Args:
+            path (str): The path of the .prom file.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        os.replace(temporary_path, path)
+
+REGISTRY = MetricsRegistry()
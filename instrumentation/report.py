@@ -0,0 +1,146 @@
+# coding: utf-8
+"""
+This module summarizes a JSONL trace written by the tracing module: the latency
+percentiles, totals and share of time of each stage, and a worker count per batch stage
+that would keep the stages in balance. The stage with the largest share of the time is
+the bottleneck; by Little's law, a stage needs workers in proportion to the mean time a
+job spends in it for the pipeline to flow without queueing in front of it.
+
+Modules Imported:
+- argparse: Standard library for parsing command line arguments.
+- json: Standard library for reading the trace and printing the summary.
+- math: Standard library used to round worker counts up.
+
+Functions:
+    load_trace: Reads the span lines of a trace.
+    summarize: Aggregates spans by stage.
+    suggest_concurrency: Sizes the batch stage pools in proportion to their latency.
+    main: Command line entry point.
+
+Usage:
+    python -m instrumentation.report temp/metrics/trace.jsonl --render-workers 2
+"""
+
+from __future__ import absolute_import
+import argparse
+import json
+import math
+
+# The stages of batch.py, whose worker pools suggest_concurrency sizes
+BATCH_STAGES = ("script", "speech", "transcription", "render")
+
+def load_trace(path):
+    """
+    Reads the span lines of a trace, skipping lines that are not valid JSON, such as a
+    line cut short by a crash.
+
+    Args:
+        path (str): The path of the JSONL trace.
+
+    Returns:
+        list: The span events.
+    """
+    spans = []
+    with open(path, "r", encoding="utf-8") as trace:
+        for line in trace:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if item.get("type") == "span":
+                spans.append(item)
+    return spans
+
+def _percentile(ordered, fraction):
+    """Returns the nearest-rank percentile of sorted values."""
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+def summarize(spans):
+    """
+    Aggregates spans by stage.
+
+    Args:
+        spans (list): The span events.
+
+    Returns:
+        dict: For each stage, the number of spans and errors, the p50, p95, max, mean and
+            total wall time, the share of the time of all top-level spans, the highest
+            peak RSS, and the sums of the counts (bytes, tokens, retries, frames, ...).
+    """
+    fixed = {"type", "time", "pid", "job_id", "stage", "status", "duration", "peak_rss",
+             "parent", "error"}
+    stages = {}
+    for item in spans:
+        stages.setdefault(item["stage"], []).append(item)
+    top_level_time = sum(item["duration"] for item in spans if "parent" not in item) or 1.0
+
+    summary = {}
+    for stage, items in sorted(stages.items()):
+        durations = sorted(item["duration"] for item in items)
+        total = sum(durations)
+        entry = {
+            "spans": len(items),
+            "errors": sum(1 for item in items if item["status"] != "ok"),
+            "jobs": len({item["job_id"] for item in items if item.get("job_id") is not None}),
+            "p50": round(_percentile(durations, 0.5), 3),
+            "p95": round(_percentile(durations, 0.95), 3),
+            "max": round(durations[-1], 3),
+            "mean": round(total / len(durations), 3),
+            "total": round(total, 3),
+            "share": round(total / top_level_time, 3) if all("parent" not in item
+                                                              for item in items) else None,
+            "peak_rss": max((item["peak_rss"] for item in items if item.get("peak_rss")),
+                            default=None),
+        }
+        counts = {}
+        for item in items:
+            for name, value in item.items():
+                if name not in fixed and isinstance(value, (int, float)) \
+                        and not isinstance(value, bool):
+                    counts[name] = counts.get(name, 0) + value
+        entry.update(counts)
+        summary[stage] = entry
+    return summary
+
+def suggest_concurrency(summary, render_workers):
+    """
+    Sizes the batch stage pools so each keeps up with the render stage.
+
+    Args:
+        summary (dict): The output of summarize.
+        render_workers (int): The number of render workers, usually bounded by the CPUs.
+
+    Returns:
+        dict: The suggested number of workers per batch stage, or an empty dict when the
+            trace has no render spans.
+    """
+    render = summary.get("render")
+    if not render or not render["mean"]:
+        return {}
+    return {stage: max(1, math.ceil(render_workers * summary[stage]["mean"] / render["mean"]))
+            for stage in BATCH_STAGES if stage in summary}
+
+def main(argv=None):
+    """
+    Command line entry point.
+
+    Args:
+        argv (list, optional): The command line arguments. Defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(description="Summarize a pipeline trace.")
+    parser.add_argument("trace", help="The JSONL trace, e.g. temp/metrics/trace.jsonl.")
+    parser.add_argument("--render-workers", type=int, default=1,
+                        help="The render pool size to size the other stages against.")
+    args = parser.parse_args(argv)
+
+    summary = summarize(load_trace(args.trace))
+    top_level = {stage: entry for stage, entry in summary.items() if entry["share"] is not None}
+    report = {
+        "stages": summary,
+        "bottleneck": max(top_level, key=lambda stage: top_level[stage]["total"], default=None),
+        "suggested_concurrency": suggest_concurrency(summary, args.render_workers),
+    }
+    print(json.dumps(report, indent=4))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+# coding: utf-8
+"""
+This module records where a job's time goes. Work is wrapped in spans named after the
+pipeline stage (chat, tts, stt, video, ...). A span measures its wall time and the
+process's peak memory, collects the counts reported while it is open (bytes moved,
+tokens, retries, frames, cache hits), and when it ends records them in the metrics
+registry and appends one line to a JSONL trace. The job a span belongs to is taken from a
+context variable, so code deep inside the API wrappers never has to be passed a job id.
+Listeners subscribed in the process, such as the GUI's progress stream, receive every
+event as it happens, plus a span_start event when a span opens.
+
+Modules Imported:
+- contextvars: Standard library context variables carrying the job id and open span.
+- functools: Standard library used to build the decorator.
+- inspect: Standard library used to detect coroutine and generator functions.
+- json: Standard library for writing the trace.
+- logging: Standard library for logging listener errors.
+- os: Standard library for interacting with the operating system.
+- sys: Standard library used to detect the platform.
+- threading: Standard library lock guarding the trace file.
+- time: Standard library used to measure wall time.
+- contextmanager: Decorator used to build job_context.
+- resource: Unix-only standard library reporting peak memory. Optional.
+- REGISTRY: The metrics registry of the process.
+
+Classes:
+    Span: A timed piece of work in a stage of a job.
+
+Functions:
+    configure: Sets the directory the trace and the metrics are written to.
+    export_metrics: Writes the metrics registry as a Prometheus text file.
+    job_context: Attributes the spans opened inside it to a job.
+    current_job_id: Returns the job the current code is working on.
+    span: Opens a span.
+    instrumented: Decorator running a function, coroutine function or generator in a span.
+    record: Adds counts to the open span.
+    event: Appends a free-form event to the trace.
+    subscribe: Registers a callable receiving every event of the process.
+    unsubscribe: Removes a listener.
+    peak_rss: Returns the peak resident set size of the process.
+    reset_peak_rss: Resets the peak resident set size where the OS allows it.
+
+Usage:
+    instrumentation.configure("temp/metrics")
+    with instrumentation.job_context(job.job_id):
+        with instrumentation.span("tts") as tts_span:
+            ...
+            tts_span.add(bytes_in=os.path.getsize(path))
+    instrumentation.export_metrics()
+"""
+
+from __future__ import absolute_import
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+from instrumentation.metrics import REGISTRY
+
+TRACE_FILE = "trace.jsonl"
+METRICS_FILE = "metrics.prom"
+
+_job_id = contextvars.ContextVar("job_id", default=None)
+_open_span = contextvars.ContextVar("span", default=None)
+_trace_lock = threading.Lock()
+# Spans can be shared by worker threads, e.g. the sentence requests of streamed speech
+_counts_lock = threading.Lock()
+_settings = {"directory": None}
+_listeners = []
+
+def configure(directory):
+    """
+    Sets the directory the trace and the metrics are written to. Until this is called
+    spans still feed the metrics registry, but no trace is written.
+
+    Args:
+        directory (str): The directory, e.g. temp/metrics. None stops tracing.
+    """
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    _settings["directory"] = directory
+
+def trace_directory():
+    """
+    Returns the directory set by configure.
+
+    Returns:
+        str: The directory, or None when tracing is off.
+    """
+    return _settings["directory"]
+
+def export_metrics(path=None):
+    """
+    Writes the metrics registry as a Prometheus text file.
+
+    Args:
+        path (str, optional): The path of the file. Defaults to metrics.prom in the
+            configured directory.
+
+    Returns:
+        str: The path written, or None when no path is configured.
+    """
+    if path is None:
+        if _settings["directory"] is None:
+            return None
+        path = os.path.join(_settings["directory"], METRICS_FILE)
+    REGISTRY.write_prometheus(path)
+    return path
+
+@contextmanager
+def job_context(job_id):
+    """
+    Attributes the spans opened inside the block to a job.
+
+    Args:
+        job_id: The identifier of the job.
+    """
+    token = _job_id.set(job_id)
+    try:
+        yield
+    finally:
+        _job_id.reset(token)
+
+def current_job_id():
+    """
+    Returns the job the current code is working on.
+
+    Returns:
+        The job id set by the innermost job_context, or None.
+    """
+    return _job_id.get()
+
+def peak_rss():
+    """
+    Returns the peak resident set size of the process.
+
+    Returns:
+        int: The peak in bytes, or None where it cannot be measured.
+    """
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def reset_peak_rss():
+    """
+    Resets the peak resident set size to the current one, so the next peak_rss covers
+    only what happens afterwards. Only Linux supports this; elsewhere the peak stays the
+    peak of the whole process.
+
+    Returns:
+        bool: Whether the peak was reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+def subscribe(listener):
+    """
+    Registers a callable receiving every event of the process, as a dict, from whichever
+    thread emits it. Listeners run inline, so they must return quickly.
+
+    Args:
+        listener (callable): The listener.
+    """
+    _listeners.append(listener)
+
+def unsubscribe(listener):
+    """
+    Removes a listener registered with subscribe.
+
+    Args:
+        listener (callable): The listener.
+    """
+    try:
+        _listeners.remove(listener)
+    except ValueError:
+        pass
+
+def _notify(item):
+    """Passes an event to the listeners, never letting one break the traced code."""
+    for listener in tuple(_listeners):
+        try:
+            listener(item)
+        except Exception as e: # pylint: disable=W0718:broad-exception-caught
+            logging.warning("Trace listener %r failed: %s", listener, e)
+
+def _make_event(kind, fields):
+    return dict({"type": kind, "time": round(time.time(), 3), "pid": os.getpid(),
+                 "job_id": current_job_id()}, **fields)
+
+def event(kind, **fields):
+    """
+    Appends a free-form event to the trace, attributed to the current job, and passes it
+    to the listeners.
+
+    Args:
+        kind (str): The type of the event, e.g. "job".
+        **fields: The JSON-serializable fields of the event.
+    """
+    directory = _settings["directory"]
+    if directory is None and not _listeners:
+        return
+    item = _make_event(kind, fields)
+    _notify(item)
+    if directory is None:
+        return
+    line = json.dumps(item, default=str)
+    with _trace_lock, open(os.path.join(directory, TRACE_FILE), "a",
+                           encoding="utf-8") as trace:
+        # One write per line, so lines from the render processes do not interleave
+        trace.write(line + "\n")
+
+class Span: # pylint: disable=R0902:too-many-instance-attributes
+    """
+    A timed piece of work in a stage of a job.
+
+    Attributes:
+        stage (str): The stage name, used as the stage label of the metrics.
+        attributes (dict): Descriptive fields copied to the trace line.
+        counts (dict): The counts reported while the span was open.
+        job_id: The job the span belongs to.
+        duration (float): The wall time in seconds, once the span has ended.
+    """
+
+    def __init__(self, stage, reset_peak=False, **attributes):
+        """
+        Initializes the span. It starts when it is entered.
+
+        Args:
+            stage (str): The stage name.
+            reset_peak (bool, optional): Reset the process's peak memory when the span
+                starts, so the peak reported is the span's own. Only meaningful when the
+                process does one thing at a time, e.g. a render worker. Defaults to False.
+            **attributes: Descriptive fields copied to the trace line.
+        """
+        self.stage = stage
+        self.attributes = attributes
+        self.counts = {}
+        self.job_id = None
+        self.duration = None
+        self._reset_peak = reset_peak
+        self._parent = None
+        self._token = None
+        self._start = None
+
+    def add(self, **counts):
+        """
+        Adds counts to the span and the spans enclosing it, and to the stage counters
+        of the metrics registry.
+
+        Args:
+            **counts: Numbers to add, e.g. bytes_in=2048 or retries=1.
+        """
+        for name, value in counts.items():
+            if not value:
+                continue
+            with _counts_lock:
+                current = self
+                while current is not None:
+                    current.counts[name] = current.counts.get(name, 0) + value
+                    current = current._parent # pylint: disable=W0212:protected-access
+            REGISTRY.inc(f"shorts_stage_{name}_total", value, stage=self.stage)
+
+    def __enter__(self):
+        self.job_id = current_job_id()
+        self._parent = _open_span.get()
+        self._token = _open_span.set(self)
+        if self._reset_peak:
+            reset_peak_rss()
+        if _listeners:
+            # Listeners only: the trace records each span once, when it ends
+            fields = {"stage": self.stage}
+            if self._parent is not None:
+                fields["parent"] = self._parent.stage
+            _notify(_make_event("span_start", fields))
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self._start
+        _open_span.reset(self._token)
+        status = "ok" if exc_type is None else "error"
+        REGISTRY.observe("shorts_stage_seconds", self.duration, stage=self.stage,
+                         status=status)
+        frames = self.counts.get("frames")
+        if frames and self.duration > 0 and exc_type is None:
+            REGISTRY.observe("shorts_stage_fps", frames / self.duration,
+                             buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, float("inf")),
+                             stage=self.stage)
+        peak = peak_rss()
+        if peak is not None:
+            REGISTRY.set_max("shorts_stage_peak_rss_bytes", peak, stage=self.stage)
+
+        fields = {"stage": self.stage, "status": status,
+                  "duration": round(self.duration, 6), "peak_rss": peak}
+        if self._parent is not None:
+            fields["parent"] = self._parent.stage
+        if exc_type is not None:
+            fields["error"] = f"{exc_type.__name__}: {exc_value}"
+        fields.update(self.attributes)
+        fields.update(self.counts)
+        event("span", **fields)
+        return False
+
+def span(stage, reset_peak=False, **attributes):
+    """
+    Opens a span, to be used as a context manager.
+
+    Args:
+        stage (str): The stage name.
+        reset_peak (bool, optional): Measure the span's own peak memory. See Span.
+        **attributes: Descriptive fields copied to the trace line.
+
+    Returns:
+        Span: The span.
+    """
+    return Span(stage, reset_peak, **attributes)
+
+def record(**counts):
+    """
+    Adds counts to the open span, if there is one.
+
+    Args:
+        **counts: Numbers to add, e.g. tokens_prompt=120.
+    """
+    current = _open_span.get()
+    if current is not None:
+        current.add(**counts)
+
+def instrumented(stage, reset_peak=False):
+    """
+    Decorator running every call of a function, or coroutine function, in a span.
+
+    The span of a generator, or async generator, lasts until it is exhausted, but it is
+    only open while the generator runs: the code consuming the items between two steps
+    is not attributed to it.
+
+    Args:
+        stage (str): The stage name.
+        reset_peak (bool, optional): Measure the span's own peak memory. See Span.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_generator_wrapper(*args, **kwargs):
+                parent = _open_span.get()
+                with Span(stage, reset_peak):
+                    async for item in func(*args, **kwargs):
+                        token = _open_span.set(parent)
+                        try:
+                            yield item
+                        finally:
+                            _open_span.reset(token)
+            return async_generator_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                parent = _open_span.get()
+                with Span(stage, reset_peak):
+                    for item in func(*args, **kwargs):
+                        token = _open_span.set(parent)
+                        try:
+                            yield item
+                        finally:
+                            _open_span.reset(token)
+            return generator_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with Span(stage, reset_peak):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(stage, reset_peak):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
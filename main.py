@@ -3,12 +3,14 @@ Blah
 """
 import sys
 import os
+import json
 import logging
 from datetime import datetime, date
 
 from dotenv import load_dotenv
 import openai_api
 import video_processing
+import instrumentation
 
 # pylint: disable=W1401:anomalous-backslash-in-string
 print(
@@ -34,35 +36,99 @@ def main() -> None:
         return
 
     configuration = openai_api.Configuration(api_key=api_key)
+    instrumentation.configure(os.path.join(configuration.temp_dir, "metrics"))
+    job_store, job, failure = None, None, None
     with openai_api.OpenAiClient(configuration) as api_client:
         try:
             print("Creating ChatAPI instance...")
-            api_instance = openai_api.CHATApi(api_client)
-            api_instance.chat_completions_title_create(
+            chat_api = openai_api.CHATApi(api_client)
+            chat_api.chat_completions_title_create(
                 topic="mental toughness and stoicism"
             )
-            script = api_instance.chat_completions_script_create()
-
-            print("Creating TTSApi instance...")
-            api_instance = openai_api.TTSApi(api_client)
-            api_instance.audio_speech_create(text=script)
-
-            print("Creating STTApi instance...")
-            api_instance = openai_api.STTApi(api_client)
-            transcription_data, duration = api_instance.audio_transcriptions_create()
+            script = chat_api.chat_completions_script_create()
+            job_store, job = chat_api.job_store, chat_api.current_job
+            if job is None:
+                instrumentation.export_metrics()
+                return
+            if script is None:
+                raise ValueError(f"No script generated for '{job.title}'")
+            workspace = openai_api.ArtifactStore(configuration.temp_dir).workspace(job.job_id)
+            # Stages finished by an earlier attempt at this job are skipped
+            manifest = openai_api.JobManifest(workspace)
+            if not manifest.is_complete("script"):
+                manifest.complete("script", script=script)
+            transcription_data, duration = narrate(api_client, script, workspace, manifest)
         except openai_api.APIError as e:
             logging.error("API error occurred: %s", e)
+            failure = e
         except openai_api.RequestError as e:
             logging.error("Request error occurred: %s", e)
+            failure = e
         except Exception as e: # pylint: disable=W0718:broad-exception-caught
             logging.error("Unexpected error occurred: %s", e)
+            failure = e
+
+    if failure is not None:
+        # Nothing to render; record the real error rather than rendering without inputs
+        if job is not None:
+            job_store.mark_failed(job.job_id, failure, worker=job.worker)
+        instrumentation.export_metrics()
+        return
 
-    with video_processing.VideoProcessClient() as process_client: # pylint: disable=W0612:unused-variable
+    with video_processing.VideoProcessClient(configuration.temp_dir) as process_client: # pylint: disable=W0612:unused-variable
         try:
-            # Add processing logic here
-            process_client.create_video(duration, transcription_data["words"], "./temp/speech.mp3")
+            if not manifest.is_complete("render"):
+                process_client.create_video(
+                    duration, transcription_data["words"], workspace.path("speech.mp3"),
+                    output_file=workspace.output_path("video.mp4"))
+                manifest.complete("render", {"video.mp4": workspace.commit("video.mp4")})
+            job_store.mark_done(job.job_id, {"video": workspace.path("video.mp4"),
+                                             "digest": manifest.artifacts("render")["video.mp4"]},
+                                worker=job.worker)
         except Exception as e: # pylint: disable=W0718:broad-exception-caught
             logging.error("Unexpected error occurred during video processing: %s", e)
+            job_store.mark_failed(job.job_id, e, worker=job.worker)
+    instrumentation.export_metrics()
+
+def narrate(api_client, script, workspace, manifest):
+    """
+    Runs the speech and transcription stages of a job, skipping those its manifest
+    records as complete.
+
+    Args:
+        api_client (OpenAiClient): The client for the TTS and STT APIs.
+        script (str): The script of the job.
+        workspace (JobWorkspace): The workspace of the job.
+        manifest (JobManifest): The manifest of the job.
+
+    Returns:
+        tuple: (transcription_data, duration).
+    """
+    if not manifest.is_complete("speech"):
+        print("Creating TTSApi instance...")
+        api_instance = openai_api.TTSApi(api_client)
+        if api_instance.audio_speech_create(
+                text=script, output_file_path=workspace.output_path("speech.mp3")) is None:
+            raise ValueError("Speech creation failed")
+        manifest.complete("speech", {"speech.mp3": workspace.commit("speech.mp3")})
+
+    if manifest.is_complete("transcription"):
+        with open(workspace.path("transcription.json"), "r", encoding="utf-8") as file:
+            return json.load(file), manifest.data("transcription")["duration"]
+
+    print("Creating STTApi instance...")
+    api_instance = openai_api.STTApi(api_client)
+    transcription = api_instance.audio_transcriptions_create(
+        input_file_path=workspace.path("speech.mp3"),
+        output_file_path=workspace.output_path("transcription.json"),
+        script=script)
+    if transcription is None:
+        raise ValueError("Transcription failed")
+    transcription_data, duration = transcription
+    manifest.complete("transcription",
+                      {"transcription.json": workspace.commit("transcription.json")},
+                      duration=duration)
+    return transcription_data, duration
 
 def shutdown() -> None:
     """
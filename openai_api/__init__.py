@@ -12,11 +12,25 @@ Modules Imported:
 - TTSApi: Client for text-to-speech operations.
 - STTApi: Client for speech-to-text operations.
 - CHATApi: Client for generating chat responses and other text-based outputs.
+- AsyncTTSApi, AsyncSTTApi, AsyncCHATApi: asyncio counterparts of the three clients.
 
 Clients:
 - OpenAiClient: Main client for managing API sessions and requests.
+- AsyncOpenAiClient: Asynchronous client sharing a process-wide connection pool.
+- RateLimiter: Per-endpoint token buckets and Retry-After-aware retries behind both clients.
 - Configuration: Utility for managing SDK configuration settings.
 
+Storage:
+- JobStore: Durable backlog of titles that workers claim with a lease.
+- LeaseRenewal: Keeps a job's lease alive from a background thread.
+- ArtifactStore: Per-job workspaces backed by a content-addressed object store.
+- JobManifest: Per-job checkpoint of completed stages, used to resume failed jobs.
+- ResponseCache: Opt-in persistent cache of chat completions.
+- AudioCache: Content-addressed cache of synthesized speech.
+- TitleIndex: Index of every title produced, rejecting repeats and near-repeats.
+- script_to_speech: Streams a script into concurrent sentence-level speech.
+- align_script: Local word timing of a known script, used instead of Whisper when confident.
+
 Exceptions:
 - OpenAiException: Base exception class for all custom exceptions in the OpenAI SDK.
 - APIError: Raised for errors in the API response.
@@ -35,18 +49,55 @@ Usage:
     tts_api.audio_speech_create("Hello, world!")
     transcription = stt_api.audio_transcriptions_create()
     chat_response = chat_api.generate_script("AI and the future")
+
+Lazy loading:
+    Importing the package loads none of its modules. Each name below is imported from
+    its module the first time it is used, so `import openai_api` costs nothing and code
+    that only needs the stores never loads the OpenAI SDK.
 """
 
 from __future__ import absolute_import
+from common.lazy_exports import lazy_exports
+
+# The module each public name is loaded from on first use
+_EXPORTS = {
+    # APIs, loaded through the api subpackage
+    "TTSApi": "openai_api.api",
+    "STTApi": "openai_api.api",
+    "CHATApi": "openai_api.api",
+    "AsyncTTSApi": "openai_api.api",
+    "AsyncSTTApi": "openai_api.api",
+    "AsyncCHATApi": "openai_api.api",
+
+    # ApiClient and Configuration
+    "OpenAiClient": "openai_api.openai_client",
+    "AsyncOpenAiClient": "openai_api.async_client",
+    "shared_http_client": "openai_api.async_client",
+    "close_shared_http_clients": "openai_api.async_client",
+    "Configuration": "openai_api.configuration",
+    "RateLimiter": "openai_api.rate_limiter",
+    "estimate_chat_tokens": "openai_api.rate_limiter",
 
-# Import APIs into SDK package
-from openai_api.api.tts_api import TTSApi
-from openai_api.api.stt_api import STTApi
-from openai_api.api.chat_api import CHATApi
+    # Storage
+    "JobStore": "openai_api.job_store",
+    "Job": "openai_api.job_store",
+    "LeaseRenewal": "openai_api.job_store",
+    "ArtifactStore": "openai_api.artifact_store",
+    "JobWorkspace": "openai_api.artifact_store",
+    "JobManifest": "openai_api.manifest",
+    "ResponseCache": "openai_api.response_cache",
+    "AudioCache": "openai_api.audio_cache",
+    "TitleIndex": "openai_api.title_index",
+    "align_script": "openai_api.alignment",
+    "Alignment": "openai_api.alignment",
+    "SentenceSplitter": "openai_api.streaming",
+    "script_to_speech": "openai_api.streaming",
+    "async_script_to_speech": "openai_api.streaming",
 
-# Import ApiClient and Configuration
-from openai_api.openai_client import OpenAiClient
-from openai_api.configuration import Configuration
+    # Exceptions
+    "OpenAiException": "openai_api.exceptions",
+    "APIError": "openai_api.exceptions",
+    "RequestError": "openai_api.exceptions",
+}
 
-# Import exceptions
-from openai_api.exceptions import OpenAiException, APIError, RequestError
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
@@ -0,0 +1,247 @@
+# coding: utf-8
+"""
+This module aligns a known script against its synthesized speech locally, producing the
+same word timings as a Whisper transcription without uploading the audio. The audio is
+decoded to mono PCM with FFmpeg and analysed with NumPy: frame energy separates speech
+from silence, the pauses in the speech are matched to the punctuation of the script by
+dynamic programming, and the words between two matched pauses share the voiced time in
+proportion to their estimated syllable counts. Each boundary is then snapped to the
+strongest nearby onset. The result carries a confidence score so callers can fall back
+to Whisper when the audio and the script do not agree.
+
+Modules Imported:
+- re: Standard library for tokenizing the script.
+- subprocess: Standard library for running FFmpeg.
+- numpy: Array library used for the signal analysis.
+- ffmpeg_binary: The FFmpeg binary MoviePy is configured with, honouring FFMPEG_BINARY.
+
+Classes:
+    Alignment: The word timings of a script and how much they can be trusted.
+
+Functions:
+    decode_audio: Decodes an audio file to mono floating point samples.
+    align_script: Aligns a script against the speech reading it.
+
+Usage:
+    alignment = align_script("Hello there. How are you?", "temp/speech.mp3")
+    if alignment.confidence >= 0.6:
+        words = alignment.words
+"""
+
+from __future__ import absolute_import
+import re
+import subprocess
+
+import numpy as np
+
+from common.ffmpeg import ffmpeg_binary
+
+SAMPLE_RATE = 16000
+HOP = 0.01
+WINDOW = 0.025
+MIN_PAUSE = 0.12
+SNAP_RADIUS = 0.05
+SKIP_COST = 0.04
+
+WORD_PATTERN = re.compile(r"\S+")
+PAUSE_PUNCTUATION = re.compile(r"[,.;:!?—…)\"]$")
+VOWEL_GROUPS = re.compile(r"[aeiouy]+")
+
+class Alignment: # pylint: disable=R0903:too-few-public-methods
+    """
+    The word timings of a script and how much they can be trusted.
+
+    Attributes:
+        words (list): The words as {"word", "start", "end"} dictionaries.
+        duration (float): The length of the audio in seconds.
+        confidence (float): How well the pauses in the audio matched the script, from 0 to 1.
+    """
+
+    def __init__(self, words, duration, confidence):
+        self.words = words
+        self.duration = duration
+        self.confidence = confidence
+
+def decode_audio(path, sample_rate=SAMPLE_RATE):
+    """
+    Decodes an audio file to mono floating point samples.
+
+    Args:
+        path (str): The audio file.
+        sample_rate (int, optional): The sample rate to resample to. Defaults to 16 kHz.
+
+    Returns:
+        numpy.ndarray: The samples as float32 in [-1, 1].
+
+    Raises:
+        subprocess.CalledProcessError: If FFmpeg cannot decode the file.
+    """
+    command = [ffmpeg_binary(), "-nostdin", "-loglevel", "error",
+               "-i", path, "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "-"]
+    result = subprocess.run(command, check=True, capture_output=True)
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+def _tokenize(script):
+    """Splits a script into spoken words, syllable weights and pause flags."""
+    words, weights, pauses = [], [], []
+    for token in WORD_PATTERN.findall(script):
+        word = token.strip("\"'()[]{}.,;:!?—…")
+        if not word:
+            continue
+        words.append(word)
+        lowered = word.lower()
+        syllables = len(VOWEL_GROUPS.findall(lowered)) + sum(c.isdigit() for c in lowered)
+        weights.append(max(1, syllables))
+        pauses.append(bool(PAUSE_PUNCTUATION.search(token)))
+    return words, np.asarray(weights, dtype=np.float64), np.asarray(pauses, dtype=bool)
+
+def _frame_energy(samples, sample_rate):
+    """Returns the log energy of overlapping frames, one per HOP seconds."""
+    hop = int(HOP * sample_rate)
+    window = int(WINDOW * sample_rate)
+    if samples.size < window:
+        samples = np.pad(samples, (0, window - samples.size))
+    frames = np.lib.stride_tricks.sliding_window_view(samples, window)[::hop]
+    return 10 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-10)
+
+def _voiced_mask(energy):
+    """Classifies frames as speech or silence, closing gaps too short to be pauses."""
+    floor, peak = np.percentile(energy, [5, 95])
+    voiced = energy > floor + 0.35 * (peak - floor)
+    # A gap shorter than MIN_PAUSE is a stop consonant, not a pause
+    for start, end in _pauses(voiced):
+        if (end - start) * HOP < MIN_PAUSE:
+            voiced[start:end] = True
+    return voiced
+
+def _pauses(voiced):
+    """Returns the (start, end) frames of the silences between the first and last speech."""
+    speech = np.flatnonzero(voiced)
+    if speech.size == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    inner = voiced[speech[0]:speech[-1] + 1]
+    edges = np.flatnonzero(np.diff(inner.astype(np.int8))) + 1 + speech[0]
+    return edges.reshape(-1, 2)
+
+def _match_pauses(expected, observed):
+    """
+    Matches expected pause positions to observed ones, both in voiced seconds.
+
+    A monotone alignment minimizing the position errors, where leaving a pause of either
+    kind unmatched costs SKIP_COST times the total, computed by dynamic programming.
+
+    Returns:
+        list: The (expected index, observed index) pairs that were matched.
+    """
+    total = max(expected[-1] if expected.size else 0, observed[-1] if observed.size else 0, 1)
+    skip = SKIP_COST * total
+    rows, cols = expected.size, observed.size
+    cost = np.zeros((rows + 1, cols + 1))
+    cost[1:, 0] = skip * np.arange(1, rows + 1)
+    cost[0, 1:] = skip * np.arange(1, cols + 1)
+    error = np.abs(expected[:, None] - observed[None, :])
+    for i in range(1, rows + 1):
+        for j in range(1, cols + 1):
+            cost[i, j] = min(cost[i - 1, j - 1] + error[i - 1, j - 1],
+                             cost[i - 1, j] + skip, cost[i, j - 1] + skip)
+
+    pairs = []
+    i, j = rows, cols
+    while i > 0 and j > 0:
+        if cost[i, j] == cost[i - 1, j - 1] + error[i - 1, j - 1]:
+            pairs.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif cost[i, j] == cost[i - 1, j] + skip:
+            i -= 1
+        else:
+            j -= 1
+    return pairs[::-1]
+
+def _distribute(weights, voiced_before, start, end):
+    """
+    Splits the voiced time between two frames among words in proportion to their weights.
+
+    Returns:
+        tuple: The start and end frames of each word.
+    """
+    low, high = voiced_before[start], voiced_before[end]
+    cumulative = np.concatenate(([0.0], np.cumsum(weights)))
+    targets = low + (high - low) * cumulative / cumulative[-1]
+    # A word starts on the first voiced frame after its share begins and ends on the last
+    # voiced frame of its share, so silences never sit inside a word
+    starts = np.searchsorted(voiced_before, targets[:-1], side="right") - 1
+    ends = np.searchsorted(voiced_before, targets[1:], side="left")
+    return np.clip(starts, start, end), np.clip(ends, start, end)
+
+def _snap(boundaries, onset, lower, upper):
+    """Moves word starts to the strongest onset within SNAP_RADIUS, between neighbours."""
+    radius = int(SNAP_RADIUS / HOP)
+    padded = np.pad(onset, radius)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1)[boundaries]
+    snapped = boundaries + np.argmax(windows, axis=1) - radius
+    return np.clip(snapped, lower, upper)
+
+def align_script(script, audio_path, sample_rate=SAMPLE_RATE): # pylint: disable=R0914:too-many-locals
+    """
+    Aligns a script against the speech reading it.
+
+    Args:
+        script (str): The text that was synthesized.
+        audio_path (str): The synthesized speech.
+        sample_rate (int, optional): The analysis sample rate. Defaults to 16 kHz.
+
+    Returns:
+        Alignment: The word timings and the confidence of the alignment.
+    """
+    samples = decode_audio(audio_path, sample_rate)
+    duration = samples.size / sample_rate
+    words, weights, pause_after = _tokenize(script)
+    if not words or samples.size == 0:
+        return Alignment([], duration, 0.0)
+
+    energy = _frame_energy(samples, sample_rate)
+    voiced = _voiced_mask(energy)
+    voiced_before = np.concatenate(([0], np.cumsum(voiced)))
+    if voiced_before[-1] == 0:
+        return Alignment([], duration, 0.0)
+
+    # Pauses the script asks for and pauses the audio has, both as voiced time elapsed
+    boundaries = np.flatnonzero(pause_after[:-1])
+    cumulative = np.cumsum(weights)
+    expected = voiced_before[-1] * cumulative[boundaries] / cumulative[-1] * HOP
+    pauses = _pauses(voiced)
+    observed = voiced_before[pauses[:, 0]] * HOP
+    pairs = _match_pauses(expected, observed)
+
+    # Matched pauses anchor the chunks the remaining words are distributed over
+    speech = np.flatnonzero(voiced)
+    anchors = [(-1, speech[0], None)]
+    anchors += [(boundaries[i], pauses[j, 1], pauses[j, 0]) for i, j in pairs]
+    anchors.append((len(words) - 1, None, speech[-1] + 1))
+    starts = np.empty(len(words), dtype=np.int64)
+    ends = np.empty(len(words), dtype=np.int64)
+    for (first, start, _), (last, _, end) in zip(anchors, anchors[1:]):
+        chunk = slice(first + 1, last + 1)
+        starts[chunk], ends[chunk] = _distribute(weights[chunk], voiced_before, start, end)
+
+    onset = np.maximum(np.diff(energy, prepend=energy[0]), 0)
+    lower = np.concatenate(([0], ends[:-1]))
+    starts = _snap(starts, onset, lower, ends - 1)
+    ends = np.maximum(np.minimum(ends, np.concatenate((starts[1:], [ends[-1]]))), starts + 1)
+
+    timed = [{"word": word, "start": round(float(start * HOP), 3),
+              "end": round(float(min(end * HOP, duration)), 3)}
+             for word, start, end in zip(words, starts, ends)]
+    return Alignment(timed, duration, _confidence(expected, observed, pairs,
+                                                  len(words), voiced_before[-1] * HOP))
+
+def _confidence(expected, observed, pairs, word_count, voiced_seconds):
+    """Scores an alignment by how many pauses matched and how plausible the pace is."""
+    rate = word_count / voiced_seconds
+    if not 1.0 <= rate <= 6.0:
+        return 0.0
+    if expected.size == 0 and observed.size == 0:
+        return 1.0
+    tolerance = max(0.3, 0.04 * voiced_seconds)
+    close = sum(1 for i, j in pairs if abs(expected[i] - observed[j]) <= tolerance)
+    return close / (expected.size + observed.size - close)
@@ -9,6 +9,7 @@ Modules Imported:
 - TTSApi: The client class for handling text-to-speech conversion using OpenAI's services.
 - STTApi: The client class for handling speech-to-text conversion.
 - CHATApi: The client class for generating chat responses and other text-based outputs.
+- AsyncTTSApi, AsyncSTTApi, AsyncCHATApi: The asyncio counterparts of the three clients.
 
 Usage:
     from openai_api import TTSApi, STTApi, CHATApi
@@ -25,12 +26,21 @@ Attributes:
 
 Note:
     This file uses future imports for compatibility with Python 2 and 3.
-    Flake8 linting is disabled for this file.
+    Flake8 linting is disabled for this file. The clients are imported on first use,
+    so importing the package does not load the OpenAI SDK.
 """
 
 from __future__ import absolute_import
+from common.lazy_exports import lazy_exports
 
-# import apis into sdk package
-from openai_api.api.tts_api import TTSApi
-from openai_api.api.stt_api import STTApi
-from openai_api.api.chat_api import CHATApi
+# The module each client is loaded from on first use
+_EXPORTS = {
+    "TTSApi": "openai_api.api.tts_api",
+    "STTApi": "openai_api.api.stt_api",
+    "CHATApi": "openai_api.api.chat_api",
+    "AsyncTTSApi": "openai_api.api.async_tts_api",
+    "AsyncSTTApi": "openai_api.api.async_stt_api",
+    "AsyncCHATApi": "openai_api.api.async_chat_api",
+}
+
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
@@ -0,0 +1,205 @@
+# coding: utf-8
+"""
+This module provides AsyncCHATApi, the asyncio counterpart of CHATApi. It generates
+YouTube short titles and scripts with the same prompts, the same response cache and the
+same job store, but every request is awaited on the shared connection pool of
+AsyncOpenAiClient, so many scripts can be generated concurrently from one thread.
+
+Modules Imported:
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- AsyncOpenAiClient: The asynchronous client sharing the connection pool.
+- JobStore: The durable backlog of titles.
+- ResponseCache: The opt-in persistent cache of chat completions.
+- TitleIndex: The index of every title produced, used to reject near-duplicates.
+- SentenceSplitter: Cuts a streamed script into sentences.
+- cached_completion, completion_arguments, completion_content, script_stream_errors:
+    Completion caching, requests and script stream errors shared with CHATApi.
+- instrumented: Times completions as the "chat" stage.
+- script_messages, title_messages, parse_titles, bulk_title_messages, parse_title_json,
+    queue_new_titles, MODEL: The prompts and title handling shared with CHATApi.
+
+Classes:
+    AsyncCHATApi: Generates titles and scripts asynchronously.
+
+Usage:
+    async with AsyncOpenAiClient(configuration) as api_client:
+        chat_api = AsyncCHATApi(api_client)
+        await chat_api.chat_completions_title_create(topic="Artificial Intelligence")
+        titles = await chat_api.generate_titles("Stoicism", count=50)
+        scripts = await chat_api.generate_scripts(["Title one", "Title two"])
+"""
+
+from __future__ import absolute_import
+import logging
+import os
+
+from openai_api.async_client import AsyncOpenAiClient
+from openai_api.job_store import JobStore
+from openai_api.response_cache import ResponseCache
+from openai_api.title_index import TitleIndex
+from openai_api.streaming import SentenceSplitter
+from openai_api.api.shared import (cached_completion, completion_arguments, completion_content,
+                                   script_stream_errors)
+from openai_api.api.chat_api import (script_messages, title_messages, parse_titles,
+                                     bulk_title_messages, parse_title_json,
+                                     queue_new_titles, MODEL)
+from instrumentation import instrumented
+
+class AsyncCHATApi:
+    """
+    Generates YouTube short titles and scripts with asynchronous requests.
+
+    Attributes:
+        api_client (AsyncOpenAiClient): The client the requests are made with.
+        job_store (JobStore): The backlog titles are queued in and claimed from.
+        title_index (TitleIndex): Every title produced so far, for rejecting duplicates.
+        response_cache (ResponseCache): The completion cache, or None when caching is off.
+    """
+
+    def __init__(self, api_client: AsyncOpenAiClient):
+        """
+        Initializes the API with an asynchronous client.
+
+        Args:
+            api_client (AsyncOpenAiClient): The client the requests are made with.
+        """
+        self.api_client = api_client
+        configuration = api_client.configuration
+        self.job_store = JobStore(os.path.join(configuration.temp_dir, "jobs.sqlite3"))
+        self.response_cache = ResponseCache.from_configuration(configuration)
+        self.title_index = TitleIndex.from_configuration(configuration, self.job_store)
+
+    @instrumented("chat")
+    async def create_completion(self, messages, model=MODEL, refresh=False,
+                                bypass_cache=False, **params):
+        """
+        Creates a chat completion, serving it from the response cache when possible.
+
+        Args:
+            messages (list): The chat messages.
+            model (str, optional): The model name. Defaults to "gpt-4o-mini".
+            refresh (bool, optional): Skip the cached response but store the new one.
+                Defaults to False.
+            bypass_cache (bool, optional): Neither read nor write the cache.
+                Defaults to False.
+            **params: Sampling parameters passed to the API (temperature, top_p, ...).
+
+        Returns:
+            str: The content of the first choice.
+        """
+        cache = None if bypass_cache else self.response_cache
+        key, content = cached_completion(cache, model, messages, refresh, **params)
+        if content is None:
+            response = await self.api_client.request(
+                "chat", self.api_client.client.chat.completions.create,
+                **completion_arguments(messages, model, **params))
+            content = completion_content(response, cache, key)
+        return content
+
+    async def generate_script(self, title, refresh=False):
+        """
+        Generates a YouTube short script based on a given title.
+
+        Args:
+            title (str): The title for which the script is to be generated.
+            refresh (bool, optional): Ignore a cached script for the title. Defaults to False.
+
+        Returns:
+            str: The generated script.
+        """
+        content = await self.create_completion(script_messages(title), refresh=refresh)
+        return content.strip()
+
+    @instrumented("chat")
+    async def generate_script_stream(self, title, refresh=False):
+        """
+        Streams a YouTube short script for a title, one sentence at a time.
+
+        Args:
+            title (str): The title for which the script is to be generated.
+            refresh (bool, optional): Ignore a cached script for the title. Defaults to False.
+
+        Yields:
+            str: The next sentence of the script.
+
+        Raises:
+            APIError: If the completion request or its stream fails.
+        """
+        messages = script_messages(title)
+        splitter = SentenceSplitter()
+        key, content = cached_completion(self.response_cache, MODEL, messages, refresh)
+        if content is not None:
+            for sentence in splitter.feed(content.strip() + " ") + splitter.flush():
+                yield sentence
+            return
+
+        parts = []
+        with script_stream_errors():
+            stream = await self.api_client.request(
+                "chat", self.api_client.client.chat.completions.create,
+                **completion_arguments(messages, MODEL, stream=True))
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    for sentence in splitter.feed(delta):
+                        yield sentence
+        for sentence in splitter.flush():
+            yield sentence
+        if key is not None:
+            self.response_cache.put(key, "".join(parts))
+
+    async def generate_scripts(self, titles, refresh=False):
+        """
+        Generates scripts for many titles concurrently.
+
+        Args:
+            titles (list): The titles.
+            refresh (bool, optional): Ignore cached scripts. Defaults to False.
+
+        Returns:
+            list: The scripts in the order of the titles, with the exception raised for a
+            title in place of its script if it failed.
+        """
+        return await self.api_client.gather(
+            *(self.generate_script(title, refresh) for title in titles),
+            return_exceptions=True)
+
+    async def chat_completions_title_create(self, topic, refresh=False):
+        """
+        Generates YouTube short titles on a topic and queues them in the job store.
+
+        Args:
+            topic (str): The topic for generating titles.
+            refresh (bool, optional): Ignore cached titles for the topic. Defaults to False.
+
+        Returns:
+            int: The number of titles queued.
+        """
+        content = await self.create_completion(title_messages(topic), refresh=refresh)
+        added = len(queue_new_titles(self.title_index, self.job_store, parse_titles(content)))
+        logging.info("%d titles saved to the job store", added)
+        return added
+
+    async def generate_titles(self, topic, count=20):
+        """
+        Generates titles on a topic in bulk as structured JSON and queues the new ones.
+        The completion is never served from the response cache.
+
+        Args:
+            topic (str): The topic for generating titles.
+            count (int, optional): How many titles to ask for. Defaults to 20.
+
+        Returns:
+            list: The titles queued, which may be fewer than count once duplicates are
+            rejected.
+
+        Raises:
+            ValueError: If the completion is not the expected JSON.
+        """
+        content = await self.create_completion(
+            bulk_title_messages(topic, count), bypass_cache=True,
+            response_format={"type": "json_object"}, max_tokens=max(256, 40 * count))
+        titles = parse_title_json(content)
+        return queue_new_titles(self.title_index, self.job_store, titles[:count])
@@ -0,0 +1,101 @@
+# coding: utf-8
+"""
+This module provides AsyncSTTApi, the asyncio counterpart of STTApi. Word timings come
+from local alignment of the known script when it is confident, run in a worker thread so
+the event loop keeps serving other requests, and otherwise from an awaited Whisper request
+on the shared connection pool of AsyncOpenAiClient.
+
+Modules Imported:
+- asyncio: Standard library used to run alignment and file access off the event loop.
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- APIError: OpenAI error class for handling API interactions.
+- AsyncOpenAiClient: The asynchronous client sharing the connection pool.
+- whisper_transcription, aligned_transcription, save_transcription: Helpers shared
+    with STTApi.
+- instrumentation: Times transcription as the "stt" stage and counts uploaded bytes.
+
+Classes:
+    AsyncSTTApi: Produces word timings asynchronously.
+
+Usage:
+    async with AsyncOpenAiClient(configuration) as api_client:
+        stt_api = AsyncSTTApi(api_client)
+        data, duration = await stt_api.audio_transcriptions_create(
+            "speech.mp3", "transcription.json", script=script)
+"""
+
+from __future__ import absolute_import
+import asyncio
+import logging
+import os
+
+from openai import APIError
+from openai_api.async_client import AsyncOpenAiClient
+from openai_api.api.stt_api import (whisper_transcription, aligned_transcription,
+                                    save_transcription)
+import instrumentation
+from instrumentation import instrumented
+
+class AsyncSTTApi: # pylint: disable=R0903:too-few-public-methods
+    """
+    Produces word timings for speech with asynchronous requests.
+
+    Attributes:
+        api_client (AsyncOpenAiClient): The client the requests are made with.
+    """
+
+    def __init__(self, api_client: AsyncOpenAiClient):
+        """
+        Initializes the API with an asynchronous client.
+
+        Args:
+            api_client (AsyncOpenAiClient): The client the requests are made with.
+        """
+        self.api_client = api_client
+
+    @instrumented("stt")
+    async def audio_transcriptions_create(self, input_file_path, output_file_path,
+                                          script=None, min_confidence=0.6):
+        """
+        Creates word timings for an audio file.
+
+        Args:
+            input_file_path (str): The audio to transcribe.
+            output_file_path (str): Where to save the transcription JSON.
+            script (str, optional): The text the audio was synthesized from. When given,
+                the words are aligned locally instead of uploading the audio to Whisper.
+            min_confidence (float, optional): The alignment confidence below which
+                Whisper is used anyway. Defaults to 0.6.
+
+        Returns:
+            tuple: (transcription_data, duration), or None if the transcription failed.
+        """
+        try:
+            transcription_data = None
+            if script:
+                transcription_data = await asyncio.to_thread(
+                    aligned_transcription, script, input_file_path, min_confidence)
+
+            if transcription_data is None:
+                with open(input_file_path, "rb") as audio_file:
+                    audio = await asyncio.to_thread(audio_file.read)
+                instrumentation.record(bytes_out=len(audio))
+                transcription_response = await self.api_client.request(
+                    "transcriptions", self.api_client.client.audio.transcriptions.create,
+                    file=(os.path.basename(input_file_path), audio),
+                    model="whisper-1",
+                    response_format="verbose_json",
+                    timestamp_granularities=["word"])
+                transcription_data = whisper_transcription(transcription_response)
+
+            await asyncio.to_thread(save_transcription, transcription_data, output_file_path)
+            return transcription_data, transcription_data["duration"]
+
+        except FileNotFoundError:
+            logging.error("Audio file not found: %s", input_file_path)
+        except APIError as e:
+            logging.error("API error during transcription: %s", e)
+        except (IOError, OSError) as e:
+            logging.error("File handling error: %s", e)
+        return None
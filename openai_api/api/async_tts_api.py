@@ -0,0 +1,138 @@
+# coding: utf-8
+"""
+This module provides AsyncTTSApi, the asyncio counterpart of TTSApi. Speech is looked up
+in the same audio cache and otherwise synthesized with an awaited request on the shared
+connection pool of AsyncOpenAiClient, so many scripts can be spoken concurrently.
+
+Modules Imported:
+- asyncio: Standard library used to copy cached audio off the event loop.
+- os: Standard library for interacting with the operating system.
+- shutil: Standard library for copying cached audio to the output path.
+- AsyncOpenAiClient: The asynchronous client sharing the connection pool.
+- AudioCache: Content-addressed cache of synthesized speech.
+- concat_audio, segment_dir: Stitching of the sentence clips of streamed speech.
+- cached_speech, all_sentences_spoken, speech_errors: Speech caching and error handling
+    shared with TTSApi.
+- instrumentation: Times speech as the "tts" stage and counts bytes.
+
+Classes:
+    AsyncTTSApi: Converts text to speech asynchronously.
+
+Usage:
+    async with AsyncOpenAiClient(configuration) as api_client:
+        tts_api = AsyncTTSApi(api_client)
+        await tts_api.audio_speech_create("Hello, world!", output_file_path="hello.mp3")
+"""
+
+from __future__ import absolute_import
+import asyncio
+import os
+import shutil
+
+from openai_api.async_client import AsyncOpenAiClient
+from openai_api.audio_cache import AudioCache
+from openai_api.streaming import concat_audio, segment_dir
+from openai_api.api.shared import all_sentences_spoken, cached_speech, speech_errors
+import instrumentation
+from instrumentation import instrumented
+
+class AsyncTTSApi:
+    """
+    Converts text to speech with asynchronous requests.
+
+    Attributes:
+        api_client (AsyncOpenAiClient): The client the requests are made with.
+        audio_cache (AudioCache): The cache of synthesized speech, or None when caching is off.
+    """
+
+    def __init__(self, api_client: AsyncOpenAiClient):
+        """
+        Initializes the API with an asynchronous client.
+
+        Args:
+            api_client (AsyncOpenAiClient): The client the requests are made with.
+        """
+        self.api_client = api_client
+        self.audio_cache = AudioCache.from_configuration(api_client.configuration)
+
+    @instrumented("tts")
+    async def audio_speech_create(self, text, output_file_path, voice="alloy", *, # pylint: disable=R0913:too-many-arguments
+                                  model="tts-1", response_format="mp3", refresh=False):
+        """
+        Creates a speech audio file from text.
+
+        Args:
+            text (str): The input text to be converted to speech.
+            output_file_path (str): Where to save the audio.
+            voice (str, optional): The voice to use. Defaults to "alloy".
+            model (str, optional): The TTS model. Defaults to "tts-1".
+            response_format (str, optional): The audio format. Defaults to "mp3".
+            refresh (bool, optional): Synthesize again even if the audio is cached.
+                Defaults to False.
+
+        Returns:
+            str: The path of the saved audio, or None if the speech could not be created.
+        """
+        with speech_errors():
+            key, cached_path = cached_speech(self.audio_cache, text, voice, model,
+                                             response_format, refresh=refresh)
+            if cached_path is not None:
+                await asyncio.to_thread(shutil.copyfile, cached_path, output_file_path)
+                return output_file_path
+
+            response = await self.api_client.request(
+                "speech", self.api_client.client.audio.speech.create,
+                model=model, voice=voice, input=text, response_format=response_format)
+            await response.astream_to_file(output_file_path)
+            instrumentation.record(bytes_in=os.path.getsize(output_file_path))
+            if key is not None:
+                await asyncio.to_thread(self.audio_cache.put, key, output_file_path)
+            return output_file_path
+        return None
+
+    @instrumented("tts")
+    async def audio_speech_create_streamed(self, sentences, output_file_path, voice="alloy", # pylint: disable=R0913:too-many-arguments
+                                           *, model="tts-1", response_format="mp3",
+                                           refresh=False):
+        """
+        Creates one speech track from sentences that may still be arriving.
+
+        Each sentence is synthesized in its own task as soon as it is read, bounded by
+        the client's semaphore and rate limiter, and the clips are stitched in order
+        once every sentence is done.
+
+        Args:
+            sentences (async iterable): The sentences, in order, e.g. from
+                AsyncCHATApi.generate_script_stream.
+            output_file_path (str): Where to save the track.
+            voice (str, optional): The voice to use. Defaults to "alloy".
+            model (str, optional): The TTS model. Defaults to "tts-1".
+            response_format (str, optional): The audio format. Defaults to "mp3".
+            refresh (bool, optional): Synthesize again even if a sentence is cached.
+                Defaults to False.
+
+        Returns:
+            str: The path of the saved track, or None if the speech could not be created.
+        """
+        directory = segment_dir(output_file_path)
+        with speech_errors(directory):
+            tasks = []
+            try:
+                async for sentence in sentences:
+                    segment_path = os.path.join(directory,
+                                                f"{len(tasks):04d}.{response_format}")
+                    tasks.append(asyncio.create_task(self.audio_speech_create(
+                        sentence, segment_path, voice, model=model,
+                        response_format=response_format, refresh=refresh)))
+            except BaseException:
+                # The sentences stopped arriving, so the clips are removed with the
+                # directory: stop the requests writing them
+                for task in tasks:
+                    task.cancel()
+                raise
+            paths = await asyncio.gather(*tasks)
+            if not all_sentences_spoken(paths):
+                return None
+            await asyncio.to_thread(concat_audio, paths, output_file_path)
+            return output_file_path
+        return None
@@ -12,15 +12,37 @@ Modules Imported:
 - OpenAI: The main OpenAI client for interacting with the API.
 - OpenAiClient: A custom client class for OpenAI interactions.
 - APIError, RequestError: Custom exception classes for handling specific API-related errors.
+- JobStore: The durable backlog of titles.
+- ResponseCache: The opt-in persistent cache of chat completions.
+- TitleIndex: The index of every title produced, used to reject near-duplicates.
+- SentenceSplitter: Cuts a streamed script into sentences.
+- cached_completion, completion_arguments, completion_content, script_stream_errors:
+    Completion caching, requests and script stream errors shared with AsyncCHATApi.
+- instrumented: Times completions as the "chat" stage.
 
 Classes:
     CHATApi: A class to handle the generation of YouTube short 
         scripts and titles using the OpenAI API.
 
+Functions:
+    script_messages: Builds the chat messages asking for a script.
+    title_messages: Builds the chat messages asking for titles.
+    parse_titles: Splits a title completion into titles.
+    bulk_title_messages: Builds the chat messages asking for a JSON list of titles.
+    parse_title_json: Reads the titles from a JSON title completion.
+    queue_new_titles: Queues the titles that are not duplicates.
+
+Titles are kept in a JobStore so parallel workers can claim them from one backlog
+without taking the same title twice. Before titles are queued they are checked against a
+TitleIndex of every title ever produced, and repeats or near-repeats are dropped. Titles
+left in the legacy youtube_titles.txt file are imported into the store the first time it
+is opened.
+
 Usage:
     api_client = OpenAiClient()
     chat_api = CHATApi(api_client)
     chat_api.chat_completions_title_create(topic="Artificial Intelligence")
+    chat_api.generate_titles("Stoicism", count=50)
     chat_api.chat_completions_script_create()
 """
 import json
@@ -30,15 +52,154 @@ import logging
 from openai import OpenAI
 from openai_api.openai_client import OpenAiClient
 from openai_api.exceptions import APIError, RequestError
+from openai_api.job_store import JobStore
+from openai_api.response_cache import ResponseCache
+from openai_api.title_index import TitleIndex
+from openai_api.streaming import SentenceSplitter
+from openai_api.api.shared import (cached_completion, completion_arguments, completion_content,
+                                   script_stream_errors)
+from instrumentation import instrumented
+
+MODEL = "gpt-4o-mini"
+
+def script_messages(title):
+    """
+    Builds the chat messages asking for a YouTube short script.
+
+    Args:
+        title (str): The title of the short.
+
+    Returns:
+        list: The chat messages.
+    """
+    return [
+        {
+            "role": "system",
+            "content": "You are a skilled scriptwriter for YouTube shorts, \
+            focusing on engaging and informative content."
+        },
+        {
+            "role": "user",
+            "content": f"Write a 20-30 second YouTube short related to '{title}'. \
+                Do not include headings like 'Hook', 'Beginning', 'Middle', 'End'- \
+                just the script. Do not quote anyone in the script. \
+                The ending should be an open-ended question."
+        }
+    ]
+
+def title_messages(topic):
+    """
+    Builds the chat messages asking for YouTube short titles.
+
+    Args:
+        topic (str): The topic of the titles.
+
+    Returns:
+        list: The chat messages.
+    """
+    return [
+        {"role": "system", "content": "You are an expert in SEO and content creation, \
+            specializing in generating catchy and engaging YouTube short titles that \
+            attract viewers and rank well on search engines."},
+        {"role": "user", "content": f"Provide a list of YouTube short titles \
+            focused on {topic}, with no introductory or \
+            closing remarks, and without numbering the titles."}
+    ]
+
+def parse_titles(content):
+    """
+    Splits a title completion into titles.
+
+    Args:
+        content (str): The completion content, one title per line.
+
+    Returns:
+        list: The titles.
+    """
+    titles = content.strip()
+    titles = titles.replace('-', '').replace('  ', ' ')
+    return titles.splitlines()
+
+def bulk_title_messages(topic, count):
+    """
+    Builds the chat messages asking for a JSON object listing YouTube short titles.
+
+    Args:
+        topic (str): The topic of the titles.
+        count (int): How many titles to ask for.
+
+    Returns:
+        list: The chat messages.
+    """
+    return [
+        {"role": "system", "content": "You are an expert in SEO and content creation, \
+            specializing in generating catchy and engaging YouTube short titles that \
+            attract viewers and rank well on search engines. You answer in JSON."},
+        {"role": "user", "content": f"Provide {count} distinct YouTube short titles \
+            focused on {topic}. Each title must cover a different angle. Answer with a \
+            JSON object of the form {{\"titles\": [\"first title\", \"second title\"]}} \
+            and nothing else."}
+    ]
 
-class CHATApi:
+def parse_title_json(content):
+    """
+    Reads the titles from a JSON title completion.
+
+    Args:
+        content (str): The completion content, a JSON object with a "titles" list.
+
+    Returns:
+        list: The non-blank titles, stripped.
+
+    Raises:
+        ValueError: If the content is not a JSON object with a list of strings under
+            "titles". json.JSONDecodeError is a ValueError.
+    """
+    data = json.loads(content)
+    titles = data.get("titles") if isinstance(data, dict) else None
+    if not isinstance(titles, list) or not all(isinstance(t, str) for t in titles):
+        raise ValueError("Expected a JSON object with a list of strings under 'titles'")
+    return [title.strip() for title in titles if title.strip()]
+
+def queue_new_titles(title_index, job_store, titles):
+    """
+    Queues the titles that do not repeat or nearly repeat an indexed title. The index
+    and the backlog are separate databases, so if queueing fails the titles are taken
+    out of the index again rather than being rejected as duplicates forever.
+
+    Args:
+        title_index (TitleIndex): The index of every title produced so far.
+        job_store (JobStore): The backlog the new titles are queued in.
+        titles (iterable): The candidate titles.
+
+    Returns:
+        list: The titles queued.
+    """
+    titles = list(titles)
+    accepted = title_index.add_new(titles)
+    rejected = sum(1 for title in titles if title and title.strip()) - len(accepted)
+    if rejected:
+        logging.info("Rejected %d duplicate titles", rejected)
+    try:
+        job_store.add_titles(accepted)
+    except Exception:
+        title_index.remove(accepted)
+        raise
+    return accepted
+
+class CHATApi: # pylint: disable=R0902:too-many-instance-attributes
     """
     A class to interact with the OpenAI API for generating YouTube short scripts and titles.
 
     Attributes:
         api_client (OpenAI): The client for interacting with OpenAI API.
-        titles_file_path (str): The file path for storing YouTube titles.
+        titles_file_path (str): The legacy file path for storing YouTube titles.
         output_file_path (str): The file path for storing YouTube scripts.
+        job_store (JobStore): The backlog titles are queued in and claimed from.
+        current_job (Job): The job claimed by the last chat_completions_script_create call.
+        title_index (TitleIndex): Every title produced so far, for rejecting duplicates.
+        response_cache (ResponseCache): The completion cache, or None when caching is off.
+        rate_limiter (RateLimiter): The rate limiter requests go through.
     """
 
     def __init__(self, api_client: OpenAiClient = None):
@@ -53,10 +214,34 @@ class CHATApi:
             print("api_client is None")
             return
         self.api_client: OpenAI = api_client.client
+        self.rate_limiter = api_client.rate_limiter
         self.titles_file_path = os.path.join(api_client.configuration.temp_dir,
                                             "youtube_titles.txt")
         self.output_file_path = os.path.join(api_client.configuration.temp_dir,
                                             "youtube_scripts.json")
+        self.job_store = JobStore(os.path.join(api_client.configuration.temp_dir,
+                                               "jobs.sqlite3"))
+        self.current_job = None
+        self.response_cache = ResponseCache.from_configuration(api_client.configuration)
+        self.import_legacy_titles()
+        self.title_index = TitleIndex.from_configuration(api_client.configuration,
+                                                         self.job_store)
+
+    def import_legacy_titles(self):
+        """
+        Moves any titles left in the legacy titles file into the job store.
+
+        The file is renamed once imported so its titles are only queued once.
+        """
+        if not os.path.exists(self.titles_file_path):
+            return
+        try:
+            with open(self.titles_file_path, 'r', encoding='utf-8') as file:
+                added = self.job_store.add_titles(file.readlines())
+            os.replace(self.titles_file_path, f"{self.titles_file_path}.imported")
+            logging.info("Imported %d titles from %s", added, self.titles_file_path)
+        except IOError as e:
+            logging.error("IOError while importing titles from %s: %s", self.titles_file_path, e)
 
     def read_and_remove_first_line(self, file_path):
         """
@@ -92,35 +277,46 @@ class CHATApi:
             logging.error("Unexpected error while processing file %s: %s", file_path, e)
             raise
 
-    def generate_script(self, title):
+    @instrumented("chat")
+    def create_completion(self, messages, model=MODEL, refresh=False,
+                          bypass_cache=False, **params):
+        """
+        Creates a chat completion, serving it from the response cache when possible.
+
+        Args:
+            messages (list): The chat messages.
+            model (str, optional): The model name. Defaults to "gpt-4o-mini".
+            refresh (bool, optional): Skip the cached response but store the new one.
+                Defaults to False.
+            bypass_cache (bool, optional): Neither read nor write the cache.
+                Defaults to False.
+            **params: Sampling parameters passed to the API (temperature, top_p, ...).
+
+        Returns:
+            str: The content of the first choice.
+        """
+        cache = None if bypass_cache else self.response_cache
+        key, content = cached_completion(cache, model, messages, refresh, **params)
+        if content is not None:
+            return content
+        response = self.rate_limiter.call("chat", self.api_client.chat.completions.create,
+                                          **completion_arguments(messages, model, **params))
+        return completion_content(response, cache, key)
+
+    def generate_script(self, title, refresh=False):
         """
         Generates a YouTube short script based on a given title.
 
         Args:
             title (str): The title for which the script is to be generated.
+            refresh (bool, optional): Ignore a cached script for the title. Defaults to False.
 
         Returns:
             str: The generated script.
         """
         try:
-            response = self.api_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages = [
-                    {
-                        "role": "system",
-                        "content": "You are a skilled scriptwriter for YouTube shorts, \
-                        focusing on engaging and informative content."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Write a 20-30 second YouTube short related to '{title}'. \
-                            Do not include headings like 'Hook', 'Beginning', 'Middle', 'End'- \
-                            just the script. Do not quote anyone in the script. \
-                            The ending should be an open-ended question."
-                    }
-                ]
-            )
-            return response.choices[0].message.content.strip()
+            content = self.create_completion(script_messages(title), refresh=refresh)
+            return content.strip()
         except APIError as e:
             logging.error("API error while generating script: %s", e)
             raise
@@ -131,20 +327,76 @@ class CHATApi:
             logging.error("Unexpected error while generating script: %s", e)
             raise
 
+    @instrumented("chat")
+    def generate_script_stream(self, title, refresh=False):
+        """
+        Streams a YouTube short script for a title, one sentence at a time.
+
+        Sentences are yielded as soon as the completion has produced them, so speech can
+        be synthesized while the rest of the script is still being written. The full
+        script is stored in the response cache like generate_script's.
+
+        Args:
+            title (str): The title for which the script is to be generated.
+            refresh (bool, optional): Ignore a cached script for the title. Defaults to False.
+
+        Yields:
+            str: The next sentence of the script.
+
+        Raises:
+            APIError: If the completion request or its stream fails.
+        """
+        messages = script_messages(title)
+        splitter = SentenceSplitter()
+        key, content = cached_completion(self.response_cache, MODEL, messages, refresh)
+        if content is not None:
+            yield from splitter.feed(content.strip() + " ")
+            yield from splitter.flush()
+            return
+
+        parts = []
+        with script_stream_errors():
+            stream = self.rate_limiter.call("chat", self.api_client.chat.completions.create,
+                                            **completion_arguments(messages, MODEL, stream=True))
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield from splitter.feed(delta)
+        yield from splitter.flush()
+        if key is not None:
+            self.response_cache.put(key, "".join(parts))
+
     def chat_completions_script_create(self):
         """
-        Reads a title from the titles file, generates a script, and saves it to a JSON file.
+        Claims a title from the job store, generates a script, and saves it to a JSON file.
+
+        The claimed job is kept in current_job with the script recorded as an artifact.
+        The caller marks it done or failed in job_store once the video is made, or failed
+        when None is returned for it; if it never does, the lease expires and the title is
+        claimed again. A job claimed again keeps the script recorded by its earlier attempt
+        instead of generating a new one.
         """
-        title = self.read_and_remove_first_line(self.titles_file_path)
-        if not title:
+        job = self.job_store.claim()
+        self.current_job = job
+        if job is None:
             print("All titles have been processed.")
             return
+        title = job.title
+        if job.artifacts.get("script"):
+            print(f"Resuming title: {title}")
+            return job.artifacts["script"]
 
-        script = self.generate_script(title)
+        try:
+            script = self.generate_script(title)
+        except Exception as e:
+            self.job_store.mark_failed(job.job_id, e, worker=job.worker)
+            raise
         if not script:
             print(f"Failed to generate a script for the title: {title}")
             return
 
+        self.job_store.record_artifacts(job.job_id, {"script": script})
         data = {"title": title, "script": script}
 
         try:
@@ -158,30 +410,22 @@ class CHATApi:
         except Exception as e: # pylint: disable=W0718:broad-exception-caught
             logging.error("Unexpected error while writing to file %s: %s", self.output_file_path, e)
 
-    def chat_completions_title_create(self, topic=None):
+    def chat_completions_title_create(self, topic=None, refresh=False):
         """
-        Generates a list of YouTube short titles based on a given topic and saves them to a file.
+        Generates a list of YouTube short titles based on a given topic and queues them
+        in the job store.
 
         Args:
             topic (str, optional): The topic for generating titles.
             If None, logs an error and returns.
+            refresh (bool, optional): Ignore cached titles for the topic. Defaults to False.
         """
         if topic is None:
             logging.error("No topic provided.")
             return
 
         try:
-            completion = self.api_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are an expert in SEO and content creation, \
-                        specializing in generating catchy and engaging YouTube short titles that \
-                        attract viewers and rank well on search engines."},
-                    {"role": "user", "content": f"Provide a list of YouTube short titles \
-                        focused on {topic}, with no introductory or \
-                        closing remarks, and without numbering the titles."}
-                ]
-            )
+            content = self.create_completion(title_messages(topic), refresh=refresh)
         except APIError as e:
             logging.error("API error while generating titles: %s", e)
             raise
@@ -192,15 +436,58 @@ class CHATApi:
             logging.error("JSON decoding error: %s", e)
             raise
 
-        # Extract the generated content
-        titles = completion.choices[0].message.content.strip()
-        titles = titles.replace('-', '').replace('  ', ' ')
-
         try:
-            with open(self.titles_file_path, "a", encoding='utf-8') as file:
-                file.write(titles + "\n")
-            print("Titles saved to youtube_titles.txt")
-        except IOError as e:
-            logging.error("IOError while writing to file %s: %s", self.titles_file_path, e)
+            added = len(self.queue_titles(parse_titles(content)))
+            print(f"{added} titles saved to the job store")
         except Exception as e: # pylint: disable=W0718:broad-exception-caught
-            logging.error("Unexpected error while writing to file %s: %s", self.titles_file_path, e)
+            logging.error("Unexpected error while saving titles to %s: %s",
+                          self.job_store.db_path, e)
+
+    def queue_titles(self, titles):
+        """
+        Queues the titles that do not repeat or nearly repeat a title produced before.
+
+        Args:
+            titles (iterable): The candidate titles.
+
+        Returns:
+            list: The titles queued.
+        """
+        return queue_new_titles(self.title_index, self.job_store, titles)
+
+    def generate_titles(self, topic, count=20):
+        """
+        Generates titles on a topic in bulk as structured JSON and queues the new ones.
+
+        The completion is never served from the response cache: a cached answer would
+        only repeat titles that are already indexed.
+
+        Args:
+            topic (str): The topic for generating titles.
+            count (int, optional): How many titles to ask for. Defaults to 20.
+
+        Returns:
+            list: The titles queued, which may be fewer than count once duplicates are
+            rejected.
+
+        Raises:
+            ValueError: If the completion is not the expected JSON.
+        """
+        messages = bulk_title_messages(topic, count)
+        try:
+            content = self.create_completion(
+                messages, bypass_cache=True, response_format={"type": "json_object"},
+                max_tokens=max(256, 40 * count))
+        except APIError as e:
+            logging.error("API error while generating titles: %s", e)
+            raise
+        except RequestError as e:
+            logging.error("Request error while generating titles: %s", e)
+            raise
+
+        try:
+            titles = parse_title_json(content)
+        except ValueError as e:
+            logging.error("Malformed title JSON: %s", e)
+            raise
+        return self.queue_titles(titles[:count])
@@ -0,0 +1,178 @@
+# coding: utf-8
+"""
+This module holds the request handling shared by the synchronous APIs and their asyncio
+counterparts: serving chat completions and speech from their caches, building the
+arguments of a completion request, storing its result, and logging the errors of a
+streamed script and those that make speech creation return None. The APIs only differ in
+how they wait for the request.
+
+Modules Imported:
+- contextlib: Standard library used to build the error handling context manager.
+- logging: Standard library for logging error and informational messages.
+- shutil: Standard library for removing the sentence clips of streamed speech.
+- subprocess: Standard library error raised when stitching fails.
+- APIError: OpenAI error class for handling API interactions.
+- exceptions: The package's own error classes, raised for a failed script stream.
+- estimate_chat_tokens: Token estimate reserved from the rate limiter before each request.
+- instrumentation: Counts cache hits and bytes received.
+
+Functions:
+    cached_completion: Looks a chat completion up in the response cache.
+    completion_arguments: Returns the arguments of a chat completion request.
+    completion_content: Returns the content of a completion and caches it.
+    cached_speech: Looks speech up in the audio cache.
+    all_sentences_spoken: Checks that every sentence of streamed speech was synthesized.
+    script_stream_errors: Logs the API errors of a streamed script.
+    speech_errors: Logs and suppresses the errors of speech creation.
+
+Usage:
+    key, content = cached_completion(cache, model, messages, refresh)
+    if content is None:
+        response = rate_limiter.call("chat", client.chat.completions.create,
+                                     **completion_arguments(messages, model))
+        content = completion_content(response, cache, key)
+"""
+
+from __future__ import absolute_import
+import contextlib
+import logging
+import shutil
+import subprocess
+
+from openai import APIError
+from openai_api import exceptions
+from openai_api.rate_limiter import estimate_chat_tokens
+import instrumentation
+
+def cached_completion(cache, model, messages, refresh=False, **params):
+    """
+    Looks a chat completion up in the response cache, counting a hit.
+
+    Args:
+        cache (ResponseCache): The response cache, or None when caching is off.
+        model (str): The model name.
+        messages (list): The chat messages.
+        refresh (bool, optional): Skip the cached response. Defaults to False.
+        **params: The sampling parameters of the request.
+
+    Returns:
+        tuple: (key, content), the key to store the completion under, None without a
+        cache, and the cached content, None on a miss.
+    """
+    if cache is None:
+        return None, None
+    key, content = cache.lookup(model, messages, refresh, **params)
+    if content is not None:
+        instrumentation.record(cache_hits=1)
+    return key, content
+
+def completion_arguments(messages, model, **params):
+    """
+    Returns the arguments of a chat completion request, with the token estimate the
+    rate limiter reserves for it.
+
+    Args:
+        messages (list): The chat messages.
+        model (str): The model name.
+        **params: Parameters passed to the API (temperature, stream, ...).
+
+    Returns:
+        dict: Keyword arguments for OpenAiClient.request or AsyncOpenAiClient.request.
+    """
+    return dict(params, tokens=estimate_chat_tokens(messages, params.get("max_tokens")),
+                model=model, messages=messages)
+
+def completion_content(response, cache=None, key=None):
+    """
+    Returns the content of the first choice of a completion, storing it in the cache.
+
+    Args:
+        response (ChatCompletion): The completion.
+        cache (ResponseCache, optional): The response cache, or None when caching is off.
+        key (str, optional): The key returned by cached_completion.
+
+    Returns:
+        str: The content.
+    """
+    content = response.choices[0].message.content
+    instrumentation.record(bytes_in=len(content.encode("utf-8")))
+    if cache is not None and key is not None:
+        cache.put(key, content)
+    return content
+
+def cached_speech(audio_cache, text, voice, model, response_format, *, refresh=False): # pylint: disable=R0913:too-many-arguments
+    """
+    Looks speech up in the audio cache, counting a hit.
+
+    Args:
+        audio_cache (AudioCache): The audio cache, or None when caching is off.
+        text (str): The text spoken.
+        voice (str): The voice.
+        model (str): The TTS model.
+        response_format (str): The audio format.
+        refresh (bool, optional): Skip the cached audio. Defaults to False.
+
+    Returns:
+        tuple: (key, cached_path), the key to store the audio under, None without a
+        cache, and the path of the cached audio, None on a miss.
+    """
+    if audio_cache is None:
+        return None, None
+    key, cached_path = audio_cache.lookup(text, voice, model, response_format, refresh)
+    if cached_path is not None:
+        instrumentation.record(cache_hits=1)
+    return key, cached_path
+
+def all_sentences_spoken(paths):
+    """
+    Checks that every sentence of streamed speech was synthesized, logging the failures.
+
+    Args:
+        paths (list): The clip of each sentence, None where synthesis failed.
+
+    Returns:
+        bool: True if there is at least one sentence and none failed.
+    """
+    if not paths or None in paths:
+        logging.error("Speech creation failed for %d of %d sentences",
+                      paths.count(None), len(paths))
+        return False
+    return True
+
+@contextlib.contextmanager
+def script_stream_errors():
+    """
+    Logs the API errors of a streamed script and raises them as the package's APIError.
+    The stream is read by the TTS API, whose speech_errors would otherwise report them as
+    speech errors and stitch the sentences received so far.
+
+    Raises:
+        openai_api.exceptions.APIError: If the completion request or its stream fails.
+    """
+    try:
+        yield
+    except APIError as e:
+        logging.error("API error while streaming script: %s", e)
+        raise exceptions.APIError(f"Script stream failed: {e}") from e
+
+@contextlib.contextmanager
+def speech_errors(directory=None):
+    """
+    Logs and suppresses the API, stitching and file errors of speech creation, so the
+    code after the with block can return None.
+
+    Args:
+        directory (str, optional): The sentence clip directory of streamed speech,
+            removed on the way out.
+    """
+    try:
+        yield
+    except APIError as e:
+        logging.error("API error during speech creation: %s", e)
+    except subprocess.CalledProcessError as e:
+        logging.error("Failed to stitch speech audio: %s", e.stderr)
+    except (IOError, OSError) as e:
+        logging.error("File handling error: %s", e)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -3,7 +3,9 @@ This module provides a client class, STTApi, for interacting with the OpenAI API
 audio files into text. It includes functionalities to set up file paths for input and output, 
 handle audio file processing, and manage errors during transcription operations. The module 
 utilizes the OpenAI API for generating transcriptions and outputs detailed JSON files containing 
-the transcription text and word-level timing information.
+the transcription text and word-level timing information. When the script that was spoken is
+known, the word timings are computed locally by aligning the script against the audio, and
+Whisper is only called when the alignment is not confident.
 
 Modules Imported:
 - os: Standard library for interacting with the operating system.
@@ -11,10 +13,17 @@ Modules Imported:
 - logging: Standard library for logging error and informational messages.
 - OpenAI, APIError: OpenAI library and specific error class for handling API interactions.
 - OpenAiClient: Custom client class for managing OpenAI API sessions.
+- align_script: Local alignment of a known script against its speech.
+- instrumentation: Times transcription as the "stt" stage and counts uploaded bytes.
 
 Classes:
     STTApi: A class to handle speech-to-text conversion using the OpenAI API.
 
+Functions:
+    whisper_transcription: Converts a Whisper response into transcription data.
+    aligned_transcription: Builds transcription data by aligning a known script.
+    save_transcription: Saves transcription data to a JSON file.
+
 Usage:
     api_client = OpenAiClient()
     stt_api = STTApi(api_client)
@@ -25,6 +34,76 @@ import json
 import logging
 from openai import OpenAI, APIError
 from openai_api.openai_client import OpenAiClient
+from openai_api.alignment import align_script
+import instrumentation
+from instrumentation import instrumented
+
+def whisper_transcription(transcription_response):
+    """
+    Converts a verbose Whisper response into transcription data.
+
+    Args:
+        transcription_response: The verbose_json transcription with word timestamps.
+
+    Returns:
+        dict: The transcription text, words and duration.
+    """
+    transcription_data = {
+        "transcription": transcription_response.text,
+        "words": [],
+        "duration": transcription_response.duration
+    }
+
+    for word_info in transcription_response.words:
+        transcription_data["words"].append({
+            "word": word_info["word"],
+            "start": word_info["start"],
+            "end": word_info["end"]
+        })
+    return transcription_data
+
+def aligned_transcription(script, input_file_path, min_confidence):
+    """
+    Builds transcription data by aligning a known script against its audio locally.
+
+    Args:
+        script (str): The text the audio was synthesized from.
+        input_file_path (str): The audio.
+        min_confidence (float): The confidence below which the alignment is rejected.
+
+    Returns:
+        dict: The transcription data, or None if the alignment failed or is not
+        confident enough to use.
+    """
+    try:
+        alignment = align_script(script, input_file_path)
+    except Exception as e: # pylint: disable=W0718:broad-exception-caught
+        logging.warning("Local alignment failed, falling back to Whisper: %s", e)
+        return None
+    if alignment.confidence < min_confidence:
+        logging.warning("Local alignment confidence %.2f is below %.2f, "
+                        "falling back to Whisper", alignment.confidence, min_confidence)
+        return None
+
+    instrumentation.record(local_alignments=1)
+    return {
+        "transcription": script,
+        "words": alignment.words,
+        "duration": alignment.duration,
+        "alignment": {"method": "local", "confidence": alignment.confidence}
+    }
+
+def save_transcription(transcription_data, output_file_path):
+    """
+    Saves transcription data to a JSON file.
+
+    Args:
+        transcription_data (dict): The transcription data.
+        output_file_path (str): Where to save it.
+    """
+    with open(output_file_path, "w", encoding="utf-8") as json_file:
+        json.dump(transcription_data, json_file, indent=4)
+    print(f"Transcription data saved to {output_file_path}")
 
 class STTApi: # pylint: disable=R0903:too-few-public-methods
     """
@@ -33,6 +112,7 @@ class STTApi: # pylint: disable=R0903:too-few-public-methods
     Attributes:
         api_client (OpenAI): The client for interacting with OpenAI API.
         output_transcription_file_path (str): The file path for storing transcription data.
+        rate_limiter (RateLimiter): The rate limiter requests go through.
     """
 
     def __init__(self, api_client: OpenAiClient = None):
@@ -55,46 +135,55 @@ class STTApi: # pylint: disable=R0903:too-few-public-methods
             api_client.configuration.temp_dir,
             "transcription.json"
         )
+        self.rate_limiter = api_client.rate_limiter
 
-    def audio_transcriptions_create(self):
+    @instrumented("stt")
+    def audio_transcriptions_create(self, input_file_path=None, output_file_path=None,
+                                    script=None, min_confidence=0.6):
         """
         Creates a transcription from an audio file using the OpenAI API.
 
+        Args:
+            input_file_path (str, optional): The audio to transcribe. Defaults to
+                input_speech_file_path.
+            output_file_path (str, optional): Where to save the transcription JSON.
+                Defaults to output_transcription_file_path.
+            script (str, optional): The text the audio was synthesized from. When given,
+                the words are aligned locally instead of uploading the audio to Whisper.
+            min_confidence (float, optional): The alignment confidence below which
+                Whisper is used anyway. Defaults to 0.6.
+
         Returns:
-            None
+            tuple: (transcription_data, duration), or None if the transcription failed.
         """
+        input_file_path = input_file_path or self.input_speech_file_path
+        output_file_path = output_file_path or self.output_transcription_file_path
+        if script:
+            transcription_data = aligned_transcription(script, input_file_path, min_confidence)
+            if transcription_data is not None:
+                save_transcription(transcription_data, output_file_path)
+                return transcription_data, transcription_data["duration"]
+
         try:
-            with open(self.input_speech_file_path, "rb") as audio_file:
-                transcription_response = self.api_client.audio.transcriptions.create(
-                    file=audio_file,
-                    model="whisper-1",
-                    response_format="verbose_json",
-                    timestamp_granularities=["word"]
-                )
+            with open(input_file_path, "rb") as audio_file:
+                audio = audio_file.read()
+            instrumentation.record(bytes_out=len(audio))
+            # The audio is passed as bytes so a retried request can send it again
+            transcription_response = self.rate_limiter.call(
+                "transcriptions", self.api_client.audio.transcriptions.create,
+                file=(os.path.basename(input_file_path), audio),
+                model="whisper-1",
+                response_format="verbose_json",
+                timestamp_granularities=["word"]
+            )
 
             # Extract transcription and word timing information
-            transcription_data = {
-                "transcription": transcription_response.text,
-                "words": [],
-                "duration": transcription_response.duration
-            }
-
-            for word_info in transcription_response.words:
-                transcription_data["words"].append({
-                    "word": word_info["word"],
-                    "start": word_info["start"],
-                    "end": word_info["end"]
-                })
-
-            # Save data to JSON file
-            with open(self.output_transcription_file_path, "w", encoding="utf-8") as json_file:
-                json.dump(transcription_data, json_file, indent=4)
-            print(f"Transcription data saved to {self.output_transcription_file_path}")
-
+            transcription_data = whisper_transcription(transcription_response)
+            save_transcription(transcription_data, output_file_path)
             return transcription_data, transcription_response.duration
         
         except FileNotFoundError:
-            logging.error("Audio file not found: speech.mp3")
+            logging.error("Audio file not found: %s", input_file_path)
         except APIError as e:
             logging.error("API error during transcription: %s", e)
         except json.JSONDecodeError as e:
@@ -103,3 +192,4 @@ class STTApi: # pylint: disable=R0903:too-few-public-methods
             logging.error("File handling error: %s", e)
         except Exception as e: # pylint: disable=W0718:broad-exception-caught
             logging.error("Unexpected error during transcription: %s", e)
+        return None
@@ -8,8 +8,16 @@ in a specified file format.
 Modules Imported:
 - os: Standard library for interacting with the operating system, particularly for file paths.
 - logging: Standard library for logging error and informational messages.
-- OpenAI, APIError: OpenAI library and specific error class for handling API interactions.
+- OpenAI: OpenAI library for handling API interactions.
+- shutil: Standard library for copying cached audio to the output path.
 - OpenAiClient: Custom client class for managing OpenAI API sessions.
+- AudioCache: Content-addressed cache of synthesized speech.
+- ThreadPoolExecutor: Pool running the per-sentence requests of streamed speech.
+- concat_audio, segment_dir: Stitching of the sentence clips of streamed speech.
+- contextvars: Standard library used to keep the job and span in the pool threads.
+- cached_speech, all_sentences_spoken, speech_errors: Speech caching and error handling
+    shared with AsyncTTSApi.
+- instrumentation: Times speech as the "tts" stage and counts bytes.
 
 Classes:
     TTSApi: A class to handle text-to-speech conversion using the OpenAI API.
@@ -20,9 +28,17 @@ Usage:
     tts_api.audio_speech_create("Hello, world!")
 """
 import os
+import contextvars
 import logging
-from openai import OpenAI, APIError
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI
 from openai_api.openai_client import OpenAiClient
+from openai_api.audio_cache import AudioCache
+from openai_api.streaming import concat_audio, segment_dir
+from openai_api.api.shared import all_sentences_spoken, cached_speech, speech_errors
+import instrumentation
+from instrumentation import instrumented
 
 class TTSApi: #pylint: disable=R0903:too-few-public-methods
     """
@@ -31,6 +47,8 @@ class TTSApi: #pylint: disable=R0903:too-few-public-methods
     Attributes:
         api_client (OpenAI): The client for interacting with OpenAI API.
         output_speech_file_path (str): The file path for storing the generated speech audio.
+        audio_cache (AudioCache): The cache of synthesized speech, or None when caching is off.
+        rate_limiter (RateLimiter): The rate limiter requests go through.
     """
 
     def __init__(self, api_client: OpenAiClient = None):
@@ -49,31 +67,100 @@ class TTSApi: #pylint: disable=R0903:too-few-public-methods
             api_client.configuration.temp_dir,
             "speech.mp3"
         )
+        self.audio_cache = AudioCache.from_configuration(api_client.configuration)
+        self.rate_limiter = api_client.rate_limiter
 
-    def audio_speech_create(self, text: str, voice: str = "alloy"):
+    @instrumented("tts")
+    def audio_speech_create(self, text: str, voice: str = "alloy", # pylint: disable=R0913:too-many-arguments
+                            output_file_path: str = None, *, model: str = "tts-1",
+                            response_format: str = "mp3", refresh: bool = False):
         """
         Creates a speech audio file from text using the OpenAI API.
 
+        Speech already synthesized for the same text, voice, model and format is copied
+        from the audio cache instead of calling the API again.
+
         Args:
             text (str): The input text to be converted to speech.
             voice (str, optional): The voice model to use for speech synthesis. Defaults to "alloy".
+            output_file_path (str, optional): Where to save the audio. Defaults to
+                output_speech_file_path.
+            model (str, optional): The TTS model. Defaults to "tts-1".
+            response_format (str, optional): The audio format. Defaults to "mp3".
+            refresh (bool, optional): Synthesize again even if the audio is cached.
+                Defaults to False.
 
         Returns:
-            None
+            str: The path of the saved audio, or None if the speech could not be created.
         """
+        output_file_path = output_file_path or self.output_speech_file_path
         try:
-            response = self.api_client.audio.speech.create(
-                model="tts-1",
-                voice=voice,
-                input=text
-            )
-
-            response.stream_to_file(self.output_speech_file_path)
-            print(f"Speech audio saved to {self.output_speech_file_path}")
-
-        except APIError as e:
-            logging.error("API error during speech creation: %s", e)
-        except (IOError, OSError) as e:
-            logging.error("File handling error: %s", e)
+            with speech_errors():
+                key, cached_path = cached_speech(self.audio_cache, text, voice, model,
+                                                 response_format, refresh=refresh)
+                if cached_path is not None:
+                    shutil.copyfile(cached_path, output_file_path)
+                    print(f"Speech audio copied from cache to {output_file_path}")
+                    return output_file_path
+
+                response = self.rate_limiter.call(
+                    "speech", self.api_client.audio.speech.create,
+                    model=model,
+                    voice=voice,
+                    input=text,
+                    response_format=response_format
+                )
+
+                response.stream_to_file(output_file_path)
+                instrumentation.record(bytes_in=os.path.getsize(output_file_path))
+                if key is not None:
+                    self.audio_cache.put(key, output_file_path)
+                print(f"Speech audio saved to {output_file_path}")
+                return output_file_path
         except Exception as e: # pylint: disable=W0718:broad-exception-caught
             logging.error("Unexpected error during speech creation: %s", e)
+        return None
+
+    @instrumented("tts")
+    def audio_speech_create_streamed(self, sentences, output_file_path=None, voice="alloy", # pylint: disable=R0913:too-many-arguments
+                                     *, workers=4, model="tts-1", response_format="mp3",
+                                     refresh=False):
+        """
+        Creates one speech track from sentences that may still be arriving.
+
+        Each sentence is synthesized as soon as it is read, up to workers at a time, and
+        the clips are stitched in order once every sentence is done. Sentences are cached
+        individually, so a re-run only synthesizes the sentences that changed.
+
+        Args:
+            sentences (iterable): The sentences, in order, e.g. from generate_script_stream.
+            output_file_path (str, optional): Where to save the track. Defaults to
+                output_speech_file_path.
+            voice (str, optional): The voice to use. Defaults to "alloy".
+            workers (int, optional): The sentences synthesized concurrently. Defaults to 4.
+            model (str, optional): The TTS model. Defaults to "tts-1".
+            response_format (str, optional): The audio format. Defaults to "mp3".
+            refresh (bool, optional): Synthesize again even if a sentence is cached.
+                Defaults to False.
+
+        Returns:
+            str: The path of the saved track, or None if the speech could not be created.
+        """
+        output_file_path = output_file_path or self.output_speech_file_path
+        directory = segment_dir(output_file_path)
+        with speech_errors(directory):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # Each request runs in a copy of this context, so it is traced in this span
+                futures = [pool.submit(contextvars.copy_context().run,
+                                       self.audio_speech_create, sentence, voice,
+                                       os.path.join(directory, f"{index:04d}.{response_format}"),
+                                       model=model, response_format=response_format,
+                                       refresh=refresh)
+                           for index, sentence in enumerate(sentences)]
+                paths = [future.result() for future in futures]
+            if not all_sentences_spoken(paths):
+                return None
+            concat_audio(paths, output_file_path)
+            print(f"Speech audio of {len(paths)} sentences saved to {output_file_path}")
+            return output_file_path
+        return None
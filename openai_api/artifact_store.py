@@ -0,0 +1,291 @@
+# coding: utf-8
+"""
+This module defines the ArtifactStore class, which gives every video job its own
+workspace under Configuration.temp_dir instead of the fixed speech.mp3, transcription.json
+and video.mp4 paths. Finished intermediates are committed into a content-addressed object
+store and hard-linked back into the job's workspace, so identical files are stored once
+and shared between jobs without being copied. A garbage collector trims old workspaces
+and unreferenced objects to configured age and size limits. An object counts as
+referenced while a workspace links to it or a job manifest records its digest, so
+workspaces holding copies, on file systems without hard links, keep their objects too.
+
+Layout:
+    <temp_dir>/jobs/<job_id>/<name>        Per-job workspace.
+    <temp_dir>/objects/<aa>/<sha256><ext>  Immutable content-addressed objects.
+
+Modules Imported:
+- json: Standard library for reading the job manifests.
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- shutil: Standard library for copying and removing files.
+- time: Standard library for age-based garbage collection.
+- file_digest: SHA-256 of a file, shared with the manifests.
+- MANIFEST_FILE: The name of the manifest file in a workspace.
+
+Classes:
+    JobWorkspace: The directory holding one job's files.
+    ArtifactStore: The per-job workspaces and the shared object store.
+
+Usage:
+    store = ArtifactStore("temp")
+    workspace = store.workspace("42")
+    tts_api.audio_speech_create(script, output_file_path=workspace.output_path("speech.mp3"))
+    digest = workspace.commit("speech.mp3")
+    store.gc(max_bytes=10 * 1024 ** 3, max_age=7 * 24 * 3600)
+"""
+
+from __future__ import absolute_import
+import json
+import logging
+import os
+import shutil
+import time
+
+from openai_api.manifest import MANIFEST_FILE
+from common.storage import file_digest
+
+class JobWorkspace:
+    """
+    The directory holding one job's files.
+
+    Attributes:
+        store (ArtifactStore): The store the workspace belongs to.
+        job_id (str): The job the workspace belongs to.
+        directory (str): The path of the workspace.
+    """
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = str(job_id)
+        self.directory = os.path.join(store.jobs_dir, self.job_id)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, name):
+        """
+        Returns the path of a file in the workspace, for reading.
+
+        Args:
+            name (str): The file name.
+
+        Returns:
+            str: The path of the file.
+        """
+        return os.path.join(self.directory, name)
+
+    def output_path(self, name):
+        """
+        Returns the path of a file in the workspace, ready to be written.
+
+        Any existing file is unlinked first, so writing never modifies a committed object
+        through its hard link.
+
+        Args:
+            name (str): The file name.
+
+        Returns:
+            str: The path of the file.
+        """
+        path = self.path(name)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return path
+
+    def exists(self, name):
+        """
+        Checks whether a file exists in the workspace.
+
+        Args:
+            name (str): The file name.
+
+        Returns:
+            bool: True if the file exists.
+        """
+        return os.path.exists(self.path(name))
+
+    def commit(self, name):
+        """
+        Moves a finished file into the object store and links it back into the workspace.
+
+        If an object with the same content already exists, the workspace file is replaced
+        by a link to it.
+
+        Args:
+            name (str): The file name.
+
+        Returns:
+            str: The SHA-256 digest of the file.
+        """
+        path = self.path(name)
+        digest = file_digest(path)
+        object_path = self.store.object_path(digest, os.path.splitext(name)[1])
+        if os.path.exists(object_path):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(path, object_path)
+            os.chmod(object_path, 0o444)
+        self.store.link(object_path, path)
+        return digest
+
+    def link_object(self, digest, name):
+        """
+        Links an existing object into the workspace.
+
+        Args:
+            digest (str): The digest of the object.
+            name (str): The file name in the workspace.
+
+        Returns:
+            str: The path of the linked file.
+
+        Raises:
+            FileNotFoundError: If no object has the digest.
+        """
+        object_path = self.store.object_path(digest, os.path.splitext(name)[1])
+        if not os.path.exists(object_path):
+            raise FileNotFoundError(f"No artifact with digest {digest}")
+        path = self.output_path(name)
+        self.store.link(object_path, path)
+        return path
+
+class ArtifactStore:
+    """
+    The per-job workspaces and the shared content-addressed object store.
+
+    Attributes:
+        root (str): The directory holding the store, usually Configuration.temp_dir.
+        jobs_dir (str): The directory holding the job workspaces.
+        objects_dir (str): The directory holding the content-addressed objects.
+    """
+
+    def __init__(self, root="temp"):
+        """
+        Initializes the store and creates its directories if necessary.
+
+        Args:
+            root (str, optional): The directory holding the store. Defaults to "temp".
+        """
+        self.root = root
+        self.jobs_dir = os.path.join(root, "jobs")
+        self.objects_dir = os.path.join(root, "objects")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def workspace(self, job_id):
+        """
+        Returns the workspace of a job, creating it if necessary.
+
+        Args:
+            job_id (str): The job identifier.
+
+        Returns:
+            JobWorkspace: The job's workspace.
+        """
+        return JobWorkspace(self, job_id)
+
+    def object_path(self, digest, extension=""):
+        """
+        Returns where an object with a digest is stored.
+
+        Args:
+            digest (str): The SHA-256 digest.
+            extension (str, optional): The file extension, including the dot.
+
+        Returns:
+            str: The path of the object.
+        """
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}{extension}")
+
+    @staticmethod
+    def link(source, destination):
+        """
+        Hard-links a file, falling back to a copy where hard links are not supported.
+        A copy does not count as a link to the object, so the garbage collector relies
+        on the job manifests to keep it.
+
+        Args:
+            source (str): The existing file.
+            destination (str): The path of the link.
+        """
+        try:
+            os.link(source, destination)
+        except OSError as e:
+            logging.warning("Copying artifact %s, it cannot be hard-linked: %s", source, e)
+            shutil.copyfile(source, destination)
+
+    def _referenced_digests(self):
+        """Returns the digests recorded in the manifests of the remaining workspaces."""
+        digests = set()
+        for entry in os.scandir(self.jobs_dir):
+            if not entry.is_dir():
+                continue
+            try:
+                with open(os.path.join(entry.path, MANIFEST_FILE), "r", encoding="utf-8") as file:
+                    stages = json.load(file).get("stages", {})
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                logging.warning("Ignoring unreadable manifest of job %s: %s", entry.name, e)
+                continue
+            for stage in stages.values():
+                digests.update(stage.get("artifacts", {}).values())
+        return digests
+
+    def gc(self, max_bytes=None, max_age=None):
+        """
+        Removes old workspaces and unreferenced objects.
+
+        Workspaces untouched for longer than max_age are removed first. Objects neither
+        linked from a workspace nor recorded in the manifest of one are then removed if
+        they are older than max_age, or, oldest first, while the store is larger than
+        max_bytes.
+
+        Args:
+            max_bytes (int, optional): The size the object store is trimmed to.
+            max_age (float, optional): The age in seconds after which workspaces and
+                unreferenced objects are removed.
+
+        Returns:
+            dict: The number of workspaces and objects removed and the bytes freed.
+        """
+        now = time.time()
+        removed = {"workspaces": 0, "objects": 0, "bytes": 0}
+
+        if max_age is not None:
+            for entry in os.scandir(self.jobs_dir):
+                if entry.is_dir() and now - entry.stat().st_mtime > max_age:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed["workspaces"] += 1
+
+        referenced = self._referenced_digests()
+        objects = []
+        for directory in os.scandir(self.objects_dir):
+            if directory.is_dir():
+                objects.extend(entry for entry in os.scandir(directory.path) if entry.is_file())
+        objects.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in objects)
+
+        for entry in objects:
+            stat = entry.stat()
+            # An object linked from a workspace has more than one link, a copied one is
+            # only known from the manifests
+            if stat.st_nlink > 1 or os.path.splitext(entry.name)[0] in referenced:
+                continue
+            expired = max_age is not None and now - stat.st_mtime > max_age
+            over_budget = max_bytes is not None and total > max_bytes
+            if not (expired or over_budget):
+                continue
+            try:
+                os.chmod(entry.path, 0o644)
+                os.remove(entry.path)
+            except OSError as e:
+                logging.warning("Failed to remove artifact %s: %s", entry.path, e)
+                continue
+            total -= stat.st_size
+            removed["objects"] += 1
+            removed["bytes"] += stat.st_size
+
+        logging.info("Artifact garbage collection: %s", removed)
+        return removed
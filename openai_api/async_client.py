@@ -0,0 +1,197 @@
+# coding: utf-8
+"""
+This module defines the AsyncOpenAiClient class, the asyncio counterpart of OpenAiClient.
+Every AsyncOpenAiClient in a process shares one httpx connection pool per event loop, so
+requests reuse kept-alive connections instead of each client opening its own, and one
+semaphore per event loop and concurrency limit bounds how many requests are in flight.
+The async APIs make every call through request, which waits for the rate limiter and
+then holds the semaphore while the request is in flight. This lets a single process
+overlap hundreds of title, script and speech requests without a thread per call.
+
+Modules Imported:
+- asyncio: Standard library event loop and synchronization primitives.
+- threading: Standard library lock guarding the shared pools.
+- weakref: Standard library used to drop the pools of finished event loops.
+- httpx: HTTP client providing the connection pool.
+- AsyncOpenAI: The asynchronous OpenAI client.
+- Configuration: A custom class for managing API configuration settings.
+- RateLimiter: Per-endpoint rate limiting and retries shared by the clients of an API key.
+
+Classes:
+    AsyncOpenAiClient: An asynchronous client sharing the process-wide connection pool.
+
+Functions:
+    shared_http_client: Returns the connection pool of the running event loop.
+    close_shared_http_clients: Closes the connection pools of the running event loop.
+
+Usage:
+    async def main():
+        async with AsyncOpenAiClient(Configuration(api_key="your_api_key")) as api_client:
+            chat_api = AsyncCHATApi(api_client)
+            scripts = await asyncio.gather(*(chat_api.generate_script(t) for t in titles))
+        await close_shared_http_clients()
+"""
+
+from __future__ import absolute_import
+import asyncio
+import threading
+import weakref
+
+import httpx
+from openai import AsyncOpenAI
+
+from openai_api.configuration import Configuration
+from openai_api.rate_limiter import RateLimiter
+
+_LOCK = threading.Lock()
+_HTTP_CLIENTS = weakref.WeakKeyDictionary()
+_SEMAPHORES = weakref.WeakKeyDictionary()
+
+def _pool_key(configuration):
+    return (configuration.max_connections, configuration.max_keepalive_connections,
+            configuration.keepalive_expiry, configuration.request_timeout)
+
+def shared_http_client(configuration):
+    """
+    Returns the connection pool of the running event loop, creating it if necessary.
+
+    Connections are bound to the event loop that opened them, so each loop has its own
+    pool. Configurations with the same limits share a pool.
+
+    Args:
+        configuration (Configuration): The settings holding the pool limits.
+
+    Returns:
+        httpx.AsyncClient: The shared HTTP client.
+
+    Raises:
+        RuntimeError: If no event loop is running.
+    """
+    loop = asyncio.get_running_loop()
+    key = _pool_key(configuration)
+    with _LOCK:
+        clients = _HTTP_CLIENTS.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=configuration.max_connections,
+                    max_keepalive_connections=configuration.max_keepalive_connections,
+                    keepalive_expiry=configuration.keepalive_expiry),
+                timeout=httpx.Timeout(configuration.request_timeout, connect=10.0),
+                follow_redirects=True)
+            clients[key] = client
+        return client
+
+def _shared_semaphore(configuration):
+    """Returns the request semaphore of the running event loop for a concurrency limit."""
+    loop = asyncio.get_running_loop()
+    with _LOCK:
+        semaphores = _SEMAPHORES.setdefault(loop, {})
+        semaphore = semaphores.get(configuration.max_concurrency)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(configuration.max_concurrency)
+            semaphores[configuration.max_concurrency] = semaphore
+        return semaphore
+
+async def close_shared_http_clients():
+    """Closes the connection pools of the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _LOCK:
+        clients = list(_HTTP_CLIENTS.pop(loop, {}).values())
+    for client in clients:
+        await client.aclose()
+
+class AsyncOpenAiClient:
+    """
+    An asynchronous client for the OpenAI API sharing the process-wide connection pool.
+
+    Must be created while an event loop is running.
+
+    Attributes:
+        configuration (Configuration): Configuration settings including API key and limits.
+        client (AsyncOpenAI): The asynchronous OpenAI client.
+        semaphore (asyncio.Semaphore): Bounds the requests in flight on this event loop.
+        rate_limiter (RateLimiter): The rate limiter requests go through.
+    """
+
+    def __init__(self, configuration=None):
+        """
+        Initializes the client with a given configuration.
+
+        Args:
+            configuration (Configuration): The configuration object containing API settings.
+
+        Raises:
+            ValueError: If the configuration is None.
+            TypeError: If the configuration is not a Configuration.
+            RuntimeError: If no event loop is running.
+        """
+        self.configuration: Configuration = Configuration.require(configuration)
+        # Retries are left to the rate limiter, which also honours Retry-After
+        self.client: AsyncOpenAI = AsyncOpenAI(api_key=self.configuration.api_key,
+                                               http_client=shared_http_client(configuration),
+                                               max_retries=0)
+        self.semaphore = _shared_semaphore(configuration)
+        self.rate_limiter = RateLimiter.for_configuration(configuration)
+
+    async def __aenter__(self):
+        """
+        Enter the runtime context related to this object.
+
+        Returns:
+            AsyncOpenAiClient: The initialized client.
+        """
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """
+        Exit the runtime context related to this object.
+
+        Args:
+            exc_type (type): The exception type, if raised.
+            exc_value (Exception): The exception value, if raised.
+            traceback (Traceback): The traceback object, if an exception is raised.
+        """
+        await self.close()
+
+    async def close(self):
+        """
+        Releases the client. The shared connection pool stays open for other clients;
+        close it with close_shared_http_clients once the event loop is done with it.
+        """
+
+    async def request(self, endpoint, func, *args, tokens=0, **kwargs):
+        """
+        Makes a request through the rate limiter, holding the semaphore while it is in
+        flight but not while it waits for its rate limit budget.
+
+        Args:
+            endpoint (str): The endpoint the request counts against.
+            func (callable): The async client method to call.
+            *args: Positional arguments for func.
+            tokens (int, optional): The estimated tokens of the request.
+            **kwargs: Keyword arguments for func.
+
+        Returns:
+            The result of func.
+        """
+        async def bounded(*args, **kwargs):
+            async with self.semaphore:
+                return await func(*args, **kwargs)
+        return await self.rate_limiter.acall(endpoint, bounded, *args, tokens=tokens, **kwargs)
+
+    async def gather(self, *coroutines, return_exceptions=False):
+        """
+        Runs API coroutines concurrently. Each API call holds the semaphore while its
+        request is in flight, so at most max_concurrency of them hit the network at once.
+
+        Args:
+            *coroutines: The API calls to run.
+            return_exceptions (bool, optional): Return exceptions as results instead of
+                raising the first one. Defaults to False.
+
+        Returns:
+            list: The results, in the order of the coroutines.
+        """
+        return await asyncio.gather(*coroutines, return_exceptions=return_exceptions)
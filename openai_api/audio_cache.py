@@ -0,0 +1,215 @@
+# coding: utf-8
+"""
+This module defines the AudioCache class, a content-addressed cache of synthesized speech.
+Audio is keyed by the normalized script text, the voice, the model and the audio format,
+so re-rendering a video with a different style, background or encoder profile reuses the
+narration instead of paying for another TTS call. Files live flat in the cache directory
+and the least recently used ones are evicted once the cache grows past its size limit.
+
+Modules Imported:
+- hashlib: Standard library for deriving cache keys.
+- logging: Standard library for logging error and informational messages.
+- mmap: Standard library for memory-mapping cached audio.
+- os: Standard library for interacting with the operating system.
+- shutil: Standard library for copying audio in and out of the cache.
+- threading: Standard library for guarding the size counter.
+- unicodedata: Standard library for normalizing the text.
+- evict_least_recently_used, remove_file: Cache file handling shared with the word raster cache.
+
+Classes:
+    AudioCache: The on-disk cache of synthesized speech.
+
+Usage:
+    cache = AudioCache("temp/tts_cache")
+    key = cache.make_key(script, "alloy", "tts-1", "mp3")
+    path = cache.get(key)
+    if path is None:
+        ...  # synthesize into speech.mp3
+        path = cache.put(key, "speech.mp3")
+"""
+
+from __future__ import absolute_import
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import threading
+import unicodedata
+
+from common.storage import evict_least_recently_used, remove_file
+
+def normalize_text(text):
+    """
+    Normalizes text so trivially different scripts share a cache entry.
+
+    Unicode is put in NFC form and runs of whitespace, including newlines, are collapsed
+    to single spaces, none of which changes what the TTS model says.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized text.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+class AudioCache:
+    """
+    A content-addressed on-disk cache of synthesized speech with LRU eviction.
+
+    Attributes:
+        cache_dir (str): The directory holding the cached audio.
+        max_bytes (int): The total size of cached audio kept before evicting.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        """
+        Initializes the cache and creates its directory if necessary.
+
+        Args:
+            cache_dir (str): The directory holding the cached audio.
+            max_bytes (int, optional): The size the cache is trimmed to. Defaults to 512 MiB.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._bytes = sum(entry.stat().st_size for entry in self._entries())
+
+    @classmethod
+    def from_configuration(cls, configuration):
+        """
+        Opens the cache configured for the TTS APIs.
+
+        Args:
+            configuration (Configuration): The settings holding the cache options.
+
+        Returns:
+            AudioCache: The cache under temp_dir, or None when speech caching is off.
+        """
+        if not configuration.tts_cache:
+            return None
+        return cls(os.path.join(configuration.temp_dir, "tts_cache"),
+                   max_bytes=configuration.tts_cache_max_bytes)
+
+    @staticmethod
+    def make_key(text, voice, model, response_format):
+        """
+        Derives the cache key of a speech request.
+
+        Args:
+            text (str): The text to speak. It is normalized first.
+            voice (str): The voice name.
+            model (str): The TTS model name.
+            response_format (str): The audio format, e.g. "mp3" or "aac".
+
+        Returns:
+            str: The key, a hex digest followed by the format as file extension.
+        """
+        fields = (normalize_text(text), voice, model, response_format)
+        digest = hashlib.sha256(repr(fields).encode("utf-8")).hexdigest()
+        return f"{digest}.{response_format}"
+
+    def lookup(self, text, voice, model, response_format, refresh=False): # pylint: disable=R0913:too-many-arguments
+        """
+        Derives the key of a speech request and looks it up.
+
+        Args:
+            text (str): The text to speak.
+            voice (str): The voice name.
+            model (str): The TTS model name.
+            response_format (str): The audio format.
+            refresh (bool, optional): Skip the lookup, so the speech is synthesized again.
+                Defaults to False.
+
+        Returns:
+            tuple: (key, path), where path is None on a miss or a refresh.
+        """
+        key = self.make_key(text, voice, model, response_format)
+        return key, None if refresh else self.get(key)
+
+    def path(self, key):
+        """
+        Returns where the audio with a key is stored.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            str: The path of the cached file, which may not exist.
+        """
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        Looks up cached audio and marks it as recently used.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            str: The path of the cached file, or None on a miss.
+        """
+        path = self.path(key)
+        try:
+            # Refresh the modification time so eviction treats it as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def open(self, key):
+        """
+        Memory-maps cached audio for readers that want the bytes without copying the file.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            mmap.mmap: A read-only map of the audio, or None on a miss. The caller closes it.
+        """
+        path = self.get(key)
+        if path is None:
+            return None
+        with open(path, "rb") as file:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def put(self, key, source_path):
+        """
+        Copies a finished audio file into the cache.
+
+        Args:
+            key (str): The cache key.
+            source_path (str): The audio file to cache.
+
+        Returns:
+            str: The path of the cached file, or None if it could not be stored.
+        """
+        path = self.path(key)
+        # Several processes share the cache, and thread ids repeat across processes
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning("Failed to cache speech audio %s: %s", path, e)
+            remove_file(temp_path)
+            return None
+
+        with self._lock:
+            self._bytes += os.path.getsize(path)
+            over_budget = self._bytes > self.max_bytes
+        if over_budget:
+            self._evict()
+        return path
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.cache_dir)
+                if entry.is_file() and not entry.name.endswith(".tmp")]
+
+    def _evict(self):
+        """Removes the least recently used audio until the cache fits its budget."""
+        total = evict_least_recently_used(self._entries(), self.max_bytes * 0.9)
+        with self._lock:
+            self._bytes = total
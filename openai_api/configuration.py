@@ -29,16 +29,33 @@ from __future__ import absolute_import
 import os
 import logging
 
-class Configuration: # pylint: disable=R0903:too-few-public-methods
+class Configuration: # pylint: disable=R0902,R0903:too-many-instance-attributes,too-few-public-methods
     """
     A class to manage configuration settings for API interactions.
 
     Attributes:
         api_key (str): The API key for authenticating requests.
         temp_dir (str): The directory path for temporary storage.
+        chat_cache (bool): Whether chat completions are cached on disk.
+        chat_cache_ttl (float): How long cached completions stay valid in seconds.
+        chat_cache_max_bytes (int): The size the completion cache is trimmed to.
+        tts_cache (bool): Whether synthesized speech is cached on disk.
+        tts_cache_max_bytes (int): The size the speech cache is trimmed to.
+        max_connections (int): The size of the shared async connection pool.
+        max_keepalive_connections (int): The idle connections the pool keeps open.
+        keepalive_expiry (float): How long an idle connection is kept, in seconds.
+        max_concurrency (int): The number of async API requests allowed in flight.
+        request_timeout (float): The timeout of async API requests, in seconds.
+        rate_limits (dict): Requests and tokens per minute by endpoint, overriding the
+            defaults of the rate limiter.
+        max_retries (int): How many times a rate-limited or failed request is retried.
     """
 
-    def __init__(self, api_key=None, temp_dir="temp"):
+    def __init__(self, api_key=None, temp_dir="temp", *, chat_cache=False, # pylint: disable=R0913,R0914:too-many-arguments,too-many-locals
+                 chat_cache_ttl=None, chat_cache_max_bytes=64 * 1024 * 1024,
+                 tts_cache=True, tts_cache_max_bytes=512 * 1024 * 1024,
+                 max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0,
+                 max_concurrency=64, request_timeout=120.0, rate_limits=None, max_retries=6):
         """
         Initializes the Configuration with an API key and a temporary directory.
 
@@ -46,6 +63,31 @@ class Configuration: # pylint: disable=R0903:too-few-public-methods
             api_key (str, optional): The API key for authenticating requests. If not provided,
                                      defaults to an empty string.
             temp_dir (str, optional): The directory path for temporary storage. Defaults to "temp".
+            chat_cache (bool, optional): Whether chat completions are cached on disk, keyed
+                by model, messages and sampling parameters. Defaults to False.
+            chat_cache_ttl (float, optional): How long cached completions stay valid in
+                seconds. Defaults to None, meaning they never expire.
+            chat_cache_max_bytes (int, optional): The size the completion cache is trimmed
+                to. Defaults to 64 MiB.
+            tts_cache (bool, optional): Whether synthesized speech is cached on disk,
+                keyed by text, voice, model and format. Defaults to True.
+            tts_cache_max_bytes (int, optional): The size the speech cache is trimmed to.
+                Defaults to 512 MiB.
+            max_connections (int, optional): The size of the connection pool shared by the
+                async APIs. Defaults to 100.
+            max_keepalive_connections (int, optional): The idle connections the pool keeps
+                open for reuse. Defaults to 20.
+            keepalive_expiry (float, optional): How long an idle connection is kept, in
+                seconds. Defaults to 30.
+            max_concurrency (int, optional): The number of async API requests allowed in
+                flight at once. Defaults to 64.
+            request_timeout (float, optional): The timeout of async API requests, in
+                seconds. Defaults to 120.
+            rate_limits (dict, optional): (requests per minute, tokens per minute) by
+                endpoint ("chat", "speech", "transcriptions"), overriding the defaults in
+                rate_limiter.DEFAULT_RATE_LIMITS. Defaults to None.
+            max_retries (int, optional): How many times a rate-limited or failed request is
+                retried with backoff. Defaults to 6.
 
         Raises:
             Exception: If the temporary directory cannot be created or accessed.
@@ -55,8 +97,48 @@ class Configuration: # pylint: disable=R0903:too-few-public-methods
 
         # Storage
         self.temp_dir = temp_dir
+
+        # Caching
+        self.chat_cache = chat_cache
+        self.chat_cache_ttl = chat_cache_ttl
+        self.chat_cache_max_bytes = chat_cache_max_bytes
+        self.tts_cache = tts_cache
+        self.tts_cache_max_bytes = tts_cache_max_bytes
+
+        # Connection pool
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+
+        # Rate limiting
+        self.rate_limits = rate_limits
+        self.max_retries = max_retries
         try:
             os.makedirs(self.temp_dir, exist_ok=True)
         except Exception as e:
             logging.error("Failed to create or access the temporary directory: %s", e)
             raise
+
+    @staticmethod
+    def require(configuration):
+        """
+        Checks the configuration a client is created with.
+
+        Args:
+            configuration (Configuration): The configuration passed to the client.
+
+        Returns:
+            Configuration: The configuration.
+
+        Raises:
+            ValueError: If the configuration is None.
+            TypeError: If the configuration is not a Configuration.
+        """
+        if configuration is None:
+            raise ValueError("Configuration must be provided and contain necessary API settings.")
+
+        if not isinstance(configuration, Configuration):
+            raise TypeError("Invalid configuration type provided.")
+        return configuration
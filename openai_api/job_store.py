@@ -0,0 +1,301 @@
+# coding: utf-8
+"""
+This module defines the JobStore class, a durable backlog of video titles backed by
+SQLite in WAL mode. Titles are appended in bulk and claimed atomically with a lease, so
+any number of workers (threads or processes on the same host) can pull from one backlog
+without taking the same title twice. A claim whose lease runs out, for example because
+its worker crashed, becomes claimable again, and so does a failed job until it has used
+up its attempts. Such jobs are claimed before new titles, so the work they already did
+(see JobManifest) is resumed rather than abandoned. Finished jobs are marked done or
+failed together with the artifacts they produced.
+
+Modules Imported:
+- json: Standard library for serializing artifacts.
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- socket: Standard library used to identify the claiming host.
+- threading: Standard library used to identify the claiming thread.
+- time: Standard library for lease timestamps.
+- SQLiteStore: Base class providing per-thread WAL connections and transactions.
+- KeepAlive: Base class renewing a claim from a background thread.
+
+Classes:
+    Job: A claimed title.
+    JobStore: The SQLite-backed backlog of titles.
+    LeaseRenewal: Keeps the lease of a job alive while it is worked on.
+
+Usage:
+    store = JobStore("temp/jobs.sqlite3")
+    store.add_titles(["Title one", "Title two"])
+    job = store.claim()
+    with LeaseRenewal(store, job.job_id, job.worker):
+        ...  # make the video
+    store.mark_done(job.job_id, {"video": "temp/jobs/1/video.mp4"}, worker=job.worker)
+"""
+
+from __future__ import absolute_import
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from openai_api.sqlite_store import SQLiteStore
+from common.storage import KeepAlive
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    artifacts TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+def _default_worker():
+    """Returns the default worker name: the host name, process and thread."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+class Job: # pylint: disable=R0903:too-few-public-methods
+    """
+    A title claimed from the job store.
+
+    Attributes:
+        job_id (int): The identifier of the job in the store.
+        title (str): The title to make a video from.
+        attempts (int): How many times the job has been claimed, including this claim.
+        artifacts (dict): The artifacts recorded for the job so far.
+        worker (str): The name the job was claimed under, which holds its lease.
+    """
+
+    def __init__(self, job_id, title, attempts, artifacts, worker=None): # pylint: disable=R0913:too-many-arguments
+        self.job_id = job_id
+        self.title = title
+        self.attempts = attempts
+        self.artifacts = artifacts
+        self.worker = worker
+
+class JobStore(SQLiteStore):
+    """
+    A durable backlog of titles with atomic, leased claims.
+
+    Attributes:
+        db_path (str): The path of the SQLite database.
+        lease_seconds (float): How long a claim lasts before it can be taken again.
+        max_attempts (int): How many times a failed or abandoned job is claimed before it
+            is given up.
+    """
+
+    def __init__(self, db_path, lease_seconds=900, max_attempts=3):
+        """
+        Initializes the store and creates the database if necessary.
+
+        Args:
+            db_path (str): The path of the SQLite database.
+            lease_seconds (float, optional): How long a claim lasts before it can be taken
+                again. Defaults to 15 minutes.
+            max_attempts (int, optional): How many times a failed job is claimed before it
+                is given up. Defaults to 3.
+        """
+        super().__init__(db_path, SCHEMA)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def add_titles(self, titles):
+        """
+        Appends titles to the backlog in a single transaction.
+
+        Args:
+            titles (iterable): The titles to add. Blank titles are skipped.
+
+        Returns:
+            int: The number of titles added.
+        """
+        now = time.time()
+        rows = [(title.strip(), now, now) for title in titles if title and title.strip()]
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT INTO jobs (title, created_at, updated_at) VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def titles(self):
+        """
+        Iterates over the title of every job ever queued, whatever its status.
+
+        Yields:
+            str: The next title.
+        """
+        for (title,) in self._connection().execute("SELECT title FROM jobs ORDER BY id"):
+            yield title
+
+    def claim(self, worker=None, lease_seconds=None):
+        """
+        Atomically claims a job to work on. Jobs to resume come first: claims whose
+        lease has expired and failed jobs, as long as they have attempts left. An
+        expired claim without attempts left is marked failed. Otherwise the oldest
+        pending title is claimed.
+
+        Args:
+            worker (str, optional): A name for the claiming worker. Defaults to the host
+                name, process and thread.
+            lease_seconds (float, optional): The length of the lease. Defaults to
+                lease_seconds.
+
+        Returns:
+            Job: The claimed job, or None if the backlog is empty.
+        """
+        worker = worker or _default_worker()
+        now = time.time()
+        # The select and update share one write transaction, so no two workers get the same row
+        with self._transaction() as connection:
+            # A job that keeps killing its worker, e.g. by running out of memory, never gets
+            # to mark itself failed, so its expired claims count against its attempts too
+            connection.execute(
+                "UPDATE jobs SET status = 'failed', "
+                "error = COALESCE(error, 'Lease expired on the last attempt'), updated_at = ? "
+                "WHERE status = 'claimed' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts))
+            row = connection.execute(
+                "SELECT id, title, attempts, artifacts FROM jobs "
+                "WHERE ((status = 'claimed' AND lease_expires < ?) OR status = 'failed') "
+                "AND attempts < ? ORDER BY id LIMIT 1",
+                (now, self.max_attempts)).fetchone()
+            if row is None:
+                row = connection.execute(
+                    "SELECT id, title, attempts, artifacts FROM jobs "
+                    "WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = 'claimed', worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (worker, now + (lease_seconds or self.lease_seconds), now, row[0]))
+        return Job(row[0], row[1], row[2] + 1, json.loads(row[3]), worker)
+
+    def renew(self, job_id, lease_seconds=None, worker=None):
+        """
+        Extends the lease of a claimed job, if the caller still holds it.
+
+        Args:
+            job_id (int): The job to renew.
+            lease_seconds (float, optional): The new length of the lease, from now.
+                Defaults to lease_seconds.
+            worker (str, optional): The name the job was claimed under, Job.worker.
+                Defaults to the same default name as claim.
+
+        Returns:
+            bool: Whether the lease was extended.
+        """
+        now = time.time()
+        return bool(self._connection().execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND status = 'claimed'",
+            (now + (lease_seconds or self.lease_seconds), now, job_id,
+             worker or _default_worker())).rowcount)
+
+    def record_artifacts(self, job_id, artifacts):
+        """
+        Merges artifacts into a job's record without changing its status.
+
+        Args:
+            job_id (int): The job the artifacts belong to.
+            artifacts (dict): The artifacts to record, by name.
+        """
+        self._update(job_id, None, None, artifacts)
+
+    def mark_done(self, job_id, artifacts=None, worker=None):
+        """
+        Marks a job as done and records its artifacts, if the caller still holds its lease.
+
+        Args:
+            job_id (int): The finished job.
+            artifacts (dict, optional): The artifacts produced, by name.
+            worker (str, optional): The name the job was claimed under, Job.worker.
+                Defaults to the same default name as claim.
+
+        Returns:
+            bool: Whether the job was updated. False means the lease was lost, e.g. it
+                expired and another worker claimed the job, whose outcome is kept.
+        """
+        return self._update(job_id, "done", None, artifacts, worker)
+
+    def mark_failed(self, job_id, error, artifacts=None, worker=None):
+        """
+        Marks a job as failed and records the reason, if the caller still holds its lease.
+
+        Args:
+            job_id (int): The failed job.
+            error (str): Why the job failed.
+            artifacts (dict, optional): Any artifacts produced before the failure.
+            worker (str, optional): The name the job was claimed under, Job.worker.
+                Defaults to the same default name as claim.
+
+        Returns:
+            bool: Whether the job was updated. False means the lease was lost.
+        """
+        return self._update(job_id, "failed", str(error), artifacts, worker)
+
+    def _update(self, job_id, status, error, artifacts, worker=None): # pylint: disable=R0913:too-many-arguments
+        with self._transaction() as connection:
+            row = connection.execute("SELECT artifacts FROM jobs WHERE id = ?",
+                                     (job_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown job: {job_id}")
+            merged = json.loads(row[0])
+            merged.update(artifacts or {})
+            if status is None:
+                connection.execute(
+                    "UPDATE jobs SET artifacts = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(merged), time.time(), job_id))
+                return True
+            # Only the holder of the lease may finish the job
+            updated = connection.execute(
+                "UPDATE jobs SET status = ?, error = COALESCE(?, error), artifacts = ?, "
+                "updated_at = ? WHERE id = ? AND worker = ? AND status = 'claimed'",
+                (status, error, json.dumps(merged), time.time(), job_id,
+                 worker or _default_worker())).rowcount
+        if not updated:
+            logging.warning("Job %s was not marked %s, its lease was lost", job_id, status)
+        return bool(updated)
+
+    def counts(self):
+        """
+        Counts the jobs in each status.
+
+        Returns:
+            dict: The number of jobs per status.
+        """
+        rows = self._connection().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+class LeaseRenewal(KeepAlive):
+    """
+    Keeps the lease of a claimed job alive from a background thread while it is worked
+    on, so a render or a wait longer than the lease does not let another worker claim it.
+
+    Attributes:
+        lost (bool): Whether the lease was lost while the stage ran.
+    """
+
+    def __init__(self, store, job_id, worker, interval=None):
+        """
+        Initializes the renewal. It starts when it is entered or started.
+
+        Args:
+            store (JobStore): The store the job was claimed from.
+            job_id (int): The claimed job.
+            worker (str): The name the job was claimed under, Job.worker.
+            interval (float, optional): Seconds between renewals. Defaults to a quarter
+                of the lease.
+        """
+        super().__init__(lambda: store.renew(job_id, worker=worker),
+                         interval or store.lease_seconds / 4, f"job {job_id}")
@@ -0,0 +1,168 @@
+# coding: utf-8
+"""
+This module defines the JobManifest class, the checkpoint file of a video job. Each time
+a stage of the job finishes, the manifest records it together with the content hashes of
+the artifacts it committed to the artifact store and any small results (the script, the
+duration). When a job is claimed again after a crash or a failure, the stages recorded
+in its manifest are skipped and the job resumes from the first incomplete stage, so the
+chat, speech and transcription requests that already succeeded are not paid for twice.
+
+A stage only counts as complete if every artifact it recorded is still available: the
+workspace file is checked against the recorded hash, and relinked from the object store
+if it is missing. The manifest is rewritten atomically, so a crash while saving it leaves
+the previous checkpoint intact.
+
+Layout:
+    <temp_dir>/jobs/<job_id>/manifest.json
+
+Modules Imported:
+- json: Standard library for reading and writing the manifest.
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- time: Standard library for completion timestamps.
+- file_digest: SHA-256 of a file, shared with the artifact store.
+
+Classes:
+    JobManifest: The completed stages of one job and the artifacts they produced.
+
+Usage:
+    manifest = JobManifest(workspace)
+    if not manifest.is_complete("speech"):
+        tts_api.audio_speech_create(script, output_file_path=workspace.output_path("speech.mp3"))
+        manifest.complete("speech", {"speech.mp3": workspace.commit("speech.mp3")})
+"""
+
+from __future__ import absolute_import
+import json
+import logging
+import os
+import time
+
+from common.storage import file_digest
+
+MANIFEST_FILE = "manifest.json"
+
+class JobManifest:
+    """
+    The completed stages of one job and the artifacts they produced.
+
+    Attributes:
+        workspace (JobWorkspace): The workspace of the job.
+        path (str): The path of the manifest file.
+        stages (dict): For each completed stage, its completion time, artifacts
+            (name to SHA-256 digest) and data.
+    """
+
+    def __init__(self, workspace):
+        """
+        Loads the manifest of a job, or starts an empty one.
+
+        Args:
+            workspace (JobWorkspace): The workspace of the job.
+        """
+        self.workspace = workspace
+        self.path = workspace.path(MANIFEST_FILE)
+        self.stages = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return json.load(file).get("stages", {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable manifest %s: %s", self.path, e)
+            return {}
+
+    def _save(self):
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"job_id": self.workspace.job_id, "stages": self.stages}, file, indent=4)
+        os.replace(temporary_path, self.path)
+
+    def is_complete(self, stage):
+        """
+        Checks whether a stage finished and its artifacts are still available, relinking
+        artifacts missing from the workspace from the object store.
+
+        Args:
+            stage (str): The stage name.
+
+        Returns:
+            bool: True if the stage can be skipped.
+        """
+        entry = self.stages.get(stage)
+        if entry is None:
+            return False
+        return all(self._restore(name, digest) for name, digest in entry["artifacts"].items())
+
+    def _restore(self, name, digest):
+        """Makes sure the workspace holds an artifact with the recorded digest."""
+        if self.workspace.exists(name):
+            object_path = self.workspace.store.object_path(digest, os.path.splitext(name)[1])
+            # A file hard-linked to its object needs no hashing
+            if os.path.exists(object_path) and os.path.samefile(self.workspace.path(name),
+                                                                object_path):
+                return True
+            if file_digest(self.workspace.path(name)) == digest:
+                return True
+        try:
+            self.workspace.link_object(digest, name)
+            return True
+        except FileNotFoundError:
+            logging.warning("Artifact %s of job %s is gone, its stage will run again",
+                            name, self.workspace.job_id)
+            return False
+
+    def first_incomplete(self, stages):
+        """
+        Returns the first stage that cannot be skipped.
+
+        Args:
+            stages (iterable): The stage names, in pipeline order.
+
+        Returns:
+            str: The stage to resume from, or None if every stage is complete.
+        """
+        for stage in stages:
+            if not self.is_complete(stage):
+                return stage
+        return None
+
+    def artifacts(self, stage):
+        """
+        Returns the artifacts a completed stage produced.
+
+        Args:
+            stage (str): The stage name.
+
+        Returns:
+            dict: The SHA-256 digests by file name, empty if the stage is not complete.
+        """
+        return dict(self.stages.get(stage, {}).get("artifacts", {}))
+
+    def data(self, stage):
+        """
+        Returns the results a completed stage recorded.
+
+        Args:
+            stage (str): The stage name.
+
+        Returns:
+            dict: The data passed to complete, empty if the stage is not complete.
+        """
+        return dict(self.stages.get(stage, {}).get("data", {}))
+
+    def complete(self, stage, artifacts=None, **data):
+        """
+        Records a finished stage and saves the manifest.
+
+        Args:
+            stage (str): The stage name.
+            artifacts (dict, optional): The digests of the artifacts it committed, by
+                file name.
+            **data: Small JSON-serializable results to restore on resume, e.g. the script.
+        """
+        self.stages[stage] = {"completed_at": time.time(), "artifacts": dict(artifacts or {}),
+                              "data": data}
+        self._save()
@@ -9,6 +9,7 @@ methods for context management and resource cleanup.
 Modules Imported:
 - OpenAI: The main OpenAI client for API interactions.
 - Configuration: A custom class for managing API configuration settings.
+- RateLimiter: Per-endpoint rate limiting and retries shared by the clients of an API key.
 
 Classes:
     OpenAiClient: A client class for OpenAI API interactions, 
@@ -25,18 +26,21 @@ Usage:
 Attributes:
     configuration (Configuration): Configuration settings including API key.
     client (OpenAI): An instance of the OpenAI client.
+    rate_limiter (RateLimiter): The rate limiter requests go through.
 
 Methods:
     __init__(configuration): Initializes the client with a Configuration object.
     __enter__(): Enters the runtime context for resource management.
     __exit__(exc_type, exc_value, traceback): Exits the runtime context, ensuring cleanup.
     close(): Releases any resources held by the client.
+    request(endpoint, func, *args, tokens=0, **kwargs): Makes a rate-limited request.
 """
 
 from __future__ import absolute_import
 from openai import OpenAI
 
 from openai_api.configuration import Configuration
+from openai_api.rate_limiter import RateLimiter
 
 class OpenAiClient:
     """
@@ -45,6 +49,7 @@ class OpenAiClient:
     Attributes:
         configuration (Configuration): Configuration settings including API key.
         client (OpenAI): An instance of the OpenAI client.
+        rate_limiter (RateLimiter): The rate limiter requests go through.
     """
 
     def __init__(self, configuration=None):
@@ -58,14 +63,10 @@ class OpenAiClient:
         Raises:
             ValueError: If the configuration is None or lacks necessary attributes.
         """
-        if configuration is None:
-            raise ValueError("Configuration must be provided and contain necessary API settings.")
-
-        if not isinstance(configuration, Configuration):
-            raise TypeError("Invalid configuration type provided.")
-
-        self.configuration: Configuration = configuration
-        self.client: OpenAI = OpenAI(api_key=self.configuration.api_key)
+        self.configuration: Configuration = Configuration.require(configuration)
+        # Retries are left to the rate limiter, which also honours Retry-After
+        self.client: OpenAI = OpenAI(api_key=self.configuration.api_key, max_retries=0)
+        self.rate_limiter = RateLimiter.for_configuration(configuration)
 
     def __enter__(self):
         """
@@ -87,6 +88,22 @@ class OpenAiClient:
         """
         self.close()
 
+    def request(self, endpoint, func, *args, tokens=0, **kwargs):
+        """
+        Makes a request through the rate limiter, retrying it on rate limits.
+
+        Args:
+            endpoint (str): The endpoint the request counts against.
+            func (callable): The client method to call.
+            *args: Positional arguments for func.
+            tokens (int, optional): The estimated tokens of the request.
+            **kwargs: Keyword arguments for func.
+
+        Returns:
+            The result of func.
+        """
+        return self.rate_limiter.call(endpoint, func, *args, tokens=tokens, **kwargs)
+
     def close(self):
         """
         Close the client and release any resources.
@@ -0,0 +1,446 @@
+# coding: utf-8
+"""
+This module defines a client-side rate limiter for the OpenAI endpoints. Every endpoint
+has a token bucket for requests per minute and, where the quota counts tokens, one for
+tokens per minute. A call first reserves its estimated cost from both buckets and waits
+until the reservation is covered, so a busy process settles at the quota instead of
+running into it. Calls that still fail with a rate limit, a timeout or a server error
+are retried with jittered exponential backoff, never sooner than the Retry-After the
+server asked for; the reservation of a failed attempt is given back, since its retry
+reserves again. The same limiter serves threads and asyncio tasks, and one limiter is
+shared by every client using the same API key.
+
+Modules Imported:
+- asyncio: Standard library used to wait without blocking the event loop.
+- email.utils: Standard library for parsing HTTP dates in Retry-After.
+- logging: Standard library for logging error and informational messages.
+- random: Standard library for backoff jitter.
+- threading: Standard library for guarding the buckets.
+- time: Standard library for the bucket clocks.
+- openai: Provides the retryable error classes.
+- instrumentation: Records request latency, waits, retries and token usage.
+
+Classes:
+    TokenBucket: A bucket refilled at a constant rate that can be reserved ahead.
+    EndpointLimiter: The request and token buckets of one endpoint.
+    RateLimiter: The limiters of all endpoints plus the retry policy.
+
+Functions:
+    estimate_chat_tokens: Estimates the tokens a chat completion will be charged.
+
+Usage:
+    limiter = RateLimiter.for_configuration(configuration)
+    response = limiter.call("chat", client.chat.completions.create,
+                            tokens=estimate_chat_tokens(messages), model=model,
+                            messages=messages)
+    print(limiter.status())
+"""
+
+from __future__ import absolute_import
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import openai
+
+import instrumentation
+from instrumentation import REGISTRY
+
+# Requests and tokens per minute of each endpoint; None means the quota has no token limit
+DEFAULT_RATE_LIMITS = {
+    "chat": (500, 200000),
+    "speech": (50, None),
+    "transcriptions": (50, None),
+}
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError,
+                    openai.APIConnectionError, openai.InternalServerError)
+
+def estimate_chat_tokens(messages, max_tokens=None):
+    """
+    Estimates the tokens a chat completion will be charged, before making it.
+
+    Uses the usual four characters per token plus the per-message overhead, and the
+    completion allowance the quota reserves.
+
+    Args:
+        messages (list): The chat messages.
+        max_tokens (int, optional): The completion limit of the request. Defaults to an
+            allowance of 512 tokens.
+
+    Returns:
+        int: The estimated prompt and completion tokens.
+    """
+    prompt = sum(len(str(message.get("content", ""))) // 4 + 4 for message in messages)
+    return prompt + 3 + (max_tokens or 512)
+
+class TokenBucket:
+    """
+    A bucket refilled at a constant rate from which amounts can be reserved ahead.
+
+    A reservation always succeeds immediately but may leave the bucket in debt; the caller
+    then waits for the returned delay, which is exactly how long the refill takes to cover
+    it. Later reservations queue behind the debt, so callers are served in order.
+
+    Attributes:
+        capacity (float): The most the bucket holds, which is also the largest burst.
+        rate (float): The refill rate per second.
+    """
+
+    def __init__(self, capacity, rate):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self._level = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount):
+        """
+        Takes an amount from the bucket.
+
+        Args:
+            amount (float): The amount to take. Amounts above capacity are clamped to it.
+
+        Returns:
+            float: How many seconds the caller must wait before using the reservation.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level -= min(float(amount), self.capacity)
+            return max(0.0, -self._level / self.rate)
+
+    def adjust(self, amount):
+        """
+        Returns an amount to the bucket, or takes more if it is negative, after the actual
+        cost of a call turns out to differ from its reservation.
+
+        Args:
+            amount (float): The amount to give back.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self.capacity, self._level + amount)
+
+    def available(self):
+        """
+        Returns the amount that can be reserved without waiting.
+
+        Returns:
+            float: The current level, negative while reservations are queued.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._level
+
+class EndpointLimiter:
+    """
+    The request and token buckets of one endpoint.
+
+    Attributes:
+        name (str): The endpoint name.
+        requests (TokenBucket): The requests per minute bucket.
+        tokens (TokenBucket): The tokens per minute bucket, or None.
+        queue_depth (int): The callers currently waiting for their reservation.
+    """
+
+    def __init__(self, name, requests_per_minute, tokens_per_minute=None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = None
+        if tokens_per_minute:
+            self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.queue_depth = 0
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=0):
+        """
+        Reserves one request and its tokens.
+
+        Args:
+            tokens (int, optional): The estimated tokens of the request.
+
+        Returns:
+            float: How many seconds to wait before making the request.
+        """
+        delay = self.requests.reserve(1)
+        if self.tokens is not None and tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        with self._lock:
+            return max(delay, self._blocked_until - time.monotonic())
+
+    def block(self, seconds):
+        """
+        Holds every request to the endpoint back, as a Retry-After asks.
+
+        Args:
+            seconds (float): How long to hold requests back.
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def settle(self, estimated, actual):
+        """
+        Corrects the token bucket once the actual tokens of a request are known.
+
+        Args:
+            estimated (int): The tokens reserved.
+            actual (int): The tokens charged.
+        """
+        if self.tokens is not None and estimated:
+            self.tokens.adjust(estimated - actual)
+
+    def refund(self, tokens=0):
+        """
+        Gives back the reservation of a request that failed, so a retry, which reserves
+        again, does not pay for the same request twice.
+
+        Args:
+            tokens (int, optional): The estimated tokens that were reserved.
+        """
+        self.requests.adjust(1)
+        if self.tokens is not None and tokens:
+            self.tokens.adjust(tokens)
+
+    def waiting(self, delta):
+        """Counts a caller starting (1) or finishing (-1) its wait."""
+        with self._lock:
+            self.queue_depth += delta
+
+    def status(self):
+        """
+        Returns the current budget of the endpoint.
+
+        Returns:
+            dict: The requests and tokens that can be used without waiting, and the
+            number of callers waiting.
+        """
+        with self._lock:
+            blocked = max(0.0, self._blocked_until - time.monotonic())
+            queue_depth = self.queue_depth
+        return {
+            "requests_available": round(self.requests.available(), 2),
+            "tokens_available": (None if self.tokens is None
+                                 else round(self.tokens.available(), 2)),
+            "queue_depth": queue_depth,
+            "blocked_seconds": round(blocked, 2),
+        }
+
+def retry_after(error):
+    """
+    Reads the delay a rate-limited or failed response asks for.
+
+    Args:
+        error (Exception): The error raised by the OpenAI client.
+
+    Returns:
+        float: The delay in seconds, or None if the response gives none.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                moment = email.utils.parsedate_to_datetime(value)
+                return max(0.0, moment.timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+class RateLimiter:
+    """
+    Per-endpoint rate limiting and retries for the OpenAI API.
+
+    Attributes:
+        endpoints (dict): The EndpointLimiter of each endpoint, by name.
+        max_retries (int): How many times a failed call is retried.
+        base_delay (float): The backoff of the first retry, in seconds.
+        max_delay (float): The longest backoff, in seconds.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, limits=None, max_retries=6, base_delay=1.0, max_delay=60.0):
+        """
+        Initializes the limiter.
+
+        Args:
+            limits (dict, optional): (requests per minute, tokens per minute) by endpoint.
+                Defaults to DEFAULT_RATE_LIMITS.
+            max_retries (int, optional): How many times a failed call is retried.
+                Defaults to 6.
+            base_delay (float, optional): The backoff of the first retry. Defaults to 1s.
+            max_delay (float, optional): The longest backoff. Defaults to 60s.
+        """
+        limits = dict(DEFAULT_RATE_LIMITS, **(limits or {}))
+        self.endpoints = {name: EndpointLimiter(name, rpm, tpm)
+                          for name, (rpm, tpm) in limits.items()}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def for_configuration(cls, configuration):
+        """
+        Returns the limiter shared by every client using the configuration's API key,
+        since the quota belongs to the key rather than to a client. Configurations with
+        the same key but other limits or retries get a limiter of their own.
+
+        Args:
+            configuration (Configuration): The settings holding the key and the limits.
+
+        Returns:
+            RateLimiter: The shared limiter.
+        """
+        limits = tuple(sorted((name, tuple(limit))
+                              for name, limit in (configuration.rate_limits or {}).items()))
+        key = (configuration.api_key, limits, configuration.max_retries)
+        with cls._shared_lock:
+            limiter = cls._shared.get(key)
+            if limiter is None:
+                limiter = cls(configuration.rate_limits, configuration.max_retries)
+                cls._shared[key] = limiter
+            return limiter
+
+    def status(self):
+        """
+        Returns the current budget and queue depth of every endpoint.
+
+        Returns:
+            dict: EndpointLimiter.status() by endpoint name.
+        """
+        return {name: endpoint.status() for name, endpoint in self.endpoints.items()}
+
+    def _backoff(self, attempt, error):
+        """Returns the delay before a retry: full jitter, but never before Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, requested)
+        return delay
+
+    def _on_error(self, endpoint, attempt, error):
+        """Decides whether to retry a failed call and returns the delay before it."""
+        if not isinstance(error, RETRYABLE_ERRORS) or attempt >= self.max_retries:
+            raise error
+        delay = self._backoff(attempt, error)
+        instrumentation.record(retries=1)
+        REGISTRY.inc("shorts_openai_retries_total", endpoint=endpoint.name,
+                     error=type(error).__name__)
+        if isinstance(error, openai.RateLimitError):
+            # Every caller of the endpoint waits, not just the one that was rejected
+            endpoint.block(delay)
+        logging.warning("%s request failed (%s), retry %d in %.1fs",
+                        endpoint.name, type(error).__name__, attempt + 1, delay)
+        return delay
+
+    @staticmethod
+    def _settle(endpoint, tokens, result):
+        usage = getattr(result, "usage", None)
+        if usage is None or not getattr(usage, "total_tokens", None):
+            return
+        if tokens:
+            endpoint.settle(tokens, usage.total_tokens)
+        prompt, completion = usage.prompt_tokens or 0, usage.completion_tokens or 0
+        instrumentation.record(tokens_prompt=prompt, tokens_completion=completion)
+        REGISTRY.inc("shorts_openai_tokens_total", prompt, endpoint=endpoint.name,
+                     kind="prompt")
+        REGISTRY.inc("shorts_openai_tokens_total", completion, endpoint=endpoint.name,
+                     kind="completion")
+
+    @staticmethod
+    def _observe(endpoint, started, status):
+        REGISTRY.observe("shorts_openai_request_seconds", time.perf_counter() - started,
+                         endpoint=endpoint.name, status=status)
+
+    def call(self, endpoint_name, func, *args, tokens=0, **kwargs):
+        """
+        Makes a rate-limited call, retrying it on rate limits and transient errors.
+
+        Args:
+            endpoint_name (str): The endpoint the call counts against.
+            func (callable): The client method to call.
+            *args: Positional arguments for func.
+            tokens (int, optional): The estimated tokens of the call.
+            **kwargs: Keyword arguments for func.
+
+        Returns:
+            The result of func.
+        """
+        endpoint = self.endpoints[endpoint_name]
+        for attempt in range(self.max_retries + 1):
+            delay = endpoint.reserve(tokens)
+            if delay > 0:
+                REGISTRY.observe("shorts_openai_ratelimit_wait_seconds", delay,
+                                 endpoint=endpoint.name)
+                endpoint.waiting(1)
+                try:
+                    time.sleep(delay)
+                finally:
+                    endpoint.waiting(-1)
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e: # pylint: disable=W0718:broad-exception-caught
+                self._observe(endpoint, started, "error")
+                endpoint.refund(tokens)
+                time.sleep(self._on_error(endpoint, attempt, e))
+                continue
+            self._observe(endpoint, started, "ok")
+            self._settle(endpoint, tokens, result)
+            return result
+        raise RuntimeError("unreachable")
+
+    async def acall(self, endpoint_name, func, *args, tokens=0, **kwargs):
+        """
+        Makes a rate-limited call of a coroutine function, retrying it on rate limits and
+        transient errors. Waiting never blocks the event loop.
+
+        Args:
+            endpoint_name (str): The endpoint the call counts against.
+            func (callable): The async client method to call.
+            *args: Positional arguments for func.
+            tokens (int, optional): The estimated tokens of the call.
+            **kwargs: Keyword arguments for func.
+
+        Returns:
+            The result of func.
+        """
+        endpoint = self.endpoints[endpoint_name]
+        for attempt in range(self.max_retries + 1):
+            delay = endpoint.reserve(tokens)
+            if delay > 0:
+                REGISTRY.observe("shorts_openai_ratelimit_wait_seconds", delay,
+                                 endpoint=endpoint.name)
+                endpoint.waiting(1)
+                try:
+                    await asyncio.sleep(delay)
+                finally:
+                    endpoint.waiting(-1)
+            started = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e: # pylint: disable=W0718:broad-exception-caught
+                self._observe(endpoint, started, "error")
+                endpoint.refund(tokens)
+                await asyncio.sleep(self._on_error(endpoint, attempt, e))
+                continue
+            self._observe(endpoint, started, "ok")
+            self._settle(endpoint, tokens, result)
+            return result
+        raise RuntimeError("unreachable")
@@ -0,0 +1,184 @@
+# coding: utf-8
+"""
+This module defines the ResponseCache class, an opt-in persistent cache for chat
+completions. Responses are keyed by a hash of the model, the messages and the sampling
+parameters, so re-running the same title after a render failure, or rebuilding a video
+with new styling, does not pay for the same completion twice and works offline. Entries
+expire after a TTL and the least recently used entries are evicted once the cache grows
+past its size limit.
+
+Modules Imported:
+- hashlib: Standard library for deriving cache keys.
+- json: Standard library for canonicalizing the request.
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- time: Standard library for expiry and recency timestamps.
+- SQLiteStore: Base class providing per-thread WAL connections and transactions.
+
+Classes:
+    ResponseCache: The SQLite-backed completion cache.
+
+Usage:
+    cache = ResponseCache("temp/chat_cache.sqlite3", ttl=7 * 24 * 3600)
+    key = cache.make_key("gpt-4o-mini", messages)
+    content = cache.get(key)
+    if content is None:
+        content = ...  # call the API
+        cache.put(key, content)
+"""
+
+from __future__ import absolute_import
+import hashlib
+import json
+import logging
+import os
+import time
+
+from openai_api.sqlite_store import SQLiteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+"""
+
+class ResponseCache(SQLiteStore):
+    """
+    A persistent cache of chat completion responses.
+
+    Attributes:
+        db_path (str): The path of the SQLite database.
+        ttl (float): How long an entry stays valid in seconds, or None for no expiry.
+        max_bytes (int): The total size of cached content kept before evicting.
+    """
+
+    def __init__(self, db_path, ttl=None, max_bytes=64 * 1024 * 1024):
+        """
+        Initializes the cache and creates the database if necessary.
+
+        Args:
+            db_path (str): The path of the SQLite database.
+            ttl (float, optional): How long an entry stays valid in seconds.
+                Defaults to None, meaning entries never expire.
+            max_bytes (int, optional): The total size of cached content kept before the
+                least recently used entries are evicted. Defaults to 64 MiB.
+        """
+        super().__init__(db_path, SCHEMA)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_configuration(cls, configuration):
+        """
+        Opens the cache configured for the chat APIs.
+
+        Args:
+            configuration (Configuration): The settings holding the cache options.
+
+        Returns:
+            ResponseCache: The cache under temp_dir, or None when chat caching is off.
+        """
+        if not configuration.chat_cache:
+            return None
+        return cls(os.path.join(configuration.temp_dir, "chat_cache.sqlite3"),
+                   ttl=configuration.chat_cache_ttl,
+                   max_bytes=configuration.chat_cache_max_bytes)
+
+    @staticmethod
+    def make_key(model, messages, **params):
+        """
+        Derives the cache key of a request.
+
+        Args:
+            model (str): The model name.
+            messages (list): The chat messages.
+            **params: The sampling parameters (temperature, top_p, ...).
+
+        Returns:
+            str: A hex digest identifying the request.
+        """
+        request = {"model": model, "messages": messages, "params": params}
+        canonical = json.dumps(request, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def lookup(self, model, messages, refresh=False, **params):
+        """
+        Derives the key of a request and looks it up.
+
+        Args:
+            model (str): The model name.
+            messages (list): The chat messages.
+            refresh (bool, optional): Skip the lookup, so the response is requested again.
+                Defaults to False.
+            **params: The sampling parameters.
+
+        Returns:
+            tuple: (key, content), where content is None on a miss or a refresh.
+        """
+        key = self.make_key(model, messages, **params)
+        content = None if refresh else self.get(key)
+        if content is not None:
+            logging.info("Chat completion served from cache")
+        return key, content
+
+    def get(self, key):
+        """
+        Looks up a cached response.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            str: The cached content, or None on a miss or an expired entry.
+        """
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute("SELECT content, created_at FROM responses WHERE key = ?",
+                                 (key,)).fetchone()
+        if row is None:
+            return None
+        if self.ttl is not None and now - row[1] > self.ttl:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key, content):
+        """
+        Stores a response, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key (str): The cache key.
+            content (str): The response content.
+        """
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, content, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)", (key, content, size, now, now))
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(connection, total - self.max_bytes)
+
+    @staticmethod
+    def _evict(connection, excess):
+        """Deletes the least recently used entries until excess bytes are freed."""
+        freed = 0
+        doomed = []
+        for key, size in connection.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at"):
+            if freed >= excess:
+                break
+            doomed.append((key,))
+            freed += size
+        connection.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def clear(self):
+        """Removes every cached response."""
+        self._connection().execute("DELETE FROM responses")
@@ -0,0 +1,76 @@
+# coding: utf-8
+"""
+This module defines SQLiteStore, the base class of the SQLite-backed stores in this
+package (the job store, the response cache, ...). It keeps one connection per thread,
+since SQLite connections cannot be shared between threads, puts the database in WAL mode
+so readers never block the writer, and provides a write transaction helper.
+
+Modules Imported:
+- sqlite3: Standard library embedded database.
+- threading: Standard library used to keep one connection per thread.
+- contextmanager: Decorator used to build the transaction helper.
+
+Classes:
+    SQLiteStore: The base class of the SQLite-backed stores.
+
+Usage:
+    class MyStore(SQLiteStore):
+        def __init__(self, db_path):
+            super().__init__(db_path, "CREATE TABLE IF NOT EXISTS items (key TEXT)")
+
+        def add(self, key):
+            with self._transaction() as connection:
+                connection.execute("INSERT INTO items (key) VALUES (?)", (key,))
+"""
+
+from __future__ import absolute_import
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+class SQLiteStore: # pylint: disable=R0903:too-few-public-methods
+    """
+    The base class of the SQLite-backed stores.
+
+    Attributes:
+        db_path (str): The path of the SQLite database.
+    """
+
+    def __init__(self, db_path, schema):
+        """
+        Opens the database and creates its schema if necessary.
+
+        Args:
+            db_path (str): The path of the SQLite database.
+            schema (str): The SQL script creating the tables and indexes.
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connection().executescript(schema)
+
+    def _connection(self):
+        """Returns this thread's connection, opening it on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Runs a block in a write transaction.
+
+        BEGIN IMMEDIATE takes the write lock up front, so reads and writes inside the
+        block are atomic with respect to other connections.
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
@@ -0,0 +1,192 @@
+# coding: utf-8
+"""
+This module streams a script from the chat API straight into sentence-level speech.
+Instead of waiting for the whole completion and then synthesizing the whole script, the
+completion is read as a stream, cut into sentences as the tokens arrive, and each
+sentence is sent to the TTS API as soon as it is complete, several at a time. The
+sentence clips are then stitched in order into one track with FFmpeg's concat demuxer,
+which copies the audio frames without re-encoding. The time to a finished narration is
+then bounded by the slowest sentence rather than by the length of the script.
+
+Modules Imported:
+- os: Standard library for interacting with the operating system.
+- re: Standard library for finding sentence boundaries.
+- shutil: Standard library for removing the sentence clips.
+- subprocess: Standard library for running FFmpeg.
+- concat_entry, ffmpeg_binary: Concat list lines and the configured FFmpeg binary.
+
+Classes:
+    SentenceSplitter: Cuts streamed text into sentences.
+
+Functions:
+    concat_audio: Stitches audio clips of the same format into one file.
+    segment_dir: Returns the directory the sentence clips of a track are written to.
+    script_to_speech: Streams a script into sentence-level speech with the sync APIs.
+    async_script_to_speech: The same with the async APIs.
+
+Usage:
+    script, speech_path = script_to_speech(chat_api, tts_api, "Stoic habits",
+                                           "temp/speech.mp3")
+"""
+
+from __future__ import absolute_import
+import os
+import re
+import shutil
+import subprocess
+
+from common.ffmpeg import concat_entry, ffmpeg_binary
+
+# A sentence ends with terminal punctuation, optionally closed by quotes or brackets,
+# followed by whitespace
+SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*\s+")
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "st", "vs", "etc", "e.g", "i.e", "jr", "sr"}
+
+class SentenceSplitter:
+    """
+    Cuts text arriving in pieces into sentences.
+
+    Very short sentences are held back and joined to the next one, since a TTS request
+    per two-word sentence costs a round trip and reads with unnatural intonation.
+
+    Attributes:
+        min_chars (int): The shortest sentence emitted on its own.
+    """
+
+    def __init__(self, min_chars=40):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text):
+        """
+        Adds streamed text.
+
+        Args:
+            text (str): The next piece of the completion.
+
+        Returns:
+            list: The sentences completed by this piece.
+        """
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self._buffer):
+            candidate = self._buffer[start:match.end()].strip()
+            last_word = candidate.rstrip(".!?…\"'”’)]").rsplit(None, 1)[-1:]
+            if last_word and last_word[0].lower().rstrip(".") in ABBREVIATIONS:
+                continue
+            if len(candidate) < self.min_chars:
+                continue
+            sentences.append(candidate)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        """
+        Ends the stream.
+
+        Returns:
+            list: The remaining text as a final sentence, if there is any.
+        """
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+def segment_dir(output_file_path):
+    """
+    Returns the directory the sentence clips of a track are written to.
+
+    Args:
+        output_file_path (str): The path of the stitched track.
+
+    Returns:
+        str: The directory, created if necessary.
+    """
+    directory = f"{output_file_path}.segments"
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+def concat_audio(paths, output_file_path):
+    """
+    Stitches audio clips of the same format into one file without re-encoding.
+
+    Args:
+        paths (list): The clips, in order.
+        output_file_path (str): The path of the stitched file.
+
+    Returns:
+        str: output_file_path.
+
+    Raises:
+        subprocess.CalledProcessError: If FFmpeg fails.
+    """
+    if len(paths) == 1:
+        shutil.copyfile(paths[0], output_file_path)
+        return output_file_path
+
+    list_path = f"{output_file_path}.concat.txt"
+    with open(list_path, "w", encoding="utf-8") as file:
+        for path in paths:
+            file.write(concat_entry(path))
+    command = [ffmpeg_binary(), "-y", "-nostdin", "-loglevel", "error",
+               "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", output_file_path]
+    try:
+        subprocess.run(command, check=True, capture_output=True)
+    finally:
+        os.remove(list_path)
+    return output_file_path
+
+def script_to_speech(chat_api, tts_api, title, output_file_path, **options):
+    """
+    Streams a script for a title into sentence-level speech with the sync APIs.
+
+    Args:
+        chat_api (CHATApi): The chat API the script is streamed from.
+        tts_api (TTSApi): The TTS API the sentences are spoken with.
+        title (str): The title of the short.
+        output_file_path (str): Where to save the stitched narration.
+        **options: Passed to TTSApi.audio_speech_create_streamed (voice, workers, ...).
+
+    Returns:
+        tuple: (script, speech_path), where speech_path is None if the speech failed.
+
+    Raises:
+        APIError: If the script cannot be streamed.
+    """
+    sentences = []
+
+    def collect():
+        for sentence in chat_api.generate_script_stream(title):
+            sentences.append(sentence)
+            yield sentence
+
+    speech_path = tts_api.audio_speech_create_streamed(collect(), output_file_path, **options)
+    return " ".join(sentences), speech_path
+
+async def async_script_to_speech(chat_api, tts_api, title, output_file_path, **options):
+    """
+    Streams a script for a title into sentence-level speech with the async APIs.
+
+    Args:
+        chat_api (AsyncCHATApi): The chat API the script is streamed from.
+        tts_api (AsyncTTSApi): The TTS API the sentences are spoken with.
+        title (str): The title of the short.
+        output_file_path (str): Where to save the stitched narration.
+        **options: Passed to AsyncTTSApi.audio_speech_create_streamed (voice, ...).
+
+    Returns:
+        tuple: (script, speech_path), where speech_path is None if the speech failed.
+
+    Raises:
+        APIError: If the script cannot be streamed.
+    """
+    sentences = []
+
+    async def collect():
+        async for sentence in chat_api.generate_script_stream(title):
+            sentences.append(sentence)
+            yield sentence
+
+    speech_path = await tts_api.audio_speech_create_streamed(collect(), output_file_path,
+                                                             **options)
+    return " ".join(sentences), speech_path
@@ -0,0 +1,307 @@
+# coding: utf-8
+"""
+This module defines the TitleIndex class, a persistent index of every title ever
+produced, used to reject new titles that repeat or nearly repeat an old one before they
+are queued and paid for three more times (script, speech and render). Exact repeats are
+caught by a hash of the normalized title. Near repeats are caught with MinHash over
+character shingles and locality-sensitive hashing: each signature is cut into bands, and
+only titles sharing a band bucket are compared, so a lookup costs a few indexed queries
+whatever the size of the history.
+
+Modules Imported:
+- hashlib: Standard library for the normalized hash and the band hashes.
+- logging: Standard library for logging informational messages.
+- os: Standard library for interacting with the operating system.
+- re: Standard library for normalizing titles.
+- struct: Standard library for packing band hashes.
+- time: Standard library for timestamps.
+- unicodedata: Standard library for stripping accents.
+- zlib: Standard library providing the CRC-32 shingle hash.
+- numpy: Array library used to compute MinHash signatures.
+- SQLiteStore: Base class providing per-thread WAL connections and transactions.
+
+Classes:
+    TitleIndex: The SQLite-backed duplicate index of titles.
+
+Usage:
+    index = TitleIndex("temp/titles.sqlite3")
+    accepted = index.add_new(["5 Stoic Habits for Mental Toughness",
+                              "Five stoic habits for mental toughness!"])
+    # accepted == ["5 Stoic Habits for Mental Toughness"]
+"""
+
+from __future__ import absolute_import
+import hashlib
+import logging
+import os
+import re
+import struct
+import time
+import unicodedata
+import zlib
+
+import numpy as np
+
+from openai_api.sqlite_store import SQLiteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS titles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    normalized TEXT NOT NULL,
+    normalized_hash TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS title_bands (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    title_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS title_bands_bucket ON title_bands (band, bucket);
+"""
+
+NUM_PERMUTATIONS = 64
+BANDS = 16
+SHINGLE_SIZE = 4
+PRIME = (1 << 31) - 1
+
+NUMBER_WORDS = {"one": "1", "two": "2", "three": "3", "four": "4", "five": "5", "six": "6",
+                "seven": "7", "eight": "8", "nine": "9", "ten": "10"}
+
+_rng = np.random.default_rng(0x5EED)
+_A = _rng.integers(1, PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+def normalize_title(title):
+    """
+    Reduces a title to the form used for duplicate detection.
+
+    Accents, case, punctuation and extra whitespace are removed, and small number words
+    are written as digits, so "Five Stoic Habits!" and "5 stoic habits" normalize alike.
+
+    Args:
+        title (str): The title.
+
+    Returns:
+        str: The normalized title.
+    """
+    text = unicodedata.normalize("NFKD", title)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    words = re.sub(r"[^\w\s]", " ", text).split()
+    return " ".join(NUMBER_WORDS.get(word, word) for word in words)
+
+def shingles(normalized):
+    """
+    Returns the character shingles of a normalized title.
+
+    Args:
+        normalized (str): The normalized title.
+
+    Returns:
+        set: The distinct SHINGLE_SIZE-character substrings.
+    """
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+def minhash(shingle_set):
+    """
+    Computes the MinHash signature of a set of shingles.
+
+    Args:
+        shingle_set (set): The shingles.
+
+    Returns:
+        numpy.ndarray: NUM_PERMUTATIONS minimum hash values.
+    """
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set),
+                         dtype=np.uint64, count=len(shingle_set)) % PRIME
+    return ((np.outer(hashes, _A) + _B) % PRIME).min(axis=0)
+
+def band_buckets(signature):
+    """
+    Hashes each band of a signature to a bucket.
+
+    Args:
+        signature (numpy.ndarray): A MinHash signature.
+
+    Returns:
+        list: One signed 64-bit bucket per band, ready to store in SQLite.
+    """
+    rows = NUM_PERMUTATIONS // BANDS
+    return [struct.unpack("<q", hashlib.blake2b(band.tobytes(), digest_size=8).digest())[0]
+            for band in signature.reshape(BANDS, rows)]
+
+def jaccard(first, second):
+    """
+    Computes the Jaccard similarity of two sets.
+
+    Args:
+        first (set): A set.
+        second (set): Another set.
+
+    Returns:
+        float: The size of the intersection over the size of the union.
+    """
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+class TitleIndex(SQLiteStore):
+    """
+    A persistent index of every title ever produced, for rejecting duplicates.
+
+    Attributes:
+        db_path (str): The path of the SQLite database.
+        threshold (float): The shingle similarity from which a title is a near-duplicate.
+    """
+
+    def __init__(self, db_path, threshold=0.7):
+        """
+        Initializes the index and creates the database if necessary.
+
+        Args:
+            db_path (str): The path of the SQLite database.
+            threshold (float, optional): The Jaccard similarity of character shingles from
+                which a title counts as a near-duplicate. Defaults to 0.7.
+        """
+        super().__init__(db_path, SCHEMA)
+        self.threshold = threshold
+
+    @classmethod
+    def from_configuration(cls, configuration, job_store=None):
+        """
+        Opens the title index of the chat APIs, indexing the titles already in the job
+        store the first time it is created.
+
+        Args:
+            configuration (Configuration): The settings holding temp_dir.
+            job_store (JobStore, optional): The backlog whose titles seed a new index.
+
+        Returns:
+            TitleIndex: The index under temp_dir.
+        """
+        index = cls(os.path.join(configuration.temp_dir, "titles.sqlite3"))
+        if job_store is not None and len(index) == 0:
+            count = index.backfill(job_store.titles())
+            if count:
+                logging.info("Indexed %d titles from %s", count, job_store.db_path)
+        return index
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM titles").fetchone()[0]
+
+    def find_duplicate(self, title, connection=None):
+        """
+        Looks for an indexed title that repeats or nearly repeats a title.
+
+        Args:
+            title (str): The title to check.
+            connection (sqlite3.Connection, optional): The connection to query, used to
+                see titles added earlier in the same transaction.
+
+        Returns:
+            str: The indexed title it duplicates, or None if it is new.
+        """
+        connection = connection or self._connection()
+        normalized = normalize_title(title)
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        row = connection.execute("SELECT title FROM titles WHERE normalized_hash = ?",
+                                 (digest,)).fetchone()
+        if row is not None:
+            return row[0]
+
+        shingle_set = shingles(normalized)
+        for candidate, candidate_normalized in self._candidates(
+                connection, band_buckets(minhash(shingle_set))):
+            if jaccard(shingle_set, shingles(candidate_normalized)) >= self.threshold:
+                return candidate
+        return None
+
+    @staticmethod
+    def _candidates(connection, buckets):
+        """Returns the titles sharing at least one band bucket."""
+        clauses = " OR ".join("(band = ? AND bucket = ?)" for _ in buckets)
+        parameters = [value for band, bucket in enumerate(buckets) for value in (band, bucket)]
+        return connection.execute(
+            "SELECT title, normalized FROM titles WHERE id IN "
+            f"(SELECT title_id FROM title_bands WHERE {clauses})", parameters).fetchall()
+
+    def add_new(self, titles):
+        """
+        Indexes the titles that do not duplicate an indexed title or each other.
+
+        Args:
+            titles (iterable): The candidate titles. Blank titles are skipped.
+
+        Returns:
+            list: The titles accepted, in order.
+        """
+        accepted = []
+        now = time.time()
+        with self._transaction() as connection:
+            for title in titles:
+                title = title.strip() if title else ""
+                if not title:
+                    continue
+                if self.find_duplicate(title, connection) is not None:
+                    continue
+                self._insert(connection, title, now)
+                accepted.append(title)
+        return accepted
+
+    def remove(self, titles):
+        """
+        Removes titles from the index, e.g. accepted titles that then failed to queue.
+
+        Args:
+            titles (iterable): The titles, as add_new returned them.
+
+        Returns:
+            int: The number of titles removed.
+        """
+        count = 0
+        with self._transaction() as connection:
+            for title in titles:
+                digest = hashlib.sha1(normalize_title(title).encode("utf-8")).hexdigest()
+                row = connection.execute("SELECT id FROM titles WHERE normalized_hash = ?",
+                                         (digest,)).fetchone()
+                if row is None:
+                    continue
+                connection.execute("DELETE FROM title_bands WHERE title_id = ?", row)
+                connection.execute("DELETE FROM titles WHERE id = ?", row)
+                count += 1
+        return count
+
+    @staticmethod
+    def _insert(connection, title, now):
+        normalized = normalize_title(title)
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO titles (title, normalized, normalized_hash, created_at) "
+            "VALUES (?, ?, ?, ?)", (title, normalized, digest, now))
+        if cursor.rowcount:
+            connection.executemany(
+                "INSERT INTO title_bands (band, bucket, title_id) VALUES (?, ?, ?)",
+                [(band, bucket, cursor.lastrowid)
+                 for band, bucket in enumerate(band_buckets(minhash(shingles(normalized))))])
+
+    def backfill(self, titles):
+        """
+        Indexes historical titles without checking them, e.g. the job store's backlog
+        the first time the index is created.
+
+        Args:
+            titles (iterable): The titles.
+
+        Returns:
+            int: The number of titles indexed.
+        """
+        now = time.time()
+        count = 0
+        with self._transaction() as connection:
+            for title in titles:
+                if title and title.strip():
+                    self._insert(connection, title.strip(), now)
+                    count += 1
+        return count
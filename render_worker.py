@@ -0,0 +1,134 @@
+# coding: utf-8
+"""
+This module runs a render worker: a process that claims render specs from a spool and
+renders them, independently of the processes making the API calls. Any number of workers
+can consume the same spool, on this host or on other hosts that mount it at the same
+path, so rendering scales separately from API throughput. A worker heartbeats the spec
+it is rendering; if it dies, another worker reclaims the spec once its lease runs out.
+
+Modules Imported:
+- argparse: Standard library for parsing command line arguments.
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- socket: Standard library used to name the worker.
+- time: Standard library used to poll the spool.
+- video_processing: Package providing the renderer and the render spool.
+- instrumentation: Traces each render and exports the worker's metrics.
+
+Functions:
+    render_spec: Renders one claimed spec.
+    run_worker: Claims and renders specs until the spool is empty or forever.
+    main: Command line entry point.
+
+Usage:
+    python render_worker.py --spool /mnt/shared/render_spool --temp-dir temp
+    python batch.py --render-spool /mnt/shared/render_spool --count 20
+"""
+import argparse
+import logging
+import os
+import socket
+import time
+
+import video_processing
+import instrumentation
+
+def render_spec(process_client, spool, spec):
+    """
+    Renders one claimed spec, heartbeating it meanwhile, and records the outcome.
+
+    Args:
+        process_client (VideoProcessClient): The renderer.
+        spool (RenderSpool): The spool the spec was claimed from.
+        spec (RenderJobSpec): The claimed spec.
+
+    Returns:
+        bool: Whether the render succeeded.
+    """
+    try:
+        with instrumentation.job_context(spec.job_id), \
+                video_processing.Heartbeat(spool, spec) as heartbeat:
+            video_path = process_client.create_video(**spec.create_video_args())
+    except Exception as e: # pylint: disable=W0718:broad-exception-caught
+        logging.error("Render %s of job %s failed: %s", spec.spec_id, spec.job_id, e)
+        spool.fail(spec, e)
+        return False
+    if heartbeat.lost:
+        # Another worker owns the spec now and will record it
+        logging.warning("Render %s finished after its claim expired", spec.spec_id)
+        return False
+    spool.complete(spec, {"video": video_path, "worker": socket.gethostname()})
+    logging.info("Rendered %s for job %s", video_path, spec.job_id)
+    return True
+
+def run_worker(spool, temp_dir, *, once=False, poll_interval=2.0, metrics_path=None):
+    """
+    Claims and renders specs.
+
+    Args:
+        spool (RenderSpool): The spool to consume.
+        temp_dir (str): The directory for temporary storage, holding the word cache.
+        once (bool, optional): Stop when the spool is empty instead of waiting for more
+            specs. Defaults to False.
+        poll_interval (float, optional): Seconds between checks of an empty spool.
+            Defaults to 2 seconds.
+        metrics_path (str, optional): Where the worker's Prometheus metrics are written
+            after each render.
+
+    Returns:
+        int: The number of specs rendered.
+    """
+    rendered = 0
+    with video_processing.VideoProcessClient(temp_dir) as process_client:
+        while True:
+            spool.reap_expired()
+            spec = spool.claim()
+            if spec is None:
+                if once:
+                    return rendered
+                time.sleep(poll_interval)
+                continue
+            status = "done" if render_spec(process_client, spool, spec) else "failed"
+            rendered += status == "done"
+            instrumentation.REGISTRY.inc("shorts_render_specs_total", status=status)
+            instrumentation.export_metrics(metrics_path)
+
+def main(argv=None):
+    """
+    Command line entry point for render workers.
+
+    Args:
+        argv (list, optional): The command line arguments. Defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(description="Render videos from a render spool.")
+    parser.add_argument("--spool", required=True,
+                        help="The spool directory, shared with the batch runs.")
+    parser.add_argument("--temp-dir", default="temp",
+                        help="The directory for temporary storage. Defaults to temp.")
+    parser.add_argument("--lease", type=float, default=120,
+                        help="Seconds a claim survives without a heartbeat.")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="Claims per spec before it is failed for good.")
+    parser.add_argument("--poll", type=float, default=2.0,
+                        help="Seconds between checks of an empty spool.")
+    parser.add_argument("--once", action="store_true",
+                        help="Exit once the spool is empty.")
+    parser.add_argument("--metrics-dir", default=None,
+                        help="Where the trace and Prometheus metrics are written. "
+                             "Defaults to <temp_dir>/metrics.")
+    args = parser.parse_args(argv)
+
+    metrics_dir = args.metrics_dir or os.path.join(args.temp_dir, "metrics")
+    instrumentation.configure(metrics_dir)
+    spool = video_processing.RenderSpool(args.spool, args.lease, args.max_attempts)
+    # One metrics file per worker, so workers sharing a directory do not overwrite each other
+    metrics_path = os.path.join(metrics_dir,
+                                f"metrics-{socket.gethostname()}-{os.getpid()}.prom")
+    rendered = run_worker(spool, args.temp_dir, once=args.once, poll_interval=args.poll,
+                          metrics_path=metrics_path)
+    print(f"Rendered {rendered} videos.")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(process)d - %(message)s')
+    main()
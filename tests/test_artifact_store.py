@@ -0,0 +1,44 @@
+"""Tests for the garbage collection of openai_api.artifact_store.ArtifactStore."""
+# pylint: disable=C0116:missing-function-docstring
+import os
+
+from openai_api import artifact_store
+from openai_api.artifact_store import ArtifactStore
+from openai_api.manifest import JobManifest
+
+def commit(store, job_id, content):
+    workspace = store.workspace(job_id)
+    with open(workspace.output_path("speech.mp3"), "wb") as file:
+        file.write(content)
+    digest = workspace.commit("speech.mp3")
+    JobManifest(workspace).complete("speech", {"speech.mp3": digest})
+    return digest
+
+def test_gc_keeps_linked_objects(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    digest = commit(store, "1", b"speech")
+
+    assert store.gc(max_bytes=0)["objects"] == 0
+    assert os.path.exists(store.object_path(digest, ".mp3"))
+
+def test_gc_keeps_copied_objects_recorded_in_a_manifest(tmp_path, monkeypatch):
+    def no_links(source, destination):
+        raise OSError("Operation not permitted")
+
+    monkeypatch.setattr(artifact_store.os, "link", no_links)
+    store = ArtifactStore(str(tmp_path))
+    digest = commit(store, "1", b"speech")
+
+    assert store.gc(max_bytes=0)["objects"] == 0
+    assert os.path.exists(store.object_path(digest, ".mp3"))
+
+def test_gc_removes_objects_of_removed_workspaces(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    digest = commit(store, "1", b"speech")
+    for path in (store.workspace("1").directory, store.object_path(digest, ".mp3")):
+        os.utime(path, (0, 0))
+
+    removed = store.gc(max_age=60)
+
+    assert (removed["workspaces"], removed["objects"]) == (1, 1)
+    assert not os.path.exists(store.object_path(digest, ".mp3"))
@@ -0,0 +1,66 @@
+"""Tests for the concat list and output of video_processing.change_point_renderer."""
+# pylint: disable=C0116:missing-function-docstring
+import os
+import re
+import subprocess
+
+import numpy as np
+import pytest
+from moviepy.video.VideoClip import ColorClip, VideoClip
+
+from common.ffmpeg import ffmpeg_binary
+from video_processing.change_point_renderer import _write_states, render_change_points
+from video_processing.encoders import ENCODER_PROFILES
+from video_processing.subtitle_clip import SubtitleTrackClip
+from video_processing.text_cache import WordRaster
+
+WORDS = [{"word": "one", "start": 0.0, "end": 0.5}, {"word": "two", "start": 0.5, "end": 1.0}]
+
+class SolidRasterCache: # pylint: disable=R0903:too-few-public-methods
+    """Supplies a 2x2 opaque black raster for every word."""
+
+    def get(self, _text, _style):
+        return WordRaster(np.zeros((2, 2, 3), dtype=np.uint8), np.ones((2, 2)))
+
+def make_track(background=None):
+    background = background or ColorClip(size=(16, 16), color=(255, 255, 255), duration=1.5)
+    return SubtitleTrackClip(background, WORDS, SolidRasterCache())
+
+def test_concat_list_holds_each_state_and_repeats_the_last_frame(tmp_path):
+    frame_dir = tmp_path / "it's frames"
+    frame_dir.mkdir()
+    track = make_track()
+
+    with open(_write_states(track, track.caption_states(), str(frame_dir), 2),
+              encoding="utf-8") as file:
+        lines = file.read().splitlines()
+
+    escaped = str(frame_dir).replace("'", "'\\''")
+    assert lines == [f"file '{escaped}/00000.png'", "duration 0.500000",
+                     f"file '{escaped}/00001.png'", "duration 0.500000",
+                     f"file '{escaped}/00002.png'", "duration 0.500000",
+                     f"file '{escaped}/00002.png'"]
+    assert sorted(os.listdir(frame_dir)) == ["00000.png", "00001.png", "00002.png",
+                                             "states.txt"]
+
+def test_render_change_points_encodes_one_frame_per_state(tmp_path):
+    output = str(tmp_path / "video.mp4")
+
+    states = render_change_points(make_track(), output, ENCODER_PROFILES["x264_ultrafast"],
+                                  fps=10, temp_dir=str(tmp_path))
+
+    probe = subprocess.run([ffmpeg_binary(), "-i", output, "-f", "null", "-"],
+                           capture_output=True, check=True)
+    assert states == 3
+    # 1.5 seconds of held states at 10 fps
+    assert int(re.findall(rb"frame=\s*(\d+)", probe.stderr)[-1]) == 15
+    # The frame directory is removed once the video is written
+    assert os.listdir(tmp_path) == ["video.mp4"]
+
+def test_render_change_points_rejects_moving_backgrounds(tmp_path):
+    moving = VideoClip(lambda t: np.full((16, 16, 3), int(t * 100), dtype=np.uint8),
+                       duration=1.0)
+
+    with pytest.raises(ValueError):
+        render_change_points(make_track(moving), str(tmp_path / "video.mp4"),
+                             ENCODER_PROFILES["x264_ultrafast"])
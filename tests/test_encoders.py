@@ -0,0 +1,68 @@
+"""Tests for the profile and audio codec choices of video_processing.encoders."""
+# pylint: disable=C0116:missing-function-docstring
+import json
+import os
+import subprocess
+
+import pytest
+
+from common.ffmpeg import ffmpeg_binary
+from video_processing.encoders import (DEFAULT_PROFILE, ENCODER_PROFILES, EncoderProfile,
+                                       audio_codec, can_copy_audio, motion_profile,
+                                       resolve_profile)
+
+def write_recommendation(temp_dir, name):
+    os.makedirs(os.path.join(temp_dir, "benchmarks"))
+    with open(os.path.join(temp_dir, "benchmarks", "encoders.json"), "w",
+              encoding="utf-8") as file:
+        json.dump({"recommended": name}, file)
+
+def test_resolve_profile_rejects_an_unknown_requested_name(tmp_path):
+    with pytest.raises(ValueError, match="gone"):
+        resolve_profile("gone", temp_dir=str(tmp_path))
+
+def test_resolve_profile_defaults_without_benchmark_results(tmp_path):
+    assert resolve_profile(temp_dir=str(tmp_path)).name == DEFAULT_PROFILE
+
+def test_resolve_profile_follows_the_benchmark_recommendation(tmp_path):
+    write_recommendation(str(tmp_path), "x264_ultrafast")
+
+    assert resolve_profile(temp_dir=str(tmp_path)) is ENCODER_PROFILES["x264_ultrafast"]
+
+def test_resolve_profile_ignores_a_stale_recommendation(tmp_path):
+    write_recommendation(str(tmp_path), "gone")
+
+    assert resolve_profile(temp_dir=str(tmp_path)).name == DEFAULT_PROFILE
+
+def test_resolve_profile_passes_profiles_through(tmp_path):
+    profile = EncoderProfile("custom", "libx264", preset="slow", crf=18)
+
+    assert resolve_profile(profile, temp_dir=str(tmp_path)) is profile
+
+def test_motion_profile_drops_the_still_picture_tuning():
+    still = ENCODER_PROFILES["x264_veryfast"]
+    moving = motion_profile(still)
+
+    assert moving.tune is None and "-tune" not in moving.ffmpeg_args()
+    assert (moving.codec, moving.preset, moving.crf) == (still.codec, still.preset, still.crf)
+    assert still.tune == "stillimage"
+
+def test_motion_profile_keeps_untuned_profiles():
+    profile = EncoderProfile("custom", "libx264", preset="slow")
+
+    assert motion_profile(profile) is profile
+
+def test_audio_codec_reads_the_stream_codec(tmp_path):
+    path = str(tmp_path / "tone.mp3")
+    subprocess.run([ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "lavfi",
+                    "-i", "sine=duration=0.5", "-c:a", "libmp3lame", path], check=True)
+
+    assert audio_codec(path) == "mp3"
+    assert can_copy_audio(path)
+
+def test_audio_codec_without_an_audio_stream(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("not audio", encoding="utf-8")
+
+    assert audio_codec(str(path)) is None
+    assert not can_copy_audio(str(path))
@@ -0,0 +1,104 @@
+"""Tests for the leased claims of openai_api.job_store.JobStore."""
+# pylint: disable=C0116:missing-function-docstring
+import time
+
+from openai_api.job_store import JobStore, LeaseRenewal
+
+def make_store(tmp_path, **options):
+    return JobStore(str(tmp_path / "jobs.sqlite3"), **options)
+
+def test_claim_takes_pending_titles_in_order(tmp_path):
+    store = make_store(tmp_path)
+    store.add_titles(["first", " ", "second"])
+
+    assert [store.claim().title, store.claim().title] == ["first", "second"]
+    assert store.claim() is None
+
+def test_claim_resumes_expired_lease_before_pending_titles(tmp_path):
+    store = make_store(tmp_path, lease_seconds=0.01)
+    store.add_titles(["first", "second"])
+    abandoned = store.claim()
+    time.sleep(0.02)
+
+    job = store.claim()
+
+    assert (job.job_id, job.attempts) == (abandoned.job_id, 2)
+
+def test_expired_claims_count_against_attempts(tmp_path):
+    store = make_store(tmp_path, lease_seconds=0.01, max_attempts=2)
+    store.add_titles(["crashes its worker"])
+    for _ in range(2):
+        assert store.claim() is not None
+        time.sleep(0.02)
+
+    assert store.claim() is None
+    assert store.counts() == {"failed": 1}
+
+def test_failed_job_is_retried_until_attempts_run_out(tmp_path):
+    store = make_store(tmp_path, max_attempts=2)
+    store.add_titles(["flaky"])
+    for error in ("first", "second"):
+        job = store.claim()
+        assert store.mark_failed(job.job_id, error, worker=job.worker)
+
+    assert store.claim() is None
+
+def test_mark_done_records_artifacts_for_the_lease_holder(tmp_path):
+    store = make_store(tmp_path)
+    store.add_titles(["title"])
+    job = store.claim(worker="a")
+    store.record_artifacts(job.job_id, {"script": "text"})
+
+    assert store.mark_done(job.job_id, {"video": "video.mp4"}, worker="a")
+    assert store.counts() == {"done": 1}
+
+def test_stale_worker_cannot_finish_a_reclaimed_job(tmp_path):
+    store = make_store(tmp_path, lease_seconds=0.01)
+    store.add_titles(["title"])
+    stale = store.claim(worker="stale")
+    time.sleep(0.02)
+    current = store.claim(worker="current", lease_seconds=60)
+
+    assert not store.mark_failed(stale.job_id, "late", worker=stale.worker)
+    assert not store.mark_done(stale.job_id, {"video": "stale.mp4"}, worker=stale.worker)
+    assert store.counts() == {"claimed": 1}
+    assert store.mark_done(current.job_id, {"video": "video.mp4"}, worker=current.worker)
+
+def test_finished_job_cannot_be_finished_again(tmp_path):
+    store = make_store(tmp_path)
+    store.add_titles(["title"])
+    job = store.claim(worker="a")
+    store.mark_done(job.job_id, worker="a")
+
+    assert not store.mark_failed(job.job_id, "late", worker="a")
+    assert store.counts() == {"done": 1}
+
+def test_renew_requires_the_lease_holder(tmp_path):
+    store = make_store(tmp_path)
+    store.add_titles(["title"])
+    job = store.claim(worker="a")
+
+    assert store.renew(job.job_id, worker="a")
+    assert not store.renew(job.job_id, worker="b")
+
+def test_lease_renewal_outlasts_the_lease(tmp_path):
+    store = make_store(tmp_path, lease_seconds=0.2)
+    store.add_titles(["long render"])
+    job = store.claim(worker="a")
+
+    with LeaseRenewal(store, job.job_id, job.worker, interval=0.05) as renewal:
+        time.sleep(0.5)
+        assert store.claim(worker="b") is None
+    assert not renewal.lost
+    assert store.mark_done(job.job_id, worker="a")
+
+def test_lease_renewal_reports_a_lost_lease(tmp_path):
+    store = make_store(tmp_path, lease_seconds=0.01)
+    store.add_titles(["title"])
+    job = store.claim(worker="a")
+    time.sleep(0.02)
+    store.claim(worker="b", lease_seconds=60)
+
+    with LeaseRenewal(store, job.job_id, job.worker, interval=0.01) as renewal:
+        time.sleep(0.1)
+    assert renewal.lost
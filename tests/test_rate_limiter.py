@@ -0,0 +1,88 @@
+"""Tests for the retry accounting of openai_api.rate_limiter.RateLimiter."""
+# pylint: disable=C0116:missing-function-docstring
+import asyncio
+import types
+
+import httpx
+import openai
+import pytest
+
+from openai_api.configuration import Configuration
+from openai_api.rate_limiter import RateLimiter
+
+def timeout():
+    return openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com"))
+
+def flaky(failures, result="ok"):
+    """Returns a function that times out the given number of times, then returns result."""
+    calls = []
+
+    def func():
+        calls.append(None)
+        if len(calls) <= failures:
+            raise timeout()
+        return result
+    return func, calls
+
+def make_limiter(max_retries=3):
+    return RateLimiter({"chat": (60, 6000)}, max_retries=max_retries,
+                       base_delay=0.001, max_delay=0.001)
+
+def test_retries_are_charged_once():
+    limiter = make_limiter()
+    func, calls = flaky(2)
+
+    assert limiter.call("chat", func, tokens=1000) == "ok"
+
+    endpoint = limiter.endpoints["chat"]
+    assert len(calls) == 3
+    assert endpoint.requests.available() == pytest.approx(59, abs=0.1)
+    assert endpoint.tokens.available() == pytest.approx(5000, abs=1)
+
+def test_async_retries_are_charged_once():
+    limiter = make_limiter()
+    func, calls = flaky(2)
+
+    async def afunc():
+        return func()
+
+    assert asyncio.run(limiter.acall("chat", afunc, tokens=1000)) == "ok"
+
+    endpoint = limiter.endpoints["chat"]
+    assert len(calls) == 3
+    assert endpoint.requests.available() == pytest.approx(59, abs=0.1)
+    assert endpoint.tokens.available() == pytest.approx(5000, abs=1)
+
+def test_exhausted_retries_give_back_every_reservation():
+    limiter = make_limiter(max_retries=2)
+    func, calls = flaky(5)
+
+    with pytest.raises(openai.APITimeoutError):
+        limiter.call("chat", func, tokens=1000)
+
+    endpoint = limiter.endpoints["chat"]
+    assert len(calls) == 3
+    assert endpoint.requests.available() == pytest.approx(60, abs=0.1)
+    assert endpoint.tokens.available() == pytest.approx(6000, abs=1)
+
+def test_success_settles_the_estimate_against_usage():
+    limiter = make_limiter()
+    usage = types.SimpleNamespace(total_tokens=400, prompt_tokens=300, completion_tokens=100)
+
+    limiter.call("chat", lambda: types.SimpleNamespace(usage=usage), tokens=1000)
+
+    assert limiter.endpoints["chat"].tokens.available() == pytest.approx(5600, abs=1)
+
+def test_shared_limiters_are_keyed_on_their_settings(tmp_path):
+    temp_dir = str(tmp_path)
+    default = Configuration(api_key="key", temp_dir=temp_dir)
+    same = Configuration(api_key="key", temp_dir=temp_dir)
+    limited = Configuration(api_key="key", temp_dir=temp_dir, rate_limits={"chat": (10, 1000)})
+    patient = Configuration(api_key="key", temp_dir=temp_dir, max_retries=1)
+
+    shared = RateLimiter.for_configuration(default)
+
+    assert RateLimiter.for_configuration(same) is shared
+    assert RateLimiter.for_configuration(limited) is not shared
+    assert RateLimiter.for_configuration(limited).endpoints["chat"].requests.capacity == 10
+    assert RateLimiter.for_configuration(patient).max_retries == 1
@@ -0,0 +1,81 @@
+"""Tests for the claims of video_processing.render_spool.RenderSpool."""
+# pylint: disable=C0116:missing-function-docstring
+import os
+import threading
+import time
+
+import pytest
+
+from video_processing import render_spool
+from video_processing.render_spool import RenderJobSpec, RenderSpool
+
+def make_spec(index):
+    return RenderJobSpec(1.0, [{"word": "word", "start": 0.0, "end": 0.5}], None,
+                         f"video-{index}.mp4", job_id=index)
+
+def test_claim_takes_the_oldest_pending_spec(tmp_path):
+    spool = RenderSpool(str(tmp_path))
+    first = spool.submit(make_spec(1))
+    time.sleep(0.01)
+    spool.submit(make_spec(2))
+
+    spec = spool.claim("worker")
+
+    assert (spec.spec_id, spec.attempts) == (first, 1)
+    assert spool.counts()["claimed"] == 1
+
+def test_claim_skips_specs_taken_while_listing(tmp_path, monkeypatch):
+    spool = RenderSpool(str(tmp_path))
+    taken = spool.submit(make_spec(1))
+    remaining = spool.submit(make_spec(2))
+    scandir = os.scandir
+
+    def racing_scandir(path):
+        entries = list(scandir(path))
+        # Another worker claims a spec between the listing and the stat
+        os.remove(os.path.join(path, f"{taken}.json"))
+        return iter(entries)
+
+    monkeypatch.setattr(render_spool.os, "scandir", racing_scandir)
+
+    assert spool.claim("worker").spec_id == remaining
+
+def test_concurrent_workers_claim_each_spec_once(tmp_path):
+    spool = RenderSpool(str(tmp_path))
+    submitted = {spool.submit(make_spec(index)) for index in range(60)}
+    claimed, errors = [], []
+
+    def worker(name):
+        try:
+            while (spec := spool.claim(name)) is not None:
+                claimed.append(spec.spec_id)
+        except Exception as e: # pylint: disable=W0718:broad-exception-caught
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(f"worker-{index}",)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert sorted(claimed) == sorted(submitted)
+
+def test_expired_claim_is_reaped_until_attempts_run_out(tmp_path):
+    spool = RenderSpool(str(tmp_path), lease_seconds=0.01, max_attempts=2)
+    spec_id = spool.submit(make_spec(1))
+    for _ in range(2):
+        assert spool.claim("crashing").spec_id == spec_id
+        time.sleep(0.02)
+        assert spool.reap_expired() == 1
+
+    assert spool.claim("worker") is None
+    with pytest.raises(RuntimeError):
+        spool.wait(spec_id, timeout=1)
+
+def test_complete_records_the_result(tmp_path):
+    spool = RenderSpool(str(tmp_path))
+    spec_id = spool.submit(make_spec(1))
+    spool.complete(spool.claim("worker"), {"video": "video-1.mp4"})
+
+    assert spool.wait(spec_id, timeout=1) == {"video": "video-1.mp4"}
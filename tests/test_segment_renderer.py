@@ -0,0 +1,40 @@
+"""Tests for how video_processing.segment_renderer splits a timeline into segments."""
+# pylint: disable=C0116:missing-function-docstring
+from video_processing.segment_renderer import split_segments, segment_words
+
+def words_every(step, duration):
+    return [{"word": f"w{index}", "start": index * step, "end": (index + 1) * step}
+            for index in range(round(duration / step))]
+
+def test_split_segments_cuts_evenly_at_word_starts():
+    assert split_segments(words_every(0.5, 10.0), 10.0, 4) == [(0, 60), (60, 120),
+                                                              (120, 180), (180, 240)]
+
+def test_split_segments_moves_cuts_to_the_nearest_word_start():
+    words = [{"word": "a", "start": 0.0, "end": 3.1}, {"word": "b", "start": 3.1, "end": 6.0}]
+
+    assert split_segments(words, 6.0, 2) == [(0, 74), (74, 144)]
+
+def test_split_segments_covers_every_frame():
+    segments = split_segments(words_every(0.7, 20.3), 20.3, 5, fps=30)
+
+    assert segments[0][0] == 0 and segments[-1][1] == 609
+    assert all(end == start for (_, end), (start, _) in zip(segments, segments[1:]))
+    assert len(segments) == 5
+
+def test_split_segments_keeps_short_videos_whole():
+    assert split_segments(words_every(0.5, 3.0), 3.0, 8) == [(0, 72)]
+
+def test_split_segments_needs_word_boundaries():
+    words = [{"word": "long", "start": 0.0, "end": 10.0}]
+
+    assert split_segments(words, 10.0, 4) == [(0, 240)]
+
+def test_segment_words_shifts_and_clips_words_to_the_segment():
+    words = [{"word": "a", "start": 0.0, "end": 1.5}, {"word": "b", "start": 1.5, "end": 2.5},
+             {"word": "c", "start": 2.5, "end": 4.0}]
+
+    assert segment_words(words, 48, 96) == [{"word": "b", "start": 0.0, "end": 0.5},
+                                            {"word": "c", "start": 0.5, "end": 2.0}]
+    assert segment_words(words, 24, 48) == [{"word": "a", "start": 0.0, "end": 0.5},
+                                            {"word": "b", "start": 0.5, "end": 1.5}]
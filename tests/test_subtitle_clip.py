@@ -0,0 +1,72 @@
+"""Tests for the word lookup and frames of video_processing.subtitle_clip.SubtitleTrackClip."""
+# pylint: disable=C0116:missing-function-docstring
+import numpy as np
+from moviepy.video.VideoClip import ColorClip
+
+from video_processing.subtitle_clip import SubtitleTrackClip
+from video_processing.text_cache import WordRaster
+
+WORDS = [
+    {"word": "one", "start": 0.0, "end": 0.5},
+    {"word": "three", "start": 1.0, "end": 1.5},
+    {"word": "two", "start": 0.5, "end": 1.0},
+]
+
+class SolidRasterCache: # pylint: disable=R0903:too-few-public-methods
+    """Supplies a 2x2 opaque black raster for every word."""
+
+    def get(self, _text, _style):
+        return WordRaster(np.zeros((2, 2, 3), dtype=np.uint8), np.ones((2, 2)))
+
+def make_track(words=None, duration=2.0):
+    background = ColorClip(size=(6, 4), color=(255, 255, 255), duration=duration)
+    return SubtitleTrackClip(background, WORDS if words is None else words,
+                             SolidRasterCache())
+
+def test_active_indices_finds_the_word_on_screen():
+    track = make_track()
+
+    assert track.active_indices(0.0) == (0,)
+    assert track.active_indices(0.49) == (0,)
+    # A word ends where the next one starts
+    assert track.active_indices(0.5) == (1,)
+    assert track.active_indices(1.2) == (2,)
+    assert not track.active_indices(1.5)
+    assert not track.active_indices(-1.0)
+
+def test_active_indices_finds_overlapping_words():
+    track = make_track([{"word": "long", "start": 0.0, "end": 2.0},
+                        {"word": "short", "start": 0.5, "end": 0.6},
+                        {"word": "late", "start": 1.0, "end": 1.5}])
+
+    assert track.active_indices(0.55) == (0, 1)
+    assert track.active_indices(0.8) == (0,)
+    assert track.active_indices(1.2) == (0, 2)
+
+def test_caption_states_cover_the_track_and_merge_repeats():
+    track = make_track([{"word": "a", "start": 0.0, "end": 0.5},
+                        {"word": "gap", "start": 1.0, "end": 1.5}])
+
+    assert track.caption_states() == [(0.0, 0.5, (0,)), (0.5, 1.0, ()),
+                                       (1.0, 1.5, (1,)), (1.5, 2.0, ())]
+
+def test_caption_states_of_an_empty_track_is_one_blank_state():
+    assert make_track([]).caption_states() == [(0.0, 2.0, ())]
+
+def test_frames_blit_the_active_word_over_the_background():
+    track = make_track()
+
+    frame = track.get_frame(0.2)
+    blank = track.get_frame(1.8)
+
+    assert frame.shape == (4, 6, 3)
+    assert (frame[1:3, 2:4] == 0).all()
+    assert (frame[0] == 255).all() and (frame[:, 0] == 255).all()
+    assert (blank == 255).all()
+
+def test_static_frames_are_reused_while_the_caption_holds():
+    track = make_track()
+
+    assert track.is_static
+    assert track.get_frame(0.1) is track.get_frame(0.3)
+    assert track.get_frame(0.1) is not track.get_frame(0.7)
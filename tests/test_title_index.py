@@ -0,0 +1,59 @@
+"""Tests for the duplicate detection of openai_api.title_index.TitleIndex."""
+# pylint: disable=C0116:missing-function-docstring
+import sqlite3
+
+import pytest
+
+from openai_api.api.chat_api import queue_new_titles
+from openai_api.job_store import JobStore
+from openai_api.title_index import TitleIndex
+
+TITLE = "5 Stoic Habits for Mental Toughness"
+
+def make_index(tmp_path):
+    index = TitleIndex(str(tmp_path / "titles.sqlite3"))
+    index.add_new([TITLE])
+    return index
+
+def test_find_duplicate_matches_normalized_repeats(tmp_path):
+    index = make_index(tmp_path)
+
+    assert index.find_duplicate("Five stoic habits for mental toughness!") == TITLE
+    assert index.find_duplicate("  5 STOIC HABITS -- for mental toughness ") == TITLE
+
+def test_find_duplicate_matches_near_repeats(tmp_path):
+    index = make_index(tmp_path)
+
+    assert index.find_duplicate("5 Stoic Habits for Real Mental Toughness") == TITLE
+
+def test_find_duplicate_accepts_new_titles(tmp_path):
+    index = make_index(tmp_path)
+
+    assert index.find_duplicate("Why Octopuses Have Three Hearts") is None
+    assert index.find_duplicate("5 Habits of Highly Effective Sleepers") is None
+
+def test_add_new_rejects_repeats_within_a_batch(tmp_path):
+    index = TitleIndex(str(tmp_path / "titles.sqlite3"))
+
+    accepted = index.add_new([TITLE, "five stoic habits for mental toughness", " ", TITLE])
+
+    assert accepted == [TITLE]
+    assert len(index) == 1
+
+def test_queue_new_titles_unindexes_titles_that_fail_to_queue(tmp_path, monkeypatch):
+    index = make_index(tmp_path)
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+
+    def locked(titles):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(store, "add_titles", locked)
+    with pytest.raises(sqlite3.OperationalError):
+        queue_new_titles(index, store, ["Why Octopuses Have Three Hearts"])
+
+    assert index.find_duplicate("Why Octopuses Have Three Hearts") is None
+    assert index.find_duplicate(TITLE) == TITLE
+    monkeypatch.undo()
+    assert queue_new_titles(index, store, ["Why Octopuses Have Three Hearts"]) == \
+        ["Why Octopuses Have Three Hearts"]
+    assert store.claim().title == "Why Octopuses Have Three Hearts"
@@ -7,6 +7,8 @@ transcoding, and applying effects.
 
 Modules Imported:
 - VideoProcessClient: The main client class for video processing operations.
+- RenderJobSpec, RenderSpool, Heartbeat: Hand renders to render_worker.py processes.
+- BackgroundLibrary, Background: Looping background videos, transcoded once to proxies.
 
 Usage:
     from video_processing import VideoProcessClient
@@ -20,10 +22,22 @@ Attributes:
 
 Note:
     This file uses future imports for compatibility with Python 2 and 3.
-    Flake8 linting is disabled for this file.
+    Flake8 linting is disabled for this file. The names above are imported from their
+    modules on first use, so importing the package, e.g. in a freshly spawned worker,
+    does not load MoviePy.
 """
 
 from __future__ import absolute_import
+from common.lazy_exports import lazy_exports
 
-# import VideoProccessClient
-from video_processing.process_client import VideoProcessClient
+# The module each public name is loaded from on first use
+_EXPORTS = {
+    "VideoProcessClient": "video_processing.process_client",
+    "RenderJobSpec": "video_processing.render_spool",
+    "RenderSpool": "video_processing.render_spool",
+    "Heartbeat": "video_processing.render_spool",
+    "BackgroundLibrary": "video_processing.backgrounds",
+    "Background": "video_processing.backgrounds",
+}
+
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
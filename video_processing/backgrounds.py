@@ -0,0 +1,333 @@
+"""
+This module provides the library of looping background videos. Decoding, scaling and
+cropping arbitrary source footage on every render would cost more than the render itself,
+so each source is transcoded once into a render-ready proxy: 1080x1920 at the output frame
+rate, silent, with a keyframe every half second and the x264 fast-decode tuning, so that
+seeking to a random offset and decoding it again are cheap. Proxies are cached under the
+content hash of their source and the proxy settings, so a renamed source is not
+transcoded again and an edited one is.
+
+Layout:
+    <cache_dir>/<key>.mp4      The proxy.
+    <cache_dir>/<key>.json     Its metadata, written once the proxy is complete.
+    <cache_dir>/sources.json   The digests of the sources, by path, size and mtime.
+
+Modules Imported:
+- argparse: Standard library for parsing command line arguments.
+- hashlib: Standard library for deriving the proxy keys.
+- json: Standard library for the proxy metadata and the digest index.
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- random: Standard library used to pick a background and an offset for a job.
+- re: Standard library used to read the duration from FFmpeg's output.
+- subprocess: Standard library used to run FFmpeg.
+- time: Standard library used to time the transcodes.
+- ffmpeg_binary: The FFmpeg binary MoviePy is configured with.
+- file_digest: Hashes the sources.
+- VideoFileClip: MoviePy clip reading a proxy. Imported on first use.
+
+Classes:
+    Background: A proxy and the offset a video starts at in it.
+    BackgroundLibrary: The source footage and its cached proxies.
+
+Functions:
+    main: Command line entry point that transcodes the proxies ahead of a batch run.
+
+Usage:
+    library = BackgroundLibrary("footage", "temp/backgrounds")
+    library.prepare()
+    background = library.pick(duration, seed=job_id)
+    client.create_video(duration, words, "temp/speech.mp3", background=background)
+
+    python -m video_processing.backgrounds footage --cache-dir temp/backgrounds
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import subprocess
+import time
+
+from common.ffmpeg import ffmpeg_binary
+from common.storage import file_digest
+
+SOURCE_EXTENSIONS = (".mp4", ".mov", ".mkv", ".webm", ".avi", ".m4v")
+# Bumped whenever the transcode changes, so old proxies are not reused
+PROXY_VERSION = 1
+PROXY_SIZE = (1080, 1920)
+PROXY_FPS = 24
+# Seconds between keyframes; a seek decodes at most this much video
+PROXY_KEYFRAME_SECONDS = 0.5
+
+class Background:
+    """
+    A proxy and the offset a video starts at in it. Plain data, so it can be handed to
+    segment processes and stored in render specs.
+
+    Attributes:
+        path (str): The path of the proxy.
+        offset (float): The time in the proxy the video starts at.
+    """
+
+    def __init__(self, path, offset=0.0):
+        self.path = path
+        self.offset = offset
+
+    def shifted(self, seconds):
+        """
+        Returns the background of a part of the video starting later.
+
+        Args:
+            seconds (float): The start of the part in the video.
+
+        Returns:
+            Background: The same proxy, seconds further in.
+        """
+        return Background(self.path, self.offset + seconds)
+
+    def clip(self, duration, size=PROXY_SIZE):
+        """
+        Opens the proxy as a clip that starts at the offset and loops for the duration.
+
+        Args:
+            duration (float): The length of the clip in seconds.
+            size (tuple, optional): The frame size. FFmpeg scales the proxy while decoding
+                when it differs, e.g. for previews. Defaults to PROXY_SIZE.
+
+        Returns:
+            VideoClip: The clip. Close it to stop its FFmpeg reader.
+        """
+        from moviepy.video.io.VideoFileClip import VideoFileClip # pylint: disable=C0415:import-outside-toplevel
+        source = VideoFileClip(self.path, audio=False,
+                               target_resolution=None if tuple(size) == PROXY_SIZE
+                               else (size[1], size[0]))
+        fps, offset = source.fps, self.offset
+        # Loop one frame early, the reader cannot always reach the very last frame
+        period = max(1, round(source.duration * fps) - 1)
+        # Snap to whole proxy frames, so a segment shifted by its start reads the same
+        # frames as the single-pipeline render despite floating point error
+        return source.fl_time(lambda t: (round((offset + t) * fps) % period) / fps) \
+            .set_duration(duration)
+
+    def to_dict(self):
+        """
+        Returns the background as JSON-serializable data.
+
+        Returns:
+            dict: The path and offset.
+        """
+        return {"path": self.path, "offset": self.offset}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuilds a background from to_dict data.
+
+        Args:
+            data (dict): The path and offset.
+
+        Returns:
+            Background: The background.
+        """
+        return cls(data["path"], data.get("offset", 0.0))
+
+def _probe_duration(path):
+    """Returns the duration FFmpeg reports for a media file, or None."""
+    completed = subprocess.run([ffmpeg_binary(), "-hide_banner", "-nostdin", "-i", path],
+                               capture_output=True, check=False)
+    match = re.search(r"Duration: (\d+):(\d+):(\d+\.\d+)",
+                      completed.stderr.decode("utf-8", errors="replace"))
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+class BackgroundLibrary:
+    """
+    The source footage of the backgrounds and their cached proxies.
+
+    Attributes:
+        source_dir (str): The directory holding the source videos.
+        cache_dir (str): The absolute path of the directory holding the proxies.
+    """
+
+    def __init__(self, source_dir, cache_dir):
+        """
+        Initializes the library.
+
+        Args:
+            source_dir (str): The directory holding the source videos.
+            cache_dir (str): The directory holding the proxies. Render workers on other
+                hosts read the proxies from here, so put it on the shared mount when
+                rendering through a render spool.
+        """
+        self.source_dir = source_dir
+        self.cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._index_path = os.path.join(self.cache_dir, "sources.json")
+        self._proxies = None
+
+    def sources(self):
+        """
+        Lists the source videos.
+
+        Returns:
+            list: The paths of the sources, sorted.
+        """
+        if not os.path.isdir(self.source_dir):
+            return []
+        return sorted(os.path.join(self.source_dir, name) for name in os.listdir(self.source_dir)
+                      if name.lower().endswith(SOURCE_EXTENSIONS))
+
+    @staticmethod
+    def proxy_key(digest):
+        """
+        Derives the cache key of the proxy of a source.
+
+        Args:
+            digest (str): The SHA-256 digest of the source.
+
+        Returns:
+            str: The key, covering the source content and the proxy settings.
+        """
+        fields = (PROXY_VERSION, digest, PROXY_SIZE, PROXY_FPS, PROXY_KEYFRAME_SECONDS)
+        return hashlib.sha256(repr(fields).encode("utf-8")).hexdigest()
+
+    def prepare(self):
+        """
+        Transcodes every source that has no proxy yet. Sources that fail to transcode are
+        logged and left out.
+
+        Returns:
+            list: The metadata of the proxies, as dicts with "path", "source" and "duration".
+        """
+        index = self._load_index()
+        proxies = []
+        for source in self.sources():
+            try:
+                digest = self._source_digest(source, index)
+                proxies.append(self._proxy(source, self.proxy_key(digest)))
+            except (OSError, subprocess.CalledProcessError, ValueError) as e:
+                logging.error("Skipping background %s: %s", source, e)
+        self._save_index(index)
+        self._proxies = proxies
+        return proxies
+
+    def pick(self, duration, seed=None):
+        """
+        Picks a background for a video: a proxy, and an offset on a frame boundary to
+        start looping it from.
+
+        Args:
+            duration (float): The length of the video in seconds. Not needed to loop, but
+                logged so short proxies under long videos can be spotted.
+            seed (optional): Seeds the choice, e.g. with the job id, so a re-rendered job
+                gets the same background. Defaults to None, a random choice.
+
+        Returns:
+            Background: The background, or None if the library has no proxies.
+        """
+        if self._proxies is None:
+            self.prepare()
+        if not self._proxies:
+            return None
+        rng = random.Random(seed)
+        proxy = rng.choice(self._proxies)
+        offset = round(rng.uniform(0.0, proxy["duration"]) * PROXY_FPS) / PROXY_FPS
+        if proxy["duration"] < duration:
+            logging.info("Background %s loops under a %.1f s video", proxy["source"], duration)
+        return Background(proxy["path"], offset % proxy["duration"])
+
+    def _proxy(self, source, key):
+        """Returns the metadata of the proxy of a source, transcoding it on a miss."""
+        path = os.path.join(self.cache_dir, f"{key}.mp4")
+        metadata_path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(metadata_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            pass
+
+        started = time.perf_counter()
+        # Written under a private name and renamed, so concurrent runs never read half a proxy
+        temporary = f"{path}.{os.getpid()}.tmp.mp4"
+        width, height = PROXY_SIZE
+        command = [ffmpeg_binary(), "-y", "-nostdin", "-loglevel", "error", "-i", source, "-an",
+                   "-vf", f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+                          f"crop={width}:{height},fps={PROXY_FPS},setsar=1",
+                   "-c:v", "libx264", "-preset", "veryfast", "-crf", "20",
+                   "-tune", "fastdecode", "-g", str(round(PROXY_FPS * PROXY_KEYFRAME_SECONDS)),
+                   "-sc_threshold", "0", "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+                   temporary]
+        try:
+            subprocess.run(command, check=True, capture_output=True)
+            os.replace(temporary, path)
+        except subprocess.CalledProcessError as e:
+            logging.error("FFmpeg failed while transcoding %s: %s", source,
+                          e.stderr.decode("utf-8", errors="replace"))
+            raise
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+        duration = _probe_duration(path)
+        if not duration:
+            raise ValueError(f"Could not read the duration of the proxy {path}")
+        metadata = {"path": path, "source": os.path.basename(source), "duration": duration}
+        with open(f"{metadata_path}.{os.getpid()}.tmp", "w", encoding="utf-8") as file:
+            json.dump(metadata, file)
+        os.replace(f"{metadata_path}.{os.getpid()}.tmp", metadata_path)
+        logging.info("Transcoded background %s in %.1f s", source, time.perf_counter() - started)
+        return metadata
+
+    @staticmethod
+    def _source_digest(source, index):
+        """Returns the digest of a source, hashing it only when it changed since last time."""
+        stat = os.stat(source)
+        entry = index.get(os.path.abspath(source))
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["digest"]
+        digest = file_digest(source)
+        index[os.path.abspath(source)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                          "digest": digest}
+        return digest
+
+    def _load_index(self):
+        """Reads the digest index, or returns an empty one."""
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        """Writes the digest index."""
+        temporary = f"{self._index_path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(index, file)
+        os.replace(temporary, self._index_path)
+
+def main(argv=None):
+    """
+    Command line entry point that transcodes the proxies of a source directory ahead of
+    a batch run.
+
+    Args:
+        argv (list, optional): The command line arguments. Defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(description="Transcode background videos to proxies.")
+    parser.add_argument("source_dir", help="The directory holding the source videos.")
+    parser.add_argument("--cache-dir", default=os.path.join("temp", "backgrounds"),
+                        help="The directory holding the proxies. Defaults to temp/backgrounds.")
+    args = parser.parse_args(argv)
+    proxies = BackgroundLibrary(args.source_dir, args.cache_dir).prepare()
+    for proxy in proxies:
+        print(f"{proxy['source']}: {proxy['duration']:.1f} s -> {proxy['path']}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
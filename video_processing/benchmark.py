@@ -0,0 +1,483 @@
+"""
+This module benchmarks video rendering without any API calls, and the startup cost of the
+packages. Three suites are provided:
+
+- encoders renders a synthetic reference transcript with every encoder profile available
+  on the machine, records the wall time, output size and encoded frames per second of
+  each, and stores the results so resolve_profile can pick the fastest acceptable
+  profile for the machine.
+- render renders synthetic word timelines of several lengths, silent or over synthetic
+  audio, through every render mode of create_video. Each case runs in a fresh process so
+  its peak memory is its own, and the report can be compared against a stored baseline
+  so render optimizations are backed by numbers and regressions fail the run.
+- imports imports each package and entry point in a fresh interpreter under
+  -X importtime, and fails the run if one of them takes longer than its budget or loads
+  a heavy dependency, such as MoviePy or OpenAI, that must only load when first used.
+
+Modules Imported:
+- argparse: Standard library for parsing command line arguments.
+- json: Standard library for writing the results.
+- logging: Standard library for logging error and informational messages.
+- multiprocessing: Standard library used to run each render case in a fresh process.
+- os: Standard library for interacting with the operating system.
+- random: Standard library used to build reproducible synthetic transcripts.
+- subprocess: Standard library used to run FFmpeg.
+- sys: Standard library used to detect the platform.
+- time: Standard library used to measure wall time.
+- ProcessPoolExecutor: Runs a render case in a child process.
+- resource: Unix-only standard library reporting peak memory. Optional.
+- VideoProcessClient: The client whose renders are measured.
+- encoders: The encoder profile registry.
+
+Functions:
+    synthetic_timeline: Builds a reproducible word timeline.
+    synthetic_audio: Writes silent or tone audio of a given length.
+    benchmark_encoders: Renders the reference transcript with each available profile.
+    benchmark_render: Renders synthetic timelines with each render mode.
+    compare_to_baseline: Compares a render report against a stored one.
+    measure_import: Measures the import of one module in a fresh interpreter.
+    benchmark_imports: Measures the imports of the packages and entry points.
+    main: Command line entry point.
+
+Usage:
+    python -m video_processing.benchmark encoders --words 80 --mode change_points
+    python -m video_processing.benchmark render --words 10 100 500 --save-baseline
+    python -m video_processing.benchmark render --compare
+    python -m video_processing.benchmark imports --budget-ms 250
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+
+from common.ffmpeg import ffmpeg_binary
+from video_processing.process_client import VideoProcessClient, RENDER_MODES
+from video_processing.encoders import (BENCHMARK_RESULTS_FILE, ENCODER_PROFILES,
+                                       available_profiles)
+
+VOCABULARY = (
+    "the you to and a of is it that in your what this for are be not with",
+    "mind strength every day stoic control fear discipline calm focus choose",
+    "pain growth habit resilience patience courage adversity question why",
+)
+
+FPS = 24
+
+RENDER_WORD_COUNTS = (10, 100, 500)
+AUDIO_KINDS = ("none", "silent", "tone")
+RENDER_RESULTS_FILE = os.path.join("benchmarks", "render.json")
+RENDER_BASELINE_FILE = os.path.join("benchmarks", "render_baseline.json")
+# The metrics compared against the baseline; higher is worse for each of them
+BASELINE_METRICS = ("wall_time", "peak_rss", "file_size")
+
+# The packages and entry points whose import must stay cheap
+IMPORT_TARGETS = ("openai_api", "video_processing", "instrumentation", "batch",
+                  "render_worker", "gui", "main")
+# Heavy dependencies that importing a target must not load; they load on first use
+DEFERRED_MODULES = ("moviepy", "openai", "httpx", "imageio_ffmpeg", "PIL", "numpy")
+IMPORT_BUDGET_MS = 250
+IMPORT_RESULTS_FILE = os.path.join("benchmarks", "imports.json")
+# The directory the top-level modules are imported from
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def synthetic_timeline(num_words, word_duration=0.3, gap=0.05, seed=0):
+    """
+    Builds a reproducible word timeline shaped like a Whisper transcription.
+
+    Args:
+        num_words (int): The number of words.
+        word_duration (float, optional): The average time a word is on screen.
+            Defaults to 0.3 seconds.
+        gap (float, optional): The pause between words. Defaults to 0.05 seconds.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        tuple: (words, duration), where words is a list of {"word", "start", "end"} dicts.
+    """
+    rng = random.Random(seed)
+    vocabulary = " ".join(VOCABULARY).split()
+    words = []
+    position = gap
+    for _ in range(num_words):
+        length = word_duration * rng.uniform(0.5, 1.5)
+        words.append({"word": rng.choice(vocabulary), "start": round(position, 3),
+                      "end": round(position + length, 3)})
+        position += length + gap
+    return words, round(position + gap, 3)
+
+def synthetic_audio(duration, output_file, kind="silent"):
+    """
+    Writes an MP3 of a given length, shaped like the TTS output, for renders with audio.
+
+    Args:
+        duration (float): The length in seconds.
+        output_file (str): The path of the MP3 file.
+        kind (str, optional): "silent" for digital silence, "tone" for a 220 Hz sine,
+            which unlike silence costs the audio encoder real work. Defaults to "silent".
+
+    Returns:
+        str: output_file.
+
+    Raises:
+        subprocess.CalledProcessError: If FFmpeg fails.
+    """
+    source = ("anullsrc=r=24000:cl=mono" if kind == "silent"
+              else "sine=frequency=220:sample_rate=24000")
+    command = [ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "lavfi",
+               "-i", source, "-t", f"{duration:.3f}", "-c:a", "libmp3lame", "-b:a", "64k",
+               output_file]
+    subprocess.run(command, check=True, capture_output=True)
+    return output_file
+
+def benchmark_encoders(temp_dir="temp", profiles=None, num_words=80, # pylint: disable=R0913:too-many-arguments
+                       render_mode="frames", max_size_ratio=2.0):
+    """
+    Renders the reference transcript with each profile and measures it.
+
+    Args:
+        temp_dir (str, optional): The directory for temporary storage and results.
+            Defaults to "temp".
+        profiles (list, optional): The profile names to measure. Profiles whose encoder
+            is not available are skipped. Defaults to every available profile.
+        num_words (int, optional): The length of the reference transcript. Defaults to 80.
+        render_mode (str, optional): The render mode passed to create_video.
+            Defaults to "frames".
+        max_size_ratio (float, optional): How much larger than the smallest output a
+            file may be for its profile to be acceptable. Defaults to 2.0.
+
+    Returns:
+        dict: The results per profile and the recommended profile.
+    """
+    selected = _select_profiles(profiles)
+    words, duration = synthetic_timeline(num_words)
+    output_dir = os.path.join(temp_dir, "benchmarks")
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    with VideoProcessClient(temp_dir) as client:
+        # Rasterize the words up front so only rendering and encoding are measured
+        client.word_cache.prefetch((item["word"] for item in words), client.text_style)
+        for profile in selected:
+            result = {"profile": profile.name, "codec": profile.codec}
+            result.update(_measure_render(client, words, duration,
+                                          os.path.join(output_dir, f"{profile.name}.mp4"),
+                                          render_mode=render_mode, encoder=profile))
+            results.append(result)
+            logging.info("Encoder benchmark %s: %s", profile.name, result)
+
+    report = {"render_mode": render_mode, "num_words": num_words, "duration": duration,
+              "results": results, "recommended": _pick_fastest(results, max_size_ratio)}
+    with open(os.path.join(temp_dir, BENCHMARK_RESULTS_FILE), "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=4)
+    return report
+
+def _select_profiles(names):
+    """Returns the available profiles among names, or all available profiles."""
+    selected = available_profiles()
+    if names is None:
+        return selected
+    skipped = set(names) - {profile.name for profile in selected}
+    if skipped:
+        logging.warning("Skipping unavailable encoder profiles: %s", sorted(skipped))
+    return [profile for profile in selected if profile.name in names]
+
+def _measure_render(client, words, duration, output_file, **options):
+    """Renders a timeline with create_video and returns its wall time, size and fps."""
+    frames = int(duration * FPS)
+    start = time.perf_counter()
+    client.create_video(duration, words, output_file=output_file, **options)
+    wall_time = time.perf_counter() - start
+    return {
+        "wall_time": round(wall_time, 3),
+        "frames": frames,
+        "per_frame_ms": round(1000 * wall_time / frames, 3),
+        "file_size": os.path.getsize(output_file),
+        "fps": round(frames / wall_time, 2),
+    }
+
+def _peak_rss():
+    """Returns the peak resident set size of this process in bytes, or None if unknown."""
+    if resource is None:
+        return None
+    # FFmpeg's peak is not reported: a forked child starts with the RSS of its parent,
+    # so RUSAGE_CHILDREN would mostly measure this process again
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _render_case(temp_dir, num_words, render_mode, audio, encoder): # pylint: disable=R0913:too-many-arguments
+    """
+    Renders one benchmark case and measures it. Runs in a child process.
+
+    Returns:
+        dict: The measurements of the case.
+    """
+    words, duration = synthetic_timeline(num_words)
+    output_dir = os.path.join(temp_dir, "benchmarks")
+    name = f"render_{render_mode}_{num_words}_{audio}"
+    audio_file = None
+    if audio != "none":
+        audio_file = synthetic_audio(duration, os.path.join(output_dir, f"{name}.mp3"), audio)
+
+    with VideoProcessClient(temp_dir) as client:
+        # Rasterize the words up front so only rendering and encoding are measured
+        client.word_cache.prefetch((item["word"] for item in words), client.text_style)
+        result = {"render_mode": render_mode, "num_words": num_words, "audio": audio,
+                  "duration": duration}
+        result.update(_measure_render(client, words, duration,
+                                      os.path.join(output_dir, f"{name}.mp4"),
+                                      audio_file=audio_file, render_mode=render_mode,
+                                      encoder=encoder))
+    result["peak_rss"] = _peak_rss()
+    return result
+
+def _case_key(result):
+    return f"{result['render_mode']}/{result['num_words']}/{result['audio']}"
+
+def benchmark_render(temp_dir="temp", word_counts=RENDER_WORD_COUNTS, modes=None, *, # pylint: disable=R0913:too-many-arguments
+                     audio="silent", encoder=None, repeat=1):
+    """
+    Renders synthetic timelines with each render mode and measures them.
+
+    Every case runs in a fresh process, so its peak RSS is not inflated by the cases
+    before it. With repeat > 1 the fastest run of a case is kept, which is the least
+    disturbed by other load on the machine.
+
+    Args:
+        temp_dir (str, optional): The directory for temporary storage and results.
+            Defaults to "temp".
+        word_counts (iterable, optional): The timeline lengths, in words.
+            Defaults to RENDER_WORD_COUNTS.
+        modes (iterable, optional): The render modes. Defaults to every mode.
+        audio (str, optional): "none", "silent" or "tone". Defaults to "silent".
+        encoder (str, optional): The encoder profile name. Defaults to the profile
+            resolve_profile picks.
+        repeat (int, optional): How many times each case is run. Defaults to 1.
+
+    Returns:
+        dict: The measurements of each case.
+    """
+    os.makedirs(os.path.join(temp_dir, "benchmarks"), exist_ok=True)
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for render_mode in modes or RENDER_MODES:
+        for num_words in word_counts:
+            runs = []
+            for _ in range(max(1, repeat)):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    runs.append(executor.submit(_render_case, temp_dir, num_words,
+                                                render_mode, audio, encoder).result())
+            result = min(runs, key=lambda run: run["wall_time"])
+            results.append(result)
+            logging.info("Render benchmark %s: %s", _case_key(result), result)
+
+    report = {"encoder": encoder, "fps": FPS, "results": results}
+    with open(os.path.join(temp_dir, RENDER_RESULTS_FILE), "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=4)
+    return report
+
+def compare_to_baseline(report, baseline, tolerance=0.1):
+    """
+    Compares a render report against a baseline report.
+
+    Args:
+        report (dict): The report from benchmark_render.
+        baseline (dict): An earlier report.
+        tolerance (float, optional): How much worse than the baseline a metric may be
+            before it counts as a regression, as a fraction. Defaults to 0.1.
+
+    Returns:
+        dict: For each case present in both reports, the ratio of each metric to its
+            baseline value, plus the list of regressions as "case: metric" strings.
+    """
+    previous = {_case_key(result): result for result in baseline.get("results", [])}
+    cases = {}
+    regressions = []
+    for result in report["results"]:
+        key = _case_key(result)
+        if key not in previous:
+            continue
+        ratios = {}
+        for metric in BASELINE_METRICS:
+            old, new = previous[key].get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            ratios[metric] = round(new / old, 3)
+            if ratios[metric] > 1 + tolerance:
+                regressions.append(f"{key}: {metric}")
+        cases[key] = ratios
+    return {"tolerance": tolerance, "cases": cases, "regressions": regressions}
+
+def measure_import(module):
+    """
+    Imports a module in a fresh interpreter under -X importtime.
+
+    Args:
+        module (str): The module to import.
+
+    Returns:
+        tuple: (milliseconds, loaded), the cumulative import time of the module and the
+            set of top-level packages the interpreter had loaded.
+
+    Raises:
+        subprocess.CalledProcessError: If the import fails.
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=REPO_ROOT, check=True, capture_output=True, text=True)
+    milliseconds, loaded = None, set()
+    # Lines read "import time: <self us> | <cumulative us> | <indented name>"
+    for line in completed.stderr.splitlines():
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        loaded.add(name.strip().split(".")[0])
+        if name == f" {module}":
+            milliseconds = int(fields[1]) / 1000
+    return milliseconds, loaded
+
+def benchmark_imports(temp_dir="temp", modules=IMPORT_TARGETS, *, repeat=3,
+                      budget_ms=IMPORT_BUDGET_MS):
+    """
+    Measures the import of each module and checks it against the budget.
+
+    Args:
+        temp_dir (str, optional): The directory for temporary storage. Defaults to "temp".
+        modules (tuple, optional): The modules to import. Defaults to IMPORT_TARGETS.
+        repeat (int, optional): Imports per module; the fastest counts. Defaults to 3.
+        budget_ms (float, optional): The most a module may take to import.
+            Defaults to IMPORT_BUDGET_MS.
+
+    Returns:
+        dict: The results per module and the list of failures, which is empty when every
+            module is within budget and defers every heavy dependency.
+    """
+    results, failures = [], []
+    for module in modules:
+        timings, loaded = [], set()
+        for _ in range(max(1, repeat)):
+            milliseconds, loaded = measure_import(module)
+            timings.append(milliseconds)
+        deferred = sorted(loaded.intersection(DEFERRED_MODULES))
+        result = {"module": module, "import_ms": round(min(timings), 1), "loads": deferred}
+        results.append(result)
+        logging.info("Imported %s in %.1f ms", module, result["import_ms"])
+        if deferred:
+            failures.append(f"{module} loads {', '.join(deferred)} on import")
+        if result["import_ms"] > budget_ms:
+            failures.append(f"{module} takes {result['import_ms']} ms to import, "
+                            f"over the {budget_ms} ms budget")
+
+    report = {"python": sys.version.split()[0], "budget_ms": budget_ms,
+              "results": results, "failures": failures}
+    results_path = os.path.join(temp_dir, IMPORT_RESULTS_FILE)
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    with open(results_path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=4)
+    return report
+
+def _pick_fastest(results, max_size_ratio):
+    """Returns the fastest profile whose output is within max_size_ratio of the smallest."""
+    if not results:
+        return None
+    smallest = min(result["file_size"] for result in results)
+    acceptable = [result for result in results
+                  if result["file_size"] <= smallest * max_size_ratio]
+    return min(acceptable, key=lambda result: result["wall_time"])["profile"]
+
+def main(argv=None):
+    """
+    Command line entry point for the render benchmarks.
+
+    Args:
+        argv (list, optional): The command line arguments. Defaults to sys.argv.
+
+    Returns:
+        int: The exit status, 1 if the render benchmark regressed against the baseline
+            or an import went over its budget. Exits with status 2 when --compare has no
+            baseline to compare against and --save-baseline is not given.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark video rendering offline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    encoders_parser = subparsers.add_parser(
+        "encoders", help="Render a reference transcript with each encoder profile.")
+    encoders_parser.add_argument("--temp-dir", default="temp")
+    encoders_parser.add_argument("--profiles", nargs="+", choices=sorted(ENCODER_PROFILES))
+    encoders_parser.add_argument("--words", type=int, default=80)
+    encoders_parser.add_argument("--mode", default="frames", choices=("frames", "change_points"))
+    encoders_parser.add_argument("--max-size-ratio", type=float, default=2.0)
+
+    render_parser = subparsers.add_parser(
+        "render", help="Render synthetic timelines with each render mode.")
+    render_parser.add_argument("--temp-dir", default="temp")
+    render_parser.add_argument("--words", type=int, nargs="+", default=list(RENDER_WORD_COUNTS))
+    render_parser.add_argument("--modes", nargs="+", choices=RENDER_MODES)
+    render_parser.add_argument("--audio", default="silent", choices=AUDIO_KINDS)
+    render_parser.add_argument("--encoder", choices=sorted(ENCODER_PROFILES))
+    render_parser.add_argument("--repeat", type=int, default=1)
+    render_parser.add_argument("--baseline", default=None,
+                               help="The baseline report. Defaults to "
+                                    f"<temp-dir>/{RENDER_BASELINE_FILE}.")
+    render_parser.add_argument("--compare", action="store_true",
+                               help="Compare against the baseline and fail on regressions.")
+    render_parser.add_argument("--tolerance", type=float, default=0.1)
+    render_parser.add_argument("--save-baseline", action="store_true",
+                               help="Store this run as the new baseline.")
+
+    imports_parser = subparsers.add_parser(
+        "imports", help="Measure the import time of the packages and entry points.")
+    imports_parser.add_argument("--temp-dir", default="temp")
+    imports_parser.add_argument("--modules", nargs="+", default=list(IMPORT_TARGETS))
+    imports_parser.add_argument("--repeat", type=int, default=3)
+    imports_parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS,
+                                help="Fail when a module takes longer than this to import.")
+
+    args = parser.parse_args(argv)
+    if args.command == "imports":
+        report = benchmark_imports(args.temp_dir, args.modules, repeat=args.repeat,
+                                   budget_ms=args.budget_ms)
+        print(json.dumps(report, indent=4))
+        return 1 if report["failures"] else 0
+    if args.command == "encoders":
+        report = benchmark_encoders(args.temp_dir, args.profiles, args.words, args.mode,
+                                    args.max_size_ratio)
+        print(json.dumps(report, indent=4))
+        return 0
+
+    baseline_path = args.baseline or os.path.join(args.temp_dir, RENDER_BASELINE_FILE)
+    has_baseline = os.path.exists(baseline_path)
+    # Checked before rendering, so a missing baseline does not cost a whole run
+    if args.compare and not has_baseline and not args.save_baseline:
+        render_parser.error(f"no baseline at {baseline_path}; run with --save-baseline first")
+    report = benchmark_render(args.temp_dir, args.words, args.modes, audio=args.audio,
+                              encoder=args.encoder, repeat=args.repeat)
+    status = 0
+    if args.compare and not has_baseline:
+        print(f"No baseline at {baseline_path} to compare against; saving this run as it.",
+              file=sys.stderr)
+    elif args.compare:
+        with open(baseline_path, "r", encoding="utf-8") as file:
+            report["comparison"] = compare_to_baseline(report, json.load(file), args.tolerance)
+        status = 1 if report["comparison"]["regressions"] else 0
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
+    print(json.dumps(report, indent=4))
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+This module renders a subtitle track by composing only the frames where the caption
+changes. A Short is a static background with one word swapped in at each word boundary,
+so instead of compositing every frame at the output frame rate, each distinct caption
+state is rendered once and FFmpeg's concat demuxer holds it for its duration. The fps
+filter then duplicates the held frames to a constant output frame rate inside FFmpeg, or
+the states are kept as variable-frame-rate frames when that is acceptable.
+
+Modules Imported:
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- shutil: Standard library used to remove the temporary frame directory.
+- subprocess: Standard library used to run FFmpeg.
+- tempfile: Standard library used to create the temporary frame directory.
+- ThreadPoolExecutor: Pool used to encode the state frames concurrently.
+- numpy: Array library used to convert frames before writing them.
+- Image: Pillow image type used to write the state frames.
+- audio_args, concat_entry, ffmpeg_binary: The audio codec arguments, concat list lines
+    and the FFmpeg binary.
+
+Functions:
+    render_change_points: Renders a SubtitleTrackClip to an MP4 file, one frame per state.
+
+Usage:
+    track = SubtitleTrackClip(background, words, cache)
+    render_change_points(track, "temp/video.mp4", resolve_profile(),
+                         audio_file="temp/speech.mp3")
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from common.ffmpeg import concat_entry, ffmpeg_binary
+from video_processing.encoders import audio_args
+
+def _write_frame(frame, path):
+    Image.fromarray(frame.astype(np.uint8)).save(path, compress_level=1)
+
+def _write_states(track, states, frame_dir, workers):
+    """
+    Composites one frame per caption state and writes the concat demuxer list.
+
+    Returns:
+        str: The path of the concat list.
+    """
+    list_path = os.path.join(frame_dir, "states.txt")
+    # Frames are composited in order, but PNG encoding releases the GIL and runs in a pool
+    with open(list_path, "w", encoding="utf-8") as list_file, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        writes = []
+        for index, (start, end, _active) in enumerate(states):
+            frame_path = os.path.join(frame_dir, f"{index:05d}.png")
+            writes.append(executor.submit(_write_frame, track.get_frame(start), frame_path))
+            list_file.write(f"{concat_entry(frame_path)}duration {end - start:.6f}\n")
+        # The concat demuxer ignores the duration of the last entry unless it is repeated
+        list_file.write(concat_entry(frame_path))
+        for write in writes:
+            write.result()
+    return list_path
+
+def render_change_points(track, output_file, encoder, *, audio_file=None, fps=24, # pylint: disable=R0913:too-many-arguments
+                         temp_dir=None, variable_frame_rate=False):
+    """
+    Renders a subtitle track to a video file, compositing one frame per caption state.
+
+    Args:
+        track (SubtitleTrackClip): The track to render. Its background must be static.
+        output_file (str): The path of the video file to write.
+        encoder (EncoderProfile): The encoder settings.
+        audio_file (str, optional): The audio to mux into the video. Defaults to None.
+        fps (int, optional): The frame rate of the output. Defaults to 24.
+        temp_dir (str, optional): Where the state frames are written. Defaults to the
+            system temporary directory.
+        variable_frame_rate (bool, optional): Whether to encode each state as a single
+            long frame instead of duplicating it up to fps. This is much cheaper to encode,
+            but not every player handles variable frame rate well. Defaults to False.
+
+    Returns:
+        int: The number of frames that were composited.
+
+    Raises:
+        ValueError: If the track has a moving background or no duration.
+        subprocess.CalledProcessError: If FFmpeg fails.
+    """
+    if not track.is_static:
+        raise ValueError("Change-point rendering requires a static background.")
+
+    states = track.caption_states()
+    if not states:
+        raise ValueError("Cannot render a track with no duration.")
+    frame_dir = tempfile.mkdtemp(prefix="states_", dir=temp_dir)
+    try:
+        list_path = _write_states(track, states, frame_dir, encoder.threads or 1)
+        command = [ffmpeg_binary(), "-y", "-loglevel", "error",
+                   "-f", "concat", "-safe", "0", "-i", list_path]
+        if audio_file:
+            command += ["-i", audio_file]
+        if variable_frame_rate:
+            command += ["-fps_mode", "vfr"]
+        else:
+            command += ["-vf", f"fps={fps}"]
+        command += encoder.ffmpeg_args() + ["-pix_fmt", "yuv420p"]
+        if audio_file:
+            command += audio_args(audio_file) + ["-shortest"]
+        command += ["-t", f"{track.duration:.6f}", output_file]
+
+        subprocess.run(command, check=True, capture_output=True)
+        logging.info("Rendered %s from %d caption states", output_file, len(states))
+        return len(states)
+    except subprocess.CalledProcessError as e:
+        logging.error("FFmpeg failed while rendering %s: %s", output_file,
+                      e.stderr.decode("utf-8", errors="replace"))
+        raise
+    finally:
+        shutil.rmtree(frame_dir, ignore_errors=True)
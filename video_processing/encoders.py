@@ -0,0 +1,288 @@
+"""
+This module defines the named encoder profiles used to write videos, detects which of
+them the local FFmpeg build can actually run, and picks the profile a machine should use.
+The choice is driven by the measurements stored by the encoder benchmark
+(see video_processing.benchmark), falling back to a CPU profile that works everywhere.
+It also decides how the narration goes into the video: audio the MP4 container can carry
+as it is, like the MP3 the TTS API returns, is muxed by stream copy instead of being
+decoded and encoded again.
+
+Modules Imported:
+- copy: Standard library used to derive the motion variant of a profile.
+- functools: Standard library used to memoize encoder detection.
+- json: Standard library for reading benchmark results.
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- re: Standard library used to read the audio codec from FFmpeg's output.
+- subprocess: Standard library used to probe FFmpeg.
+- ffmpeg_binary: The FFmpeg binary MoviePy is configured with.
+
+Classes:
+    EncoderProfile: A named set of encoder settings.
+
+Functions:
+    available_encoders: Returns the FFmpeg encoders that can encode on this machine.
+    available_profiles: Returns the profiles whose encoder is available.
+    resolve_profile: Picks the profile to render with.
+    motion_profile: Returns a profile without a tuning meant for still pictures.
+    audio_codec: Returns the codec of the first audio stream of a file.
+    can_copy_audio: Checks whether an audio file can be muxed into MP4 by stream copy.
+    audio_args: Returns the FFmpeg arguments that put an audio file into an MP4.
+
+Usage:
+    profile = resolve_profile("x264_veryfast", temp_dir="temp")
+    clip.write_videofile("video.mp4", **profile.write_videofile_args())
+    command += ["-i", "temp/speech.mp3"] + audio_args("temp/speech.mp3")
+"""
+import copy
+import functools
+import json
+import logging
+import os
+import re
+import subprocess
+
+from common.ffmpeg import ffmpeg_binary
+
+class EncoderProfile: # pylint: disable=R0903:too-few-public-methods
+    """
+    A named set of encoder settings.
+
+    Attributes:
+        name (str): The name of the profile.
+        codec (str): The FFmpeg video encoder.
+        preset (str): The encoder preset.
+        crf (int): The constant quality level, or None for the encoder default.
+        tune (str): The encoder tuning, or None.
+        threads (int): The number of encoder threads. Defaults to the number of CPUs.
+    """
+
+    def __init__(self, name, codec, *, preset=None, crf=None, tune=None, threads=None): # pylint: disable=R0913:too-many-arguments
+        self.name = name
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.tune = tune
+        self.threads = threads or os.cpu_count()
+
+    def quality_args(self):
+        """
+        Returns the FFmpeg arguments for the quality and tuning settings.
+
+        Returns:
+            list: The arguments, excluding the codec and preset.
+        """
+        args = []
+        if self.crf is not None:
+            # NVENC expresses constant quality through -cq rather than -crf
+            args += ["-cq" if "nvenc" in self.codec else "-crf", str(self.crf)]
+        if self.tune:
+            args += ["-tune", self.tune]
+        return args
+
+    def ffmpeg_args(self):
+        """
+        Returns the FFmpeg output arguments for the profile.
+
+        Returns:
+            list: The codec, preset, quality and thread arguments.
+        """
+        args = ["-c:v", self.codec]
+        if self.preset:
+            args += ["-preset", self.preset]
+        args += self.quality_args()
+        if self.threads:
+            args += ["-threads", str(self.threads)]
+        return args
+
+    def write_videofile_args(self):
+        """
+        Returns the keyword arguments for MoviePy's write_videofile.
+
+        Returns:
+            dict: The codec, preset, threads and ffmpeg_params arguments.
+        """
+        args = {"codec": self.codec, "threads": self.threads,
+                "ffmpeg_params": self.quality_args()}
+        if self.preset:
+            args["preset"] = self.preset
+        return args
+
+ENCODER_PROFILES = {
+    profile.name: profile for profile in (
+        EncoderProfile("x264_ultrafast", "libx264", preset="ultrafast", crf=23,
+                       tune="stillimage"),
+        EncoderProfile("x264_veryfast", "libx264", preset="veryfast", crf=21,
+                       tune="stillimage"),
+        EncoderProfile("x264_medium", "libx264", preset="medium", crf=20, tune="stillimage"),
+        EncoderProfile("nvenc", "h264_nvenc", preset="p4", crf=23),
+    )
+}
+
+DEFAULT_PROFILE = "x264_veryfast"
+
+# The profile of preview renders. It is kept out of ENCODER_PROFILES so the encoder
+# benchmark never recommends it for full-quality renders.
+PREVIEW_PROFILE = EncoderProfile("x264_preview", "libx264", preset="ultrafast", crf=30,
+                                 tune="stillimage")
+
+BENCHMARK_RESULTS_FILE = os.path.join("benchmarks", "encoders.json")
+
+# Audio codecs that MP4 players take as they are, so the narration is muxed without a transcode
+MP4_AUDIO_CODECS = ("aac", "mp3")
+# The codec audio in any other format is encoded to
+FALLBACK_AUDIO_CODEC = "aac"
+
+@functools.lru_cache(maxsize=None)
+def _can_encode(codec):
+    """Checks whether FFmpeg can encode a short test clip with a codec."""
+    command = [ffmpeg_binary(), "-hide_banner", "-loglevel", "error",
+               "-f", "lavfi", "-i", "color=c=white:s=256x256:d=0.1",
+               "-c:v", codec, "-f", "null", "-"]
+    try:
+        return subprocess.run(command, capture_output=True, check=False,
+                              timeout=30).returncode == 0
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logging.warning("Could not probe encoder %s: %s", codec, e)
+        return False
+
+def available_encoders():
+    """
+    Returns the encoders used by the profiles that can encode on this machine.
+
+    Encoders are probed with a short test encode, since FFmpeg lists hardware encoders
+    such as NVENC even when no usable GPU is present.
+
+    Returns:
+        set: The names of the working FFmpeg encoders.
+    """
+    codecs = {profile.codec for profile in ENCODER_PROFILES.values()}
+    return {codec for codec in codecs if _can_encode(codec)}
+
+def available_profiles():
+    """
+    Returns the profiles whose encoder works on this machine.
+
+    Returns:
+        list: The available EncoderProfile objects.
+    """
+    encoders = available_encoders()
+    return [profile for profile in ENCODER_PROFILES.values() if profile.codec in encoders]
+
+def _recommended_profile(temp_dir):
+    """Returns the profile recommended by the last encoder benchmark, if any."""
+    path = os.path.join(temp_dir, BENCHMARK_RESULTS_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file).get("recommended")
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning("Ignoring unreadable benchmark results %s: %s", path, e)
+        return None
+
+def resolve_profile(profile=None, temp_dir="temp"):
+    """
+    Picks the encoder profile to render with.
+
+    Args:
+        profile (str | EncoderProfile, optional): The requested profile. If None, the
+            profile recommended by the last benchmark run is used, or DEFAULT_PROFILE.
+        temp_dir (str, optional): The directory holding the benchmark results.
+            Defaults to "temp".
+
+    Returns:
+        EncoderProfile: The requested profile, or DEFAULT_PROFILE if its encoder is not
+            available on this machine or the benchmark recommends an unknown profile.
+
+    Raises:
+        ValueError: If the requested profile name is unknown.
+    """
+    if isinstance(profile, EncoderProfile):
+        requested = profile
+    elif profile:
+        if profile not in ENCODER_PROFILES:
+            raise ValueError(f"Unknown encoder profile: {profile}")
+        requested = ENCODER_PROFILES[profile]
+    else:
+        name = _recommended_profile(temp_dir) or DEFAULT_PROFILE
+        if name not in ENCODER_PROFILES:
+            # Results written before a profile was renamed or removed
+            logging.warning("Benchmark results recommend unknown encoder profile %s, "
+                            "using %s", name, DEFAULT_PROFILE)
+            name = DEFAULT_PROFILE
+        requested = ENCODER_PROFILES[name]
+
+    if _can_encode(requested.codec):
+        return requested
+
+    logging.warning("Encoder %s is not available, falling back to %s",
+                    requested.codec, DEFAULT_PROFILE)
+    return ENCODER_PROFILES[DEFAULT_PROFILE]
+
+def motion_profile(profile):
+    """
+    Returns a profile for footage that moves. The x264 profiles are tuned for the static
+    white background, and "stillimage" spends bits poorly on video under the subtitles.
+
+    Args:
+        profile (EncoderProfile): The profile.
+
+    Returns:
+        EncoderProfile: The profile, or a copy of it without its tuning.
+    """
+    if profile.tune is None:
+        return profile
+    moving = copy.copy(profile)
+    moving.tune = None
+    return moving
+
+def audio_codec(audio_file):
+    """
+    Returns the codec of the first audio stream of a file, as FFmpeg names it.
+
+    Args:
+        audio_file (str): The path of the audio file.
+
+    Returns:
+        str: The codec, e.g. "mp3" or "aac", or None if FFmpeg finds no audio stream.
+    """
+    # Without an output FFmpeg only prints the stream layout of the input, then fails
+    command = [ffmpeg_binary(), "-hide_banner", "-nostdin", "-i", audio_file]
+    try:
+        completed = subprocess.run(command, capture_output=True, check=False, timeout=30)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logging.warning("Could not probe audio %s: %s", audio_file, e)
+        return None
+    match = re.search(r"Audio: (\w+)", completed.stderr.decode("utf-8", errors="replace"))
+    return match.group(1) if match else None
+
+def can_copy_audio(audio_file):
+    """
+    Checks whether an audio file can be muxed into an MP4 by stream copy.
+
+    Args:
+        audio_file (str): The path of the audio file.
+
+    Returns:
+        bool: Whether its codec is one of MP4_AUDIO_CODECS.
+    """
+    return audio_codec(audio_file) in MP4_AUDIO_CODECS
+
+def audio_args(audio_file):
+    """
+    Returns the FFmpeg output arguments that put an audio file into an MP4: a stream copy
+    when the container can carry its codec, so the narration is never encoded twice,
+    and an encode to FALLBACK_AUDIO_CODEC otherwise.
+
+    Args:
+        audio_file (str): The path of the audio file.
+
+    Returns:
+        list: The audio codec arguments.
+    """
+    if can_copy_audio(audio_file):
+        return ["-c:a", "copy"]
+    logging.info("Encoding %s to %s, its codec cannot be copied into MP4",
+                 audio_file, FALLBACK_AUDIO_CODEC)
+    return ["-c:a", FALLBACK_AUDIO_CODEC]
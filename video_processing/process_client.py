@@ -1,14 +1,24 @@
 """
 This module provides functionalities for video processing using the MoviePy library. 
 It imports essential components for handling text overlays, video compositions, 
-color clips, audio files, and subtitles. Additionally, it configures the ImageMagick 
-binary path, which is required for certain MoviePy operations.
+color clips, audio files, and subtitles. MoviePy is only imported when a video is
+rendered, so importing this module, or spawning a worker that might render, is cheap.
 
 Modules Imported:
-- TextClip, CompositeVideoClip, ColorClip, AudioFileClip: 
-    Core components from MoviePy for video and audio editing.
-- SubtitlesClip: Tool from MoviePy for handling subtitles.
-- change_settings: Utility from MoviePy's configuration module to set the path for ImageMagick.
+- logging: Standard library for logging error and informational messages.
+- ColorClip, AudioFileClip: MoviePy clips for the background and narration that has to
+    be re-encoded. Imported on first use.
+- TextStyle, WordRasterCache: The font settings and cache used for subtitle rasters.
+- SubtitleTrackClip: Single-layer clip drawing the active subtitle word over a background.
+    Imported on first use, since it is a MoviePy clip.
+- render_change_points: Renderer that composites one frame per caption state.
+- resolve_profile, PREVIEW_PROFILE: Pick the encoder profile of full and preview renders.
+- motion_profile: Drops the still-picture tuning of the profile under a moving background.
+- can_copy_audio, FALLBACK_AUDIO_CODEC: Decide whether the narration is muxed by stream
+    copy or, in a format MP4 cannot carry, encoded.
+- render_segments: Renderer that encodes segments of one video in parallel processes.
+- multiprocessing, ProcessPoolExecutor: The spawned pool the segments render in.
+- instrumentation: Times renders as the "video" stage with their frames and peak memory.
 
 Classes:
     VideoProcessClient: A client class to manage video processing operations, 
@@ -19,22 +29,28 @@ Usage:
         # Perform video processing tasks
 
 Configuration:
-    The module sets the path for the ImageMagick binary, which is necessary for 
-    rendering text and other image-based elements in videos.
+    Set the IMAGEMAGICK_BINARY environment variable to the ImageMagick binary, which is
+    necessary for rendering subtitle words. It is read when the first word is rasterized.
 """
-from moviepy.editor import TextClip, CompositeVideoClip, ColorClip, AudioFileClip # pylint: disable=W0611:unused-import
-from moviepy.video.tools.subtitles import SubtitlesClip# pylint: disable=W0611:unused-import
-from moviepy.config import change_settings
+import logging
+import multiprocessing
 import os
-change_settings({"IMAGEMAGICK_BINARY":
-                r"E:\\ImageMagick-7.1.1-Q16-HDRI\\magick.exe"})
-
-# Function to generate subtitle clips
-def make_text_clip(txt, start, end):
-    return (TextClip(txt, fontsize=100, color='black', font='Arial-Bold')
-            .set_position(('center', 'center'))  # Adjust position if necessary
-            .set_start(start)
-            .set_end(end))
+from concurrent.futures import ProcessPoolExecutor
+from video_processing.text_cache import TextStyle, WordRasterCache
+from video_processing.change_point_renderer import render_change_points
+from video_processing.encoders import (resolve_profile, motion_profile, can_copy_audio,
+                                       PREVIEW_PROFILE, FALLBACK_AUDIO_CODEC)
+from video_processing.segment_renderer import render_segments
+import instrumentation
+from instrumentation import instrumented
+
+RENDER_MODES = ("frames", "change_points", "segments")
+
+VIDEO_SIZE = (1080, 1920)
+FPS = 24
+# Previews keep the aspect ratio at a quarter of the width, and a third of the frame rate
+PREVIEW_SIZE = (270, 480)
+PREVIEW_FPS = 8
 
 class VideoProcessClient(object): # pylint: disable=R0205:useless-object-inheritance
     """
@@ -49,8 +65,19 @@ class VideoProcessClient(object): # pylint: disable=R0205:useless-object-inherit
                                                   any exceptions and cleaning up resources.
         close(): Closes any resources or connections opened by the client.
     """
-    def __init__(self):
-        """Initializes the VideoProcessClient instance."""
+    def __init__(self, temp_dir="temp"):
+        """
+        Initializes the VideoProcessClient instance.
+
+        Args:
+            temp_dir (str, optional): The directory for temporary storage, shared with
+                Configuration.temp_dir. Defaults to "temp".
+        """
+        self.temp_dir = temp_dir
+        self.text_style = TextStyle()
+        self.word_cache = WordRasterCache(os.path.join(self.temp_dir, "word_cache"))
+        self._segment_pool = None
+        self._segment_pool_size = 0
 
     def __enter__(self):
         """Enters the runtime context and returns the client instance."""
@@ -70,25 +97,128 @@ class VideoProcessClient(object): # pylint: disable=R0205:useless-object-inherit
 
     def close(self):
         """Closes any resources or connections opened by the client."""
+        self.word_cache.close()
+        if self._segment_pool is not None:
+            self._segment_pool.shutdown()
+            self._segment_pool = None
 
-    def create_video(self, duration, subtitles_data, audio_file):
-        # Create a background for the video (a plain color image)
-        background = ColorClip(size=(1080, 1920), color=(255, 255, 255), duration=duration)
-
-        # Create a composite video with subtitles
-        # subtitles = [make_text_clip(word, start, end) for word, start, end in subtitles_data]
-        subtitles = [make_text_clip(item["word"], item["start"], item["end"]) for item in subtitles_data]
-        video = CompositeVideoClip([background] + subtitles)
-
-        # Load the audio file
-        audio = AudioFileClip(audio_file)
+    def _segment_workers(self, segments):
+        """
+        Returns the process pool for segment rendering, started on first use and started
+        again with more workers when a render asks for more segments than it has.
+        """
+        workers = segments or os.cpu_count() or 1
+        if self._segment_pool is not None and self._segment_pool_size < workers:
+            self._segment_pool.shutdown()
+            self._segment_pool = None
+        if self._segment_pool is None:
+            # Spawned rather than forked, since the caller may be multithreaded
+            self._segment_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            self._segment_pool_size = workers
+        return self._segment_pool
+
+    @instrumented("video", reset_peak=True)
+    def create_video(self, duration, subtitles_data, audio_file=None, *, # pylint: disable=R0913,R0914:too-many-arguments,too-many-locals
+                     render_mode="frames", encoder=None, output_file=None, style=None,
+                     segments=None, preview=False, background=None):
+        """
+        Renders the subtitle timeline over a plain background.
 
-        # Set the audio to the video
-        video = video.set_audio(audio)
+        Args:
+            duration (float): The length of the video in seconds.
+            subtitles_data (list): The word timings, as dicts with "word", "start" and "end".
+            audio_file (str, optional): The path of the narration audio. Defaults to None,
+                which renders a silent video. MP3 and AAC audio is muxed by stream copy in
+                every render mode; other formats are encoded to AAC.
+            render_mode (str, optional): "frames" composites every frame through MoviePy;
+                "change_points" composites one frame per caption state and lets FFmpeg
+                hold it; "segments" splits the timeline at word boundaries and renders the
+                pieces in parallel processes, then joins them without re-encoding.
+                Defaults to "frames".
+            encoder (str | EncoderProfile, optional): The encoder profile. Defaults to the
+                profile picked by resolve_profile, or PREVIEW_PROFILE for previews.
+            output_file (str, optional): The path of the video file. Defaults to
+                temp_dir/video.mp4, or temp_dir/preview.mp4 for previews.
+            style (TextStyle, optional): The subtitle font settings. Defaults to the
+                client's text_style.
+            segments (int, optional): The number of segments of the "segments" mode.
+                Defaults to the number of CPUs.
+            preview (bool, optional): Render a quick draft of the same timeline at
+                PREVIEW_SIZE and PREVIEW_FPS, with the captions scaled down to match and
+                the fastest encoder settings, for reviewing a script before paying for
+                the full render. Defaults to False.
+            background (Background, optional): The looping video to render the subtitles
+                over, picked from a BackgroundLibrary. Defaults to None, a plain white
+                background. A moving background changes every frame, so "change_points"
+                renders it in the "frames" mode, and the encoder drops any still-picture
+                tuning.
+
+        Returns:
+            str: The path of the rendered video.
+        """
+        if render_mode not in RENDER_MODES:
+            raise ValueError(f"Unknown render mode: {render_mode}")
+        if background is not None and render_mode == "change_points":
+            logging.info("Rendering frames, change points need a static background")
+            render_mode = "frames"
+        style = style or self.text_style
+        if preview:
+            size, fps = PREVIEW_SIZE, PREVIEW_FPS
+            style = style.scaled(PREVIEW_SIZE[0] / VIDEO_SIZE[0])
+            profile = resolve_profile(encoder or PREVIEW_PROFILE, self.temp_dir)
+        else:
+            size, fps = VIDEO_SIZE, FPS
+            profile = resolve_profile(encoder, self.temp_dir)
+        if background is not None:
+            profile = motion_profile(profile)
+        output_file = output_file or os.path.join(self.temp_dir,
+                                                  'preview.mp4' if preview else 'video.mp4')
+        instrumentation.record(frames=int(duration * fps))
+
+        if render_mode == "segments":
+            # Segment processes rasterize from the shared disk cache, so fill it once here
+            self.word_cache.prefetch((item["word"] for item in subtitles_data), style)
+            render_segments(self._segment_workers(segments), subtitles_data, duration,
+                            output_file, profile, temp_dir=self.temp_dir,
+                            audio_file=audio_file, style=style, segments=segments,
+                            size=size, fps=fps, background=background)
+            instrumentation.record(bytes_out=os.path.getsize(output_file))
+            return output_file
+
+        # pylint: disable=C0415:import-outside-toplevel
+        from moviepy.video.VideoClip import ColorClip
+        from moviepy.audio.io.AudioFileClip import AudioFileClip
+        from video_processing.subtitle_clip import SubtitleTrackClip
+
+        # Create a background for the video: a plain color image, or the looping proxy
+        backdrop = ColorClip(size=size, color=(255, 255, 255), duration=duration) \
+            if background is None else background.clip(duration, size)
+
+        # Draw the subtitles as a single time-indexed layer over the background
+        self.word_cache.prefetch((item["word"] for item in subtitles_data), style)
+        video = SubtitleTrackClip(backdrop, subtitles_data, self.word_cache, style)
+
+        if render_mode == "change_points":
+            render_change_points(video, output_file, profile, audio_file=audio_file, fps=fps,
+                                 temp_dir=self.temp_dir)
+            instrumentation.record(bytes_out=os.path.getsize(output_file))
+            return output_file
+
+        args = profile.write_videofile_args()
+        if audio_file and can_copy_audio(audio_file):
+            # MoviePy muxes an audio path by stream copy, so the narration is never decoded
+            args["audio"] = audio_file
+            args["ffmpeg_params"] = args["ffmpeg_params"] + ["-t", f"{duration:.6f}"]
+        elif audio_file:
+            # Load the audio file and set it to the video
+            video = video.set_audio(AudioFileClip(audio_file))
+            args["audio_codec"] = FALLBACK_AUDIO_CODEC
 
         # Export the video
-        num_threads = os.cpu_count()
-        video.write_videofile('./temp/video.mp4',
-                              codec='h264_nvenc',
-                              fps=24,
-                              threads=num_threads)
+        try:
+            video.write_videofile(output_file, fps=fps, **args)
+        finally:
+            backdrop.close()
+        instrumentation.record(bytes_out=os.path.getsize(output_file))
+        return output_file
@@ -0,0 +1,396 @@
+# coding: utf-8
+"""
+This module lets rendering run in separate worker processes, on the same host or on other
+hosts sharing a filesystem. A render is described by a RenderJobSpec, a plain JSON
+document holding everything create_video needs (word timeline, audio path, style,
+encoder profile, render mode), and handed over through a RenderSpool, a directory with
+one subdirectory per state:
+
+    <spool>/pending/<spec_id>.json   Submitted, waiting for a worker.
+    <spool>/claimed/<spec_id>.json   Being rendered; its mtime is the worker's heartbeat.
+    <spool>/done/<spec_id>.json      Rendered, with the result.
+    <spool>/failed/<spec_id>.json    Given up, with the error.
+
+Every state change is a rename within the spool, which is atomic on local filesystems
+and on NFS, so exactly one worker wins each claim without any lock server. A worker
+touches its claimed file while it renders; a claim whose heartbeat is older than the
+lease is moved back to pending by whichever worker notices first, so renders of a
+crashed worker or host are picked up again. A directory is used rather than SQLite
+because SQLite's locking is not reliable on network filesystems.
+
+Modules Imported:
+- json: Standard library for reading and writing specs.
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- socket: Standard library used to name the worker.
+- time: Standard library for leases and polling.
+- uuid: Standard library used to name specs.
+- KeepAlive: Base class renewing a claim from a background thread.
+- Background: The looping background of a render, stored as plain data.
+
+Classes:
+    RenderJobSpec: A serializable description of one render.
+    RenderSpool: The directory of render specs shared by submitters and workers.
+    Heartbeat: Keeps a claim alive while its render runs.
+
+Usage:
+    spool = RenderSpool("temp/render_spool")
+    spec_id = spool.submit(RenderJobSpec(duration, words, "speech.mp3", "video.mp4"))
+    result = spool.wait(spec_id)
+
+    # In python render_worker.py --spool temp/render_spool
+    spec = spool.claim()
+    with Heartbeat(spool, spec):
+        client.create_video(**spec.create_video_args())
+    spool.complete(spec, {"video": spec.output_file})
+"""
+
+from __future__ import absolute_import
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+from common.storage import KeepAlive
+from video_processing.backgrounds import Background
+
+STATES = ("pending", "claimed", "done", "failed")
+
+class RenderJobSpec: # pylint: disable=R0902:too-many-instance-attributes
+    """
+    A serializable description of one render.
+
+    Paths must be valid on the workers, e.g. absolute paths on a shared mount.
+
+    Attributes:
+        duration (float): The length of the video in seconds.
+        words (list): The word timings, as dicts with "word", "start" and "end".
+        audio_file (str): The narration audio, or None for a silent video.
+        output_file (str): Where the worker writes the video.
+        style (dict): TextStyle keyword arguments, or None for the default style.
+        encoder (str): The encoder profile name, or None for the worker's default.
+        render_mode (str): The create_video render mode.
+        preview (bool): Whether to render a low-resolution preview.
+        background (Background): The looping background video, or None for plain white.
+        job_id: The job the render belongs to, for tracing.
+        spec_id (str): The unique name of the spec in the spool.
+        attempts (int): How many times the spec has been claimed.
+    """
+
+    def __init__(self, duration, words, audio_file, output_file, *, style=None, # pylint: disable=R0913:too-many-arguments
+                 encoder=None, render_mode="frames", preview=False, background=None,
+                 job_id=None, spec_id=None, attempts=0):
+        self.duration = duration
+        self.words = words
+        self.audio_file = audio_file
+        self.output_file = output_file
+        self.style = style
+        self.encoder = encoder
+        self.render_mode = render_mode
+        self.preview = preview
+        self.background = background
+        self.job_id = job_id
+        self.spec_id = spec_id or uuid.uuid4().hex
+        self.attempts = attempts
+
+    def to_dict(self):
+        """
+        Returns the spec as JSON-serializable data.
+
+        Returns:
+            dict: The fields of the spec.
+        """
+        return {"spec_id": self.spec_id, "job_id": self.job_id, "attempts": self.attempts,
+                "duration": self.duration, "words": self.words, "audio_file": self.audio_file,
+                "output_file": self.output_file, "style": self.style,
+                "encoder": self.encoder, "render_mode": self.render_mode,
+                "preview": self.preview,
+                "background": self.background.to_dict() if self.background else None}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuilds a spec from to_dict data.
+
+        Args:
+            data (dict): The fields of the spec.
+
+        Returns:
+            RenderJobSpec: The spec.
+        """
+        return cls(data["duration"], data["words"], data.get("audio_file"),
+                   data["output_file"], style=data.get("style"), encoder=data.get("encoder"),
+                   render_mode=data.get("render_mode", "frames"),
+                   preview=data.get("preview", False),
+                   background=Background.from_dict(data["background"])
+                   if data.get("background") else None,
+                   job_id=data.get("job_id"),
+                   spec_id=data["spec_id"], attempts=data.get("attempts", 0))
+
+    def create_video_args(self):
+        """
+        Returns the keyword arguments of VideoProcessClient.create_video for the spec.
+
+        Returns:
+            dict: The arguments, with style as a TextStyle.
+        """
+        # Imported here so submitters do not need MoviePy
+        from video_processing.text_cache import TextStyle # pylint: disable=C0415:import-outside-toplevel
+        return {"duration": self.duration, "subtitles_data": self.words,
+                "audio_file": self.audio_file, "output_file": self.output_file,
+                "style": TextStyle(**self.style) if self.style else None,
+                "encoder": self.encoder, "render_mode": self.render_mode,
+                "preview": self.preview, "background": self.background}
+
+class RenderSpool:
+    """
+    The directory of render specs shared by submitters and workers.
+
+    Attributes:
+        directory (str): The spool directory.
+        lease_seconds (float): How long a claim survives without a heartbeat.
+        max_attempts (int): How many times a spec is claimed before it is failed for good.
+    """
+
+    def __init__(self, directory, lease_seconds=120, max_attempts=3):
+        """
+        Initializes the spool and creates its directories if necessary.
+
+        Args:
+            directory (str): The spool directory, shared by every submitter and worker.
+            lease_seconds (float, optional): How long a claim survives without a
+                heartbeat. Defaults to 120 seconds.
+            max_attempts (int, optional): How many times a spec is claimed before it is
+                failed for good. Defaults to 3.
+        """
+        self.directory = directory
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        for state in STATES + ("tmp",):
+            os.makedirs(os.path.join(directory, state), exist_ok=True)
+
+    def _path(self, state, spec_id):
+        return os.path.join(self.directory, state, f"{spec_id}.json")
+
+    def _write(self, state, data):
+        """Writes a spec file atomically, through a rename from the tmp directory."""
+        temporary_path = os.path.join(self.directory, "tmp",
+                                      f"{data['spec_id']}.{uuid.uuid4().hex}.json")
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temporary_path, self._path(state, data["spec_id"]))
+
+    def submit(self, spec):
+        """
+        Queues a render.
+
+        Args:
+            spec (RenderJobSpec): The render.
+
+        Returns:
+            str: The spec id, to wait for.
+        """
+        self._write("pending", spec.to_dict())
+        return spec.spec_id
+
+    def claim(self, worker=None):
+        """
+        Atomically claims the oldest pending spec.
+
+        Args:
+            worker (str, optional): A name for the claiming worker. Defaults to the host
+                name and process.
+
+        Returns:
+            RenderJobSpec: The claimed spec, or None if nothing is pending.
+        """
+        worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        for entry in self._pending_entries():
+            spec_id = entry.name[:-len(".json")]
+            claimed_path = self._path("claimed", spec_id)
+            try:
+                # Only one worker's rename can succeed
+                os.rename(entry.path, claimed_path)
+            except FileNotFoundError:
+                continue
+            try:
+                with open(claimed_path, "r", encoding="utf-8") as file:
+                    data = json.load(file)
+            except ValueError as e:
+                logging.error("Discarding unreadable render spec %s: %s", spec_id, e)
+                os.replace(claimed_path, self._path("failed", spec_id))
+                continue
+            data["attempts"] = data.get("attempts", 0) + 1
+            data["worker"] = worker
+            self._write("claimed", data)
+            return RenderJobSpec.from_dict(data)
+        return None
+
+    def _pending_entries(self):
+        """Lists the pending specs, oldest first, skipping those claimed while listing."""
+        entries = []
+        for entry in os.scandir(os.path.join(self.directory, "pending")):
+            try:
+                entries.append((entry.stat().st_mtime, entry.name, entry))
+            except FileNotFoundError:
+                # Another worker renamed it away after the directory was read
+                continue
+        return [entry for _mtime, _name, entry in sorted(entries, key=lambda item: item[:2])]
+
+    def heartbeat(self, spec):
+        """
+        Extends the claim of a spec.
+
+        Args:
+            spec (RenderJobSpec): The claimed spec.
+
+        Returns:
+            bool: False if the claim was lost, e.g. reaped after a stall.
+        """
+        try:
+            # With no explicit time, NFS stamps the server's clock, so hosts need not agree
+            os.utime(self._path("claimed", spec.spec_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def reap_expired(self):
+        """
+        Moves claims whose heartbeat is older than the lease back to pending, or to
+        failed once they have used up their attempts.
+
+        Returns:
+            int: The number of claims reaped.
+        """
+        reaped = 0
+        now = time.time()
+        for entry in os.scandir(os.path.join(self.directory, "claimed")):
+            try:
+                stat = entry.stat()
+                # A rename keeps the mtime of a long-pending spec but updates its ctime
+                if now - max(stat.st_mtime, stat.st_ctime) < self.lease_seconds:
+                    continue
+                with open(entry.path, "r", encoding="utf-8") as file:
+                    attempts = json.load(file).get("attempts", 0)
+                target = "failed" if attempts >= self.max_attempts else "pending"
+                os.rename(entry.path, os.path.join(self.directory, target, entry.name))
+            except (FileNotFoundError, ValueError):
+                continue
+            reaped += 1
+            logging.warning("Render claim %s expired, moved to %s", entry.name, target)
+        return reaped
+
+    def complete(self, spec, result=None):
+        """
+        Marks a claimed spec as rendered.
+
+        Args:
+            spec (RenderJobSpec): The claimed spec.
+            result (dict, optional): What the render produced, e.g. the video path.
+        """
+        data = dict(spec.to_dict(), result=result or {}, finished_at=time.time())
+        self._write("done", data)
+        self._remove("claimed", spec.spec_id)
+
+    def fail(self, spec, error):
+        """
+        Records a failed render, putting it back in pending while it has attempts left.
+
+        Args:
+            spec (RenderJobSpec): The claimed spec.
+            error (str): Why the render failed.
+        """
+        data = dict(spec.to_dict(), error=str(error), finished_at=time.time())
+        self._write("pending" if spec.attempts < self.max_attempts else "failed", data)
+        self._remove("claimed", spec.spec_id)
+
+    def _remove(self, state, spec_id):
+        try:
+            os.remove(self._path(state, spec_id))
+        except FileNotFoundError:
+            pass
+
+    def status(self, spec_id):
+        """
+        Returns the state of a spec.
+
+        Args:
+            spec_id (str): The spec id.
+
+        Returns:
+            tuple: (state, data), where data is the spec file's content, or (None, None)
+            if the spec is unknown.
+        """
+        for state in ("done", "failed", "claimed", "pending"):
+            try:
+                with open(self._path(state, spec_id), "r", encoding="utf-8") as file:
+                    return state, json.load(file)
+            except (FileNotFoundError, ValueError):
+                continue
+        return None, None
+
+    def wait(self, spec_id, timeout=None, poll_interval=1.0):
+        """
+        Waits for a spec to be rendered.
+
+        Args:
+            spec_id (str): The spec id returned by submit.
+            timeout (float, optional): How long to wait, in seconds. Defaults to forever.
+            poll_interval (float, optional): How often the spool is checked.
+                Defaults to 1 second.
+
+        Returns:
+            dict: The result recorded by the worker.
+
+        Raises:
+            RuntimeError: If the render failed for good.
+            TimeoutError: If the timeout elapsed first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            for state in ("done", "failed"):
+                try:
+                    with open(self._path(state, spec_id), "r", encoding="utf-8") as file:
+                        data = json.load(file)
+                except (FileNotFoundError, ValueError):
+                    continue
+                if state == "failed":
+                    raise RuntimeError(f"Render {spec_id} failed: {data.get('error')}")
+                return data.get("result", {})
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Render {spec_id} did not finish in {timeout}s")
+            time.sleep(poll_interval)
+
+    def counts(self):
+        """
+        Counts the specs in each state.
+
+        Returns:
+            dict: The number of specs per state.
+        """
+        return {state: sum(1 for entry in os.scandir(os.path.join(self.directory, state))
+                           if entry.name.endswith(".json"))
+                for state in STATES}
+
+class Heartbeat(KeepAlive):
+    """
+    Keeps a claim alive from a background thread while its render runs.
+
+    Attributes:
+        lost (bool): Whether the claim was lost while the render ran.
+    """
+
+    def __init__(self, spool, spec, interval=None):
+        """
+        Initializes the heartbeat. It starts when it is entered.
+
+        Args:
+            spool (RenderSpool): The spool the spec was claimed from.
+            spec (RenderJobSpec): The claimed spec.
+            interval (float, optional): Seconds between heartbeats. Defaults to a
+                quarter of the lease.
+        """
+        super().__init__(lambda: spool.heartbeat(spec), interval or spool.lease_seconds / 4,
+                         f"render {spec.spec_id}")
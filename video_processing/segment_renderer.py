@@ -0,0 +1,217 @@
+"""
+This module renders one video on several cores at once. A single write_videofile call
+pushes every frame through one compositing loop and one encoder, so the latency of a
+video is capped by what one pipeline can do. Here the timeline is cut at word boundaries
+into segments of about equal length, each segment is composited and encoded in its own
+process as a self-contained closed-GOP stream, and FFmpeg's concat demuxer joins the
+segments by stream copy, without re-encoding, while the narration is muxed in once, also
+by stream copy when MP4 can carry its codec.
+
+Segment boundaries fall on whole frames, and every segment starts its own clock at its
+first frame, so frame n of the joined video is the frame the single-pipeline render would
+have produced at n / fps.
+
+Modules Imported:
+- copy: Standard library used to give each segment its share of the encoder threads.
+- logging: Standard library for logging error and informational messages.
+- math: Standard library used to count frames.
+- os: Standard library for interacting with the operating system.
+- shutil: Standard library used to remove the temporary segment directory.
+- subprocess: Standard library used to run FFmpeg.
+- tempfile: Standard library used to create the temporary segment directory.
+- ColorClip: MoviePy clip used as the background of each segment. Loaded in the workers.
+- audio_args, concat_entry, ffmpeg_binary: The audio codec arguments, concat list lines
+    and the FFmpeg binary.
+- TextStyle, WordRasterCache: The font settings and cache used for subtitle rasters.
+- SubtitleTrackClip: Single-layer clip drawing the active subtitle word over a background.
+    Loaded in the workers.
+
+Functions:
+    split_segments: Cuts a timeline into frame ranges at word boundaries.
+    segment_words: Returns the words of a frame range, on the segment's own clock.
+    render_segment: Renders one frame range to a video file. Runs in a worker process.
+    render_segments: Renders a timeline in parallel segments and joins them.
+
+Usage:
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as pool:
+        render_segments(pool, words, duration, "temp/video.mp4", resolve_profile(),
+                        temp_dir="temp", audio_file="temp/speech.mp3", segments=4)
+"""
+import copy
+import logging
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+
+from common.ffmpeg import concat_entry, ffmpeg_binary
+from video_processing.encoders import audio_args
+from video_processing.text_cache import TextStyle, WordRasterCache
+
+# Segments shorter than this cost more in process overhead than they save
+MIN_SEGMENT_SECONDS = 2.0
+
+def split_segments(words, duration, count, fps=24):
+    """
+    Cuts a timeline into frame ranges of about equal length at word boundaries.
+
+    Args:
+        words (list): The word timings, as dicts with "word", "start" and "end".
+        duration (float): The length of the video in seconds.
+        count (int): The number of segments wanted.
+        fps (int, optional): The frame rate. Defaults to 24.
+
+    Returns:
+        list: (first_frame, end_frame) tuples covering every frame, end exclusive. There
+            are fewer than count of them when the timeline has too few word boundaries
+            or is too short to be worth splitting.
+    """
+    total = max(1, math.ceil(duration * fps - 1e-6))
+    count = max(1, min(count, int(duration // MIN_SEGMENT_SECONDS) or 1))
+    candidates = sorted({round(item["start"] * fps) for item in words} - {0})
+    candidates = [frame for frame in candidates if frame < total]
+
+    cuts = []
+    for index in range(1, count):
+        if not candidates:
+            break
+        target = total * index / count
+        nearest = min(candidates, key=lambda frame: abs(frame - target)) # pylint: disable=W0640:cell-var-from-loop
+        if not cuts or nearest > cuts[-1]:
+            cuts.append(nearest)
+    bounds = [0] + cuts + [total]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def segment_words(words, first_frame, end_frame, fps=24):
+    """
+    Returns the words shown during a frame range, shifted onto the segment's own clock.
+
+    Args:
+        words (list): The word timings of the whole video.
+        first_frame (int): The first frame of the segment.
+        end_frame (int): The frame after the last frame of the segment.
+        fps (int, optional): The frame rate. Defaults to 24.
+
+    Returns:
+        list: The word timings, relative to the start of the segment.
+    """
+    start, end = first_frame / fps, end_frame / fps
+    return [dict(item, start=max(0.0, item["start"] - start), end=item["end"] - start)
+            for item in words if item["end"] > start and item["start"] < end]
+
+def render_segment(temp_dir, words, style_fields, frames, output_file, *, encoder, # pylint: disable=R0913,R0914:too-many-arguments,too-many-locals
+                   size=(1080, 1920), fps=24, background=None):
+    """
+    Renders the frames of one segment to a silent, closed-GOP video file. Runs in a
+    worker process, so every argument is plain data.
+
+    Args:
+        temp_dir (str): The directory for temporary storage, holding the word cache.
+        words (list): The word timings of the segment, on its own clock.
+        style_fields (tuple): The TextStyle.key_fields() of the subtitles.
+        frames (int): The number of frames to render.
+        output_file (str): The path of the segment file.
+        encoder (EncoderProfile): The encoder settings.
+        size (tuple, optional): The frame size. Defaults to 1080x1920.
+        fps (int, optional): The frame rate. Defaults to 24.
+        background (Background, optional): The looping video under the subtitles, shifted
+            to the start of the segment. Defaults to None, a plain white background.
+
+    Returns:
+        str: The path of the segment file.
+    """
+    # pylint: disable=C0415:import-outside-toplevel
+    from moviepy.video.VideoClip import ColorClip
+    from video_processing.subtitle_clip import SubtitleTrackClip
+
+    # Half a frame short of the end, so MoviePy's frame loop yields exactly frames frames
+    duration = (frames - 0.5) / fps
+    cache = WordRasterCache(os.path.join(temp_dir, "word_cache"))
+    try:
+        style = TextStyle(*style_fields)
+        backdrop = ColorClip(size=size, color=(255, 255, 255), duration=duration) \
+            if background is None else background.clip(duration, size)
+        cache.prefetch((item["word"] for item in words), style)
+        track = SubtitleTrackClip(backdrop, words, cache, style)
+        args = encoder.write_videofile_args()
+        # Every segment must open with a keyframe and never reference another segment
+        args["ffmpeg_params"] = args["ffmpeg_params"] + ["-flags", "+cgop",
+                                                         "-pix_fmt", "yuv420p"]
+        track.write_videofile(output_file, fps=fps, audio=False, logger=None, **args)
+        backdrop.close()
+    finally:
+        cache.close()
+    return output_file
+
+def _share_threads(encoder, count):
+    """Returns a copy of an encoder profile with its threads split between count encoders."""
+    shared = copy.copy(encoder)
+    shared.threads = max(1, (encoder.threads or 1) // count)
+    return shared
+
+def _concat(segment_files, output_file, *, audio_file, duration, list_dir):
+    """Joins the segment files by stream copy and muxes the audio in."""
+    list_path = os.path.join(list_dir, "segments.txt")
+    with open(list_path, "w", encoding="utf-8") as list_file:
+        for path in segment_files:
+            list_file.write(concat_entry(path))
+    command = [ffmpeg_binary(), "-y", "-loglevel", "error",
+               "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_file:
+        command += ["-i", audio_file, "-map", "0:v", "-map", "1:a"] + audio_args(audio_file)
+    command += ["-c:v", "copy", "-movflags", "+faststart", "-t", f"{duration:.6f}",
+                output_file]
+    try:
+        subprocess.run(command, check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        logging.error("FFmpeg failed while joining %s: %s", output_file,
+                      e.stderr.decode("utf-8", errors="replace"))
+        raise
+
+def render_segments(pool, words, duration, output_file, encoder, *, temp_dir, # pylint: disable=R0913,R0914:too-many-arguments,too-many-locals
+                    audio_file=None, style=None, segments=None, size=(1080, 1920), fps=24,
+                    background=None):
+    """
+    Renders a timeline as parallel segments and joins them into one video.
+
+    Args:
+        pool (concurrent.futures.Executor): The process pool the segments render in.
+            Spawned processes are safest, since the caller may be multithreaded.
+        words (list): The word timings, as dicts with "word", "start" and "end".
+        duration (float): The length of the video in seconds.
+        output_file (str): The path of the video file to write.
+        encoder (EncoderProfile): The encoder settings. Its threads are shared out
+            between the segments.
+        temp_dir (str): The directory for temporary storage, holding the word cache.
+        audio_file (str, optional): The audio to mux into the video. Defaults to None.
+        style (TextStyle, optional): The subtitle font settings. Defaults to TextStyle().
+        segments (int, optional): The number of segments. Defaults to the number of CPUs.
+        size (tuple, optional): The frame size. Defaults to 1080x1920.
+        fps (int, optional): The frame rate. Defaults to 24.
+        background (Background, optional): The looping video under the subtitles.
+            Defaults to None, a plain white background.
+
+    Returns:
+        int: The number of segments rendered.
+
+    Raises:
+        subprocess.CalledProcessError: If FFmpeg fails to join the segments.
+    """
+    ranges = split_segments(words, duration, segments or os.cpu_count() or 1, fps)
+    segment_dir = tempfile.mkdtemp(prefix="segments_", dir=temp_dir)
+    try:
+        futures = [pool.submit(render_segment, temp_dir, segment_words(words, first, end, fps),
+                               (style or TextStyle()).key_fields(), end - first,
+                               os.path.join(segment_dir, f"{index:03d}.mp4"),
+                               encoder=_share_threads(encoder, len(ranges)),
+                               size=size, fps=fps,
+                               background=background and background.shifted(first / fps))
+                   for index, (first, end) in enumerate(ranges)]
+        segment_files = [future.result() for future in futures]
+        _concat(segment_files, output_file, audio_file=audio_file, duration=duration,
+                list_dir=segment_dir)
+        logging.info("Rendered %s from %d segments", output_file, len(ranges))
+        return len(ranges)
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
@@ -0,0 +1,138 @@
+"""
+This module provides SubtitleTrackClip, a single MoviePy clip that draws word-by-word
+subtitles on top of a background. A CompositeVideoClip with one layer per word has to
+check every layer on every frame; this clip instead keeps the word timings in sorted
+arrays and finds the active word(s) for a frame with a binary search, so the cost of a
+frame does not grow with the length of the script.
+
+Modules Imported:
+- numpy: Array library used for the timing index and pixel blending.
+- ImageClip, VideoClip: MoviePy clip types.
+- TextStyle, WordRasterCache: The font settings and cache that supply word rasters.
+
+Classes:
+    SubtitleTrackClip: A clip rendering a background with the active subtitle word blitted on.
+
+Usage:
+    background = ColorClip(size=(1080, 1920), color=(255, 255, 255), duration=duration)
+    video = SubtitleTrackClip(background, words, WordRasterCache("temp/word_cache"))
+"""
+import numpy as np
+from moviepy.video.VideoClip import ImageClip, VideoClip
+
+from video_processing.text_cache import TextStyle
+
+class SubtitleTrackClip(VideoClip): # pylint: disable=R0902:too-many-instance-attributes
+    """
+    A clip that renders a background and the subtitle words active at each frame.
+
+    Attributes:
+        background (VideoClip): The clip drawn underneath the subtitles.
+        starts (numpy.ndarray): The sorted start times of the words.
+        ends (numpy.ndarray): The end times of the words, in the same order as starts.
+    """
+
+    def __init__(self, background, words, cache, style=None):
+        """
+        Initializes the clip and builds the timing index.
+
+        Args:
+            background (VideoClip): The clip drawn underneath the subtitles. Its size and
+                duration are used for the track.
+            words (list): The word timings, as dicts with "word", "start" and "end" keys.
+            cache (WordRasterCache): The cache supplying the word rasters.
+            style (TextStyle, optional): The font settings. Defaults to TextStyle().
+        """
+        style = style or TextStyle()
+        ordered = sorted(words, key=lambda item: item["start"])
+
+        self.background = background
+        self.starts = np.array([item["start"] for item in ordered], dtype=np.float64)
+        self.ends = np.array([item["end"] for item in ordered], dtype=np.float64)
+        # The running maximum of the end times bounds how far back an active word can be
+        self._max_ends = np.maximum.accumulate(self.ends) if len(ordered) else self.ends
+        self._rasters = [cache.get(item["word"], style) for item in ordered]
+        self._static_background = isinstance(background, ImageClip)
+        self._last_active = None
+        self._last_frame = None
+
+        super().__init__(make_frame=self._make_frame, duration=background.duration)
+        self.size = background.size
+
+    def active_indices(self, t):
+        """
+        Finds the words that are on screen at a given time.
+
+        Args:
+            t (float): The time in seconds.
+
+        Returns:
+            tuple: The indices of the active words, in start order.
+        """
+        index = int(np.searchsorted(self.starts, t, side="right")) - 1
+        active = []
+        while index >= 0 and self._max_ends[index] > t:
+            if self.ends[index] > t:
+                active.append(index)
+            index -= 1
+        return tuple(reversed(active))
+
+    def caption_states(self):
+        """
+        Splits the track into the intervals during which the same words are on screen.
+
+        Returns:
+            list: (start, end, active) tuples covering the whole track, where active is
+                the tuple of word indices shown during [start, end). Adjacent intervals
+                always differ in their active words.
+        """
+        duration = self.duration
+        boundaries = np.unique(np.clip(np.concatenate(([0.0, duration], self.starts, self.ends)),
+                                       0.0, duration))
+        states = []
+        for start, end in zip(boundaries[:-1], boundaries[1:]):
+            active = self.active_indices(start)
+            if states and states[-1][2] == active:
+                states[-1] = (states[-1][0], float(end), active)
+            else:
+                states.append((float(start), float(end), active))
+        return states
+
+    @property
+    def is_static(self):
+        """bool: Whether frames only change when the active words change."""
+        return self._static_background
+
+    def _make_frame(self, t):
+        active = self.active_indices(t)
+        if self._static_background and active == self._last_active:
+            return self._last_frame
+
+        frame = self.background.get_frame(t)
+        if active:
+            frame = frame.copy()
+            for index in active:
+                self._blit(frame, self._rasters[index])
+
+        if self._static_background:
+            self._last_active = active
+            self._last_frame = frame
+        return frame
+
+    @staticmethod
+    def _blit(frame, raster):
+        """Alpha-blends a word raster onto the centre of a frame in place."""
+        frame_height, frame_width = frame.shape[:2]
+        height, width = raster.mask.shape
+        top, left = (frame_height - height) // 2, (frame_width - width) // 2
+
+        # Crop the raster when it is larger than the frame
+        src_top, src_left = max(0, -top), max(0, -left)
+        top, left = max(0, top), max(0, left)
+        height = min(height - src_top, frame_height - top)
+        width = min(width - src_left, frame_width - left)
+
+        region = frame[top:top + height, left:left + width]
+        rgb = raster.rgb[src_top:src_top + height, src_left:src_left + width]
+        mask = raster.mask[src_top:src_top + height, src_left:src_left + width, np.newaxis]
+        region[...] = (rgb * mask + region * (1.0 - mask)).astype(np.uint8)
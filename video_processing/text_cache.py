@@ -0,0 +1,292 @@
+"""
+This module provides a two-tier cache for rasterized subtitle words. Rendering a word
+with MoviePy's TextClip spawns an ImageMagick process, which is by far the most expensive
+part of building subtitles, yet the same handful of words ("the", "you", "is") appear in
+every script. Each word is therefore rasterized once per style, kept in an in-memory LRU
+and persisted to disk so later videos and later runs can reuse it.
+
+MoviePy and ImageMagick are only set up when a word first has to be rasterized. The
+ImageMagick binary is taken from the IMAGEMAGICK_BINARY environment variable, falling
+back to MoviePy's auto-detection.
+
+Modules Imported:
+- functools: Standard library used to set MoviePy up once.
+- hashlib: Standard library for deriving stable cache keys.
+- logging: Standard library for logging error and informational messages.
+- os: Standard library for interacting with the operating system.
+- threading: Standard library for guarding the cache from concurrent access.
+- OrderedDict: Ordered mapping used as the in-memory LRU.
+- ThreadPoolExecutor: Pool used to rasterize uncached words ahead of time.
+- numpy: Array library used to store and load the rasters.
+- evict_least_recently_used, remove_file: Cache file handling shared with the other caches.
+- TextClip: MoviePy clip used to rasterize text through ImageMagick. Loaded on first use.
+
+Classes:
+    TextStyle: The font settings a word is rasterized with.
+    WordRaster: A rasterized word (RGB pixels plus an alpha mask).
+    WordRasterCache: The in-memory and on-disk cache of rasterized words.
+
+Usage:
+    cache = WordRasterCache("temp/word_cache")
+    cache.prefetch(["hello", "world"], TextStyle())
+    raster = cache.get("hello", TextStyle())
+"""
+import functools
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from common.storage import evict_least_recently_used, remove_file
+
+# Where the ImageMagick binary was expected before IMAGEMAGICK_BINARY was read
+LEGACY_WINDOWS_IMAGEMAGICK = r"E:\\ImageMagick-7.1.1-Q16-HDRI\\magick.exe"
+
+@functools.lru_cache(maxsize=None)
+def _text_clip_class():
+    """Configures ImageMagick for MoviePy and returns its TextClip class."""
+    # pylint: disable=C0415:import-outside-toplevel
+    from moviepy.config import change_settings
+    from moviepy.video.VideoClip import TextClip
+
+    binary = os.getenv("IMAGEMAGICK_BINARY")
+    if binary is None and os.name == "nt" and os.path.exists(LEGACY_WINDOWS_IMAGEMAGICK):
+        binary = LEGACY_WINDOWS_IMAGEMAGICK
+    if binary:
+        change_settings({"IMAGEMAGICK_BINARY": binary})
+    return TextClip
+
+class TextStyle: # pylint: disable=R0903:too-few-public-methods
+    """
+    The font settings used to rasterize a subtitle word.
+
+    Attributes:
+        font (str): The ImageMagick font name.
+        fontsize (int): The font size in pixels.
+        color (str): The fill colour.
+        stroke_color (str): The outline colour, or None for no outline.
+        stroke_width (float): The outline width in pixels.
+    """
+
+    def __init__(self, font="Arial-Bold", fontsize=100, color="black", # pylint: disable=R0913:too-many-arguments
+                 stroke_color=None, stroke_width=1):
+        self.font = font
+        self.fontsize = fontsize
+        self.color = color
+        self.stroke_color = stroke_color
+        self.stroke_width = stroke_width
+
+    def key_fields(self):
+        """
+        Returns the fields that change how a word is rasterized.
+
+        Returns:
+            tuple: The (font, fontsize, color, stroke_color, stroke_width) tuple.
+        """
+        return (self.font, self.fontsize, self.color, self.stroke_color, self.stroke_width)
+
+    def scaled(self, factor):
+        """
+        Returns the style scaled for a smaller or larger frame.
+
+        Args:
+            factor (float): The scale, e.g. 0.25 for a quarter-width preview.
+
+        Returns:
+            TextStyle: The style with its font size and outline width scaled.
+        """
+        return TextStyle(self.font, max(1, round(self.fontsize * factor)), self.color,
+                         self.stroke_color, self.stroke_width * factor)
+
+class WordRaster: # pylint: disable=R0903:too-few-public-methods
+    """
+    A rasterized word.
+
+    Attributes:
+        rgb (numpy.ndarray): The HxWx3 uint8 pixels of the word.
+        mask (numpy.ndarray): The HxW float alpha mask of the word, in the range [0, 1].
+    """
+
+    def __init__(self, rgb, mask):
+        self.rgb = rgb
+        self.mask = mask
+
+    @property
+    def nbytes(self):
+        """int: The memory used by the raster."""
+        return self.rgb.nbytes + self.mask.nbytes
+
+class WordRasterCache: # pylint: disable=R0902:too-many-instance-attributes
+    """
+    A cache of rasterized words with an in-memory LRU tier and an on-disk tier.
+
+    Attributes:
+        cache_dir (str): The directory holding the on-disk tier.
+        max_memory_items (int): The number of rasters kept in memory.
+        max_disk_bytes (int): The size the on-disk tier is trimmed to.
+    """
+
+    def __init__(self, cache_dir, max_memory_items=1024,
+                 max_disk_bytes=512 * 1024 * 1024, workers=None):
+        """
+        Initializes the cache and creates the on-disk directory if necessary.
+
+        Args:
+            cache_dir (str): The directory holding the on-disk tier.
+            max_memory_items (int, optional): The number of rasters kept in memory.
+                Defaults to 1024.
+            max_disk_bytes (int, optional): The size the on-disk tier is trimmed to.
+                Defaults to 512 MiB.
+            workers (int, optional): The number of concurrent rasterizations used by
+                prefetch. Defaults to the number of CPUs.
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._workers = workers or os.cpu_count() or 1
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._disk_bytes = sum(entry.stat().st_size for entry in os.scandir(self.cache_dir)
+                               if entry.name.endswith(".npz"))
+
+    @staticmethod
+    def make_key(text, style):
+        """
+        Derives the cache key of a word rendered with a style.
+
+        Args:
+            text (str): The word.
+            style (TextStyle): The font settings.
+
+        Returns:
+            str: A hex digest identifying the raster.
+        """
+        fields = (text,) + style.key_fields()
+        return hashlib.sha1(repr(fields).encode("utf-8")).hexdigest()
+
+    def get(self, text, style):
+        """
+        Returns the raster of a word, rasterizing it if it is not cached.
+
+        Args:
+            text (str): The word.
+            style (TextStyle): The font settings.
+
+        Returns:
+            WordRaster: The rasterized word.
+        """
+        key = self.make_key(text, style)
+        raster = self._get_from_memory(key)
+        if raster is not None:
+            return raster
+
+        raster = self._load_from_disk(key)
+        if raster is None:
+            raster = self._rasterize(text, style)
+            self._store_to_disk(key, raster)
+        self._put_in_memory(key, raster)
+        return raster
+
+    def prefetch(self, words, style):
+        """
+        Rasterizes every uncached word in a pool so later lookups are memory hits.
+
+        Args:
+            words (iterable): The words to make available.
+            style (TextStyle): The font settings.
+        """
+        missing = []
+        with self._lock:
+            for text in dict.fromkeys(words):
+                if self.make_key(text, style) not in self._memory:
+                    missing.append(text)
+        if not missing:
+            return
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._workers)
+        # TextClip does its work in an ImageMagick subprocess, so threads are enough here
+        list(self._executor.map(lambda text: self.get(text, style), missing))
+
+    def close(self):
+        """Shuts down the prefetch pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _get_from_memory(self, key):
+        with self._lock:
+            raster = self._memory.get(key)
+            if raster is not None:
+                self._memory.move_to_end(key)
+            return raster
+
+    def _put_in_memory(self, key, raster):
+        with self._lock:
+            self._memory[key] = raster
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _load_from_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            with np.load(path) as data:
+                raster = WordRaster(data["rgb"], data["mask"])
+            # Refresh the modification time so eviction treats it as recently used
+            os.utime(path)
+            return raster
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning("Discarding unreadable word raster %s: %s", path, e)
+            remove_file(path)
+            return None
+
+    def _store_to_disk(self, key, raster):
+        path = self._disk_path(key)
+        # Render workers and segment processes share the cache, and thread ids repeat
+        # across processes, so the temporary name carries both
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                np.savez(file, rgb=raster.rgb, mask=raster.mask)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning("Failed to persist word raster %s: %s", path, e)
+            remove_file(temp_path)
+            return
+
+        with self._lock:
+            self._disk_bytes += os.path.getsize(path)
+            over_budget = self._disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Removes the least recently used rasters until the on-disk tier fits its budget."""
+        total = evict_least_recently_used(
+            (entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".npz")),
+            self.max_disk_bytes * 0.9)
+        with self._lock:
+            self._disk_bytes = total
+
+    @staticmethod
+    def _rasterize(text, style):
+        clip = _text_clip_class()(text, fontsize=style.fontsize, color=style.color, font=style.font,
+                        stroke_color=style.stroke_color, stroke_width=style.stroke_width)
+        try:
+            rgb = clip.get_frame(0).astype(np.uint8)
+            mask = clip.mask.get_frame(0).astype(np.float32)
+        finally:
+            clip.close()
+        return WordRaster(rgb, mask)